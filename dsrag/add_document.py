@@ -11,6 +11,7 @@ from dsrag.database.vector import VectorDB
 from dsrag.custom_term_mapping import annotate_chunks
 import logging
 import time
+from typing import Optional
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 def process_section_summary(section, auto_context_model, document_title, auto_context_config, language, base_extra, i):
@@ -145,12 +146,54 @@ def auto_context(kb_id: str, auto_context_model: LLM, sections, chunks, text, do
 
     return chunks, chunks_to_embed
 
+def estimate_num_tokens(text: str) -> int:
+    # English text averages about 4 characters per token; 3 keeps the estimate on the safe side for denser text
+    return len(text) // 3 + 1
+
+def get_embedding_batches(texts: list[str], max_batch_size: int, max_batch_tokens: Optional[int] = None) -> list[tuple[int, int]]:
+    """
+    Split the texts into (start, end) ranges of consecutive texts, each with at most max_batch_size texts and
+    (if set) max_batch_tokens estimated tokens. A text that's over max_batch_tokens on its own gets its own batch.
+    """
+    batches = []
+    start = 0
+    num_tokens = 0
+    for i, text in enumerate(texts):
+        text_tokens = estimate_num_tokens(text)
+        if i > start and (
+            i - start >= max_batch_size
+            or (max_batch_tokens is not None and num_tokens + text_tokens > max_batch_tokens)
+        ):
+            batches.append((start, i))
+            start = i
+            num_tokens = 0
+        num_tokens += text_tokens
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
 def get_embeddings(embedding_model: Embedding, chunks_to_embed):
-    # embed the chunks - if the document is long, we need to get the embeddings in chunks
-    chunk_embeddings = []
-    for i in range(0, len(chunks_to_embed), 50):
-        chunk_embeddings += embedding_model.get_embeddings(chunks_to_embed[i:i+50], input_type="document")
+    # embed the chunks - if the document is long, we need to get the embeddings in batches, which are sized by
+    # the embedding model's limits and sent up to max_concurrent_batches at a time
+    batches = get_embedding_batches(
+        chunks_to_embed, embedding_model.max_batch_size, embedding_model.max_batch_tokens
+    )
 
+    def embed_batch(batch):
+        start, end = batch
+        return embedding_model.get_embeddings(chunks_to_embed[start:end], input_type="document")
+
+    max_workers = min(embedding_model.max_concurrent_batches, len(batches))
+    if max_workers <= 1:
+        batch_embeddings = [embed_batch(batch) for batch in batches]
+    else:
+        # map returns the results in the order of the batches
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            batch_embeddings = list(executor.map(embed_batch, batches))
+
+    chunk_embeddings = []
+    for embeddings in batch_embeddings:
+        chunk_embeddings += embeddings
     return chunk_embeddings
 
 def add_chunks_to_db(chunk_db: ChunkDB, chunks, chunks_to_embed, chunk_embeddings, metadata, doc_id, supp_id):
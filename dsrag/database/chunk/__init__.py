@@ -1,13 +1,16 @@
 from .db import ChunkDB
-from .types import FormattedDocument
+from .types import ChunkDBStats, FormattedDocument
 
 # Always import the basic DB as it has no dependencies
 from .basic_db import BasicChunkDB
+from .cached_db import CachedChunkDB
 
 # Define what's in __all__ for "from dsrag.database.chunk import *"
 __all__ = [
     "ChunkDB", 
     "BasicChunkDB", 
+    "CachedChunkDB",
+    "ChunkDBStats",
     "FormattedDocument"
 ]
 
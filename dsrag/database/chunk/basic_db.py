@@ -1,41 +1,302 @@
+import hashlib
 import os
 import pickle
-from typing import Any, Optional, cast
+import shutil
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Iterator, Optional, cast
 
-from dsrag.database.chunk.db import ChunkDB
-from dsrag.database.chunk.types import FormattedDocument
+from dsrag.database.chunk.db import ChunkDB, DOCUMENT_FIELDS, get_document_fields, validate_chunk_fields
+from dsrag.database.chunk.types import ChunkDBStats, FormattedDocument
+from dsrag.database.compression import TextCodec, validate_compression
+
+
+def _atomic_pickle(path: str, obj: Any) -> None:
+    # Write to a temporary file and swap it in so readers never see a partially written file
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(obj, f)
+    os.replace(path + ".tmp", path)
+
+
+def _split_document(
+    chunks: dict[int, dict[str, Any]], metadata: Optional[dict] = None, codec: Optional[TextCodec] = None
+) -> dict[str, Any]:
+    # Keep the document-level fields once per document instead of on every chunk
+    document = {**get_document_fields(chunks), "metadata": metadata or {}}
+    stored_chunks = {}
+    for chunk_index, chunk in chunks.items():
+        chunk = {field: value for field, value in chunk.items() if field not in DOCUMENT_FIELDS}
+        if codec is not None and isinstance(chunk.get("chunk_text"), str):
+            # Stays compressed on disk and in the cache; the getters decompress it
+            chunk["chunk_text"] = codec.compress(chunk["chunk_text"])
+        stored_chunks[chunk_index] = chunk
+    return {"document": document, "chunks": stored_chunks}
+
+
+class ShardedDocumentStore(MutableMapping):
+    """
+    Mapping of doc_id to the chunks of that document, persisted with one pickle file per document.
+
+    The document-level fields (document_title, document_summary and the metadata) are stored once per
+    document rather than on every chunk; they're available from get_document_fields().
+
+    A small index lists the documents with their supp_id and sizes, so membership checks, document
+    counts and totals don't need to read any chunks. The totals are summed from the index once when it's
+    loaded, and then kept up to date as documents are added and removed. Documents are only read from disk when they're first
+    accessed, and at most max_cached_documents of them are kept in memory (least recently used ones are
+    evicted first).
+
+    Adding or removing documents writes their files and appends one record to an index log, so the cost of
+    a write doesn't grow with the size of the KB. The index is a snapshot plus that log; once the log has
+    more records than the snapshot has documents (or save_index() is called), it's folded into a new
+    snapshot.
+    """
+
+    def __init__(
+        self, directory: str, max_cached_documents: int = 128, codec: Optional[TextCodec] = None
+    ) -> None:
+        self.directory = directory
+        self.max_cached_documents = max_cached_documents
+        # Compresses the chunk text of new documents, if set
+        self.codec = codec
+        self.index_path = os.path.join(directory, "index.pkl")
+        self.index_log_path = os.path.join(directory, "index.log")
+        self.dictionary_path = os.path.join(directory, "compression.dict")
+        os.makedirs(os.path.join(directory, "documents"), exist_ok=True)
+        self._lock = threading.RLock()
+        self._cache: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self._log_truncated = False
+        self.index = self._load_index()
+        if self._log_truncated:
+            # Start a new log, so later records aren't appended after the broken one
+            self.save_index()
+        self.stats = ChunkDBStats(num_documents=0, num_chunks=0, num_characters=0, supp_id_counts={})
+        for entry in self.index.values():
+            self._update_stats(entry, 1)
+
+    def _load_index(self) -> dict[str, dict[str, Any]]:
+        try:
+            with open(self.index_path, "rb") as f:
+                index: dict[str, dict[str, Any]] = pickle.load(f)
+        except FileNotFoundError:
+            index = {}
+        # Replay the changes made since the snapshot. Each record is a list of (doc_id, entry) pairs, with
+        # an entry of None for a removed document.
+        self._num_log_records = 0
+        try:
+            with open(self.index_log_path, "rb") as f:
+                while True:
+                    try:
+                        record = pickle.load(f)
+                    except EOFError:
+                        break
+                    except (pickle.UnpicklingError, ValueError):
+                        # A record cut short by a crash; the writes it describes never completed
+                        self._log_truncated = True
+                        break
+                    for doc_id, entry in record:
+                        if entry is None:
+                            index.pop(doc_id, None)
+                        else:
+                            index[doc_id] = entry
+                    self._num_log_records += 1
+        except FileNotFoundError:
+            pass
+        return index
+
+    def _log_index_changes(self, changes: list[tuple[str, Optional[dict[str, Any]]]]) -> None:
+        # Appends one record, so a write costs the same however many documents there are
+        with open(self.index_log_path, "ab") as f:
+            f.write(pickle.dumps(changes))
+        self._num_log_records += 1
+        if self._num_log_records > max(len(self.index), 100):
+            self.save_index()
+
+    def _update_stats(self, entry: dict[str, Any], sign: int) -> None:
+        # Add (sign=1) or subtract (sign=-1) a document's index entry to or from the totals
+        self.stats["num_documents"] += sign
+        self.stats["num_chunks"] += sign * entry["num_chunks"]
+        self.stats["num_characters"] += sign * entry["num_characters"]
+        supp_id = entry.get("supp_id")
+        if supp_id:
+            supp_id_counts = self.stats["supp_id_counts"]
+            supp_id_counts[supp_id] = supp_id_counts.get(supp_id, 0) + sign
+            if supp_id_counts[supp_id] <= 0:
+                del supp_id_counts[supp_id]
+
+    def _document_path(self, doc_id: str) -> str:
+        # doc_ids can contain any character, so the file name is a hash of the doc_id
+        file_name = hashlib.sha1(doc_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, "documents", f"{file_name}.pkl")
+
+    def _cache_document(self, doc_id: str, document: dict[str, Any]) -> None:
+        self._cache[doc_id] = document
+        self._cache.move_to_end(doc_id)
+        while len(self._cache) > self.max_cached_documents:
+            self._cache.popitem(last=False)
+
+    def __contains__(self, doc_id: object) -> bool:
+        return doc_id in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self.index))
+
+    def _load_document(self, doc_id: str) -> dict[str, Any]:
+        with self._lock:
+            if doc_id in self._cache:
+                self._cache.move_to_end(doc_id)
+                return self._cache[doc_id]
+            if doc_id not in self.index:
+                raise KeyError(doc_id)
+            with open(self._document_path(doc_id), "rb") as f:
+                document = pickle.load(f)
+            if "chunks" not in document:
+                # Files written by older versions only have the chunks, with the document-level fields on each
+                document = _split_document(document)
+            self._cache_document(doc_id, document)
+            return document
+
+    def __getitem__(self, doc_id: str) -> dict[int, dict[str, Any]]:
+        return self._load_document(doc_id)["chunks"]
+
+    def get_document_fields(self, doc_id: str) -> dict[str, Any]:
+        """The document-level fields of a document: document_title, document_summary and metadata."""
+        return self._load_document(doc_id)["document"]
+
+    def __setitem__(self, doc_id: str, chunks: dict[int, dict[str, Any]]) -> None:
+        self.put_many([{"doc_id": doc_id, "chunks": chunks}])
+
+    def __delitem__(self, doc_id: str) -> None:
+        with self._lock:
+            if doc_id not in self.index:
+                raise KeyError(doc_id)
+            self._update_stats(self.index.pop(doc_id), -1)
+            self._cache.pop(doc_id, None)
+            self._log_index_changes([(doc_id, None)])
+            try:
+                os.remove(self._document_path(doc_id))
+            except FileNotFoundError:
+                pass
+
+    def put_many(self, documents: list[dict[str, Any]]) -> None:
+        """
+        Store several documents (dictionaries with doc_id, chunks and optionally supp_id and metadata),
+        appending to the index once.
+        """
+        with self._lock:
+            # The directory is removed by delete()
+            os.makedirs(os.path.join(self.directory, "documents"), exist_ok=True)
+            if self.codec is not None:
+                self.codec.add_training_samples(
+                    chunk.get("chunk_text", "") for document in documents for chunk in document["chunks"].values()
+                )
+                # Written once the dictionary is trained, and again if delete() has removed it since
+                if self.codec.has_dictionary and not os.path.exists(self.dictionary_path):
+                    with open(self.dictionary_path + ".tmp", "wb") as f:
+                        f.write(self.codec.dictionary)
+                    os.replace(self.dictionary_path + ".tmp", self.dictionary_path)
+            for document in documents:
+                doc_id, chunks = document["doc_id"], document["chunks"]
+                stored_document = _split_document(chunks, document.get("metadata"), self.codec)
+                _atomic_pickle(self._document_path(doc_id), stored_document)
+                first_chunk = next(iter(chunks.values()), {})
+                if doc_id in self.index:
+                    # The document is being replaced
+                    self._update_stats(self.index[doc_id], -1)
+                self.index[doc_id] = {
+                    "supp_id": document.get("supp_id") or first_chunk.get("supp_id", ""),
+                    "num_chunks": len(chunks),
+                    "num_characters": sum(len(chunk.get("chunk_text", "")) for chunk in chunks.values()),
+                }
+                self._update_stats(self.index[doc_id], 1)
+                self._cache_document(doc_id, stored_document)
+            self._log_index_changes([(document["doc_id"], self.index[document["doc_id"]]) for document in documents])
+
+    def save_index(self) -> None:
+        """Write the whole index to a new snapshot and clear the index log."""
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            _atomic_pickle(self.index_path, self.index)
+            # Replaying the log over the new snapshot would give the same index, so a crash before the log is
+            # removed is harmless
+            try:
+                os.remove(self.index_log_path)
+            except FileNotFoundError:
+                pass
+            self._num_log_records = 0
+
+    def delete(self) -> None:
+        with self._lock:
+            self.index = {}
+            self.stats = ChunkDBStats(num_documents=0, num_chunks=0, num_characters=0, supp_id_counts={})
+            self._cache.clear()
+            self._num_log_records = 0
+            if os.path.exists(self.directory):
+                shutil.rmtree(self.directory)
 
 
 class BasicChunkDB(ChunkDB):
     """
-    This is a basic implementation of a ChunkDB that stores chunks in a nested dictionary and persists them to disk by pickling the dictionary.
+    This is a basic implementation of a ChunkDB that stores chunks in a nested dictionary and persists them to disk with pickle.
+
+    Each document is pickled to its own file and loaded the first time it's accessed, so opening a large KB
+    doesn't read every chunk, and adding or removing a document doesn't rewrite the others. Up to
+    max_cached_documents documents are kept in memory.
+
+    With compression="zstd", the chunk text is stored zstd-compressed (see TextCodec) and only decompressed
+    by the getters. With compression_dictionary, a dictionary is trained on the first chunks added and saved
+    next to the documents.
     """
 
-    def __init__(self, kb_id: str, storage_directory: str = "~/dsRAG") -> None:
+    def __init__(
+        self,
+        kb_id: str,
+        storage_directory: str = "~/dsRAG",
+        max_cached_documents: int = 128,
+        compression: Optional[str] = None,
+        compression_dictionary: bool = False,
+    ) -> None:
+        validate_compression(compression)
         self.kb_id = kb_id
         self.storage_directory = os.path.expanduser(
             storage_directory
         )  # Expand the user path
+        self.max_cached_documents = max_cached_documents
+        self.compression = compression
+        self.compression_dictionary = compression_dictionary
+        # Used to read compressed chunk text even if compression has since been turned off
+        self.codec = TextCodec(train_dictionary=compression_dictionary)
         # Ensure the base directory and the chunk storage directory exist
         os.makedirs(
             os.path.join(self.storage_directory, "chunk_storage"), exist_ok=True
         )
         self.storage_path = os.path.join(
+            self.storage_directory, "chunk_storage", kb_id
+        )
+        # Older versions pickled the whole KB to a single file
+        self.legacy_storage_path = os.path.join(
             self.storage_directory, "chunk_storage", f"{kb_id}.pkl"
         )
         self.load()
 
     def add_document(self, doc_id: str, chunks: dict[int, dict[str, Any]], supp_id: str = "", metadata: dict = {}) -> None:
-        self.data[doc_id] = chunks
-        self.save()
+        self.data.put_many([{"doc_id": doc_id, "chunks": chunks, "supp_id": supp_id, "metadata": metadata}])
+
+    def add_documents(self, documents: list[dict[str, Any]]) -> None:
+        # Write the index once for the whole batch instead of once per document
+        self.data.put_many(documents)
 
     def remove_document(self, doc_id: str):
-        self.data.pop(doc_id, None)
-        self.save()
+        if doc_id in self.data:
+            del self.data[doc_id]
 
     def get_chunk_text(self, doc_id: str, chunk_index: int) -> Optional[str]:
         if doc_id in self.data and chunk_index in self.data[doc_id]:
-            return self.data[doc_id][chunk_index]["chunk_text"]
+            return self.codec.decompress(self.data[doc_id][chunk_index]["chunk_text"])
         return None
     
     def get_is_visual(self, doc_id: str, chunk_index: int) -> Optional[bool]:
@@ -51,26 +312,48 @@ class BasicChunkDB(ChunkDB):
             )
         return None, None
 
+    def get_chunks(
+        self, doc_id: str, chunk_start: int, chunk_end: int, fields: Optional[list[str]] = None
+    ) -> dict[int, dict[str, Any]]:
+        fields = validate_chunk_fields(fields)
+        if doc_id not in self.data:
+            return {}
+        document = self.data[doc_id]
+        document_fields = self.data.get_document_fields(doc_id)
+        chunks = {}
+        for chunk_index in range(chunk_start, chunk_end):
+            if chunk_index in document:
+                chunk = {**document[chunk_index], **document_fields}
+                chunks[chunk_index] = {
+                    # is_visual defaults to False for backwards compatibility
+                    field: chunk.get(field, False if field == "is_visual" else None)
+                    for field in fields
+                }
+                if "chunk_text" in chunks[chunk_index]:
+                    chunks[chunk_index]["chunk_text"] = self.codec.decompress(chunks[chunk_index]["chunk_text"])
+        return chunks
+
     def get_document(
         self, doc_id: str, include_content: bool = False
     ) -> Optional[FormattedDocument]:
         if doc_id in self.data:
             document = self.data[doc_id]
-            title = cast(str, document[0].get("document_title", ""))
+            document_fields = self.data.get_document_fields(doc_id)
 
             full_document_string = ""
             if include_content:
                 # Concatenate the chunks into a single string
                 for _, chunk in document.items():
                     # Join each chunk text with a new line character
-                    full_document_string += chunk["chunk_text"] + "\n"
+                    full_document_string += self.codec.decompress(chunk["chunk_text"]) + "\n"
 
             return FormattedDocument(
                 id=doc_id,
-                title=title,
+                title=cast(str, document_fields["document_title"] or ""),
                 content=full_document_string if include_content else None,
-                summary=cast(str, document[0].get("document_summary", "")),
+                summary=cast(str, document_fields["document_summary"] or ""),
                 created_on=None,
+                metadata=document_fields["metadata"],
                 chunk_count=len(document.items())
             )
 
@@ -79,18 +362,12 @@ class BasicChunkDB(ChunkDB):
 
     def get_document_title(self, doc_id: str, chunk_index: int) -> Optional[str]:
         if doc_id in self.data and chunk_index in self.data[doc_id]:
-            if "document_title" in self.data[doc_id][chunk_index]:
-                return self.data[doc_id][chunk_index]["document_title"]
-            else:
-                return None
+            return self.data.get_document_fields(doc_id)["document_title"]
         return None
 
     def get_document_summary(self, doc_id: str, chunk_index: int) -> Optional[str]:
         if doc_id in self.data and chunk_index in self.data[doc_id]:
-            if "document_summary" in self.data[doc_id][chunk_index]:
-                return self.data[doc_id][chunk_index]["document_summary"]
-            else:
-                return None
+            return self.data.get_document_fields(doc_id)["document_summary"]
         return None
 
     def get_section_title(self, doc_id: str, chunk_index: int) -> Optional[str]:
@@ -110,44 +387,66 @@ class BasicChunkDB(ChunkDB):
         return None
 
     def get_all_doc_ids(self, supp_id: Optional[str] = None) -> list[str]:
-        doc_ids = list(self.data.keys())
+        # The index has the supp_id of each document, so no documents need to be loaded
+        doc_ids = list(self.data.index.keys())
         if supp_id:
             doc_ids = [
                 doc_id
                 for doc_id in doc_ids
-                if self.data[doc_id][0].get("supp_id", "") == supp_id
+                if self.data.index[doc_id].get("supp_id", "") == supp_id
             ]
         return doc_ids
     
+    def has_document(self, doc_id: str) -> bool:
+        return doc_id in self.data
+
+    def get_existing_doc_ids(self, doc_ids: list[str]) -> set[str]:
+        return {doc_id for doc_id in doc_ids if doc_id in self.data}
+
     def get_document_count(self) -> int:
         # Retrieve the number of documents from the length of the data dictionary
-        return len(self.data.keys())
+        return len(self.data)
     
     def get_total_num_characters(self) -> int:
-        total_num_characters = 0
-        for _, doc in self.data.items():
-            for chunk in doc.values():
-                total_num_characters += len(chunk["chunk_text"])
-        return total_num_characters
+        return self.data.stats["num_characters"]
+
+    def get_stats(self) -> ChunkDBStats:
+        stats = self.data.stats
+        return ChunkDBStats(**{**stats, "supp_id_counts": dict(stats["supp_id_counts"])})
 
     def load(self):
-        try:
-            with open(self.storage_path, "rb") as f:
-                self.data = pickle.load(f)
-        except FileNotFoundError:
-            self.data = {}
+        self.data = ShardedDocumentStore(
+            self.storage_path, self.max_cached_documents, self.codec if self.compression else None
+        )
+        if os.path.exists(self.data.dictionary_path):
+            with open(self.data.dictionary_path, "rb") as f:
+                self.codec.load_dictionary(f.read())
+        if os.path.exists(self.legacy_storage_path):
+            # Split a KB saved by an older version into one file per document, then remove the old file
+            with open(self.legacy_storage_path, "rb") as f:
+                legacy_data = pickle.load(f)
+            self.data.put_many([
+                {"doc_id": doc_id, "chunks": chunks}
+                for doc_id, chunks in legacy_data.items()
+                if doc_id not in self.data
+            ])
+            os.remove(self.legacy_storage_path)
 
     def save(self):
-        with open(self.storage_path, "wb") as f:
-            pickle.dump(self.data, f)
+        # Documents are saved as soon as they're added; this only folds the index log into the snapshot
+        self.data.save_index()
 
     def delete(self):
-        if os.path.exists(self.storage_path):
-            os.remove(self.storage_path)
+        self.data.delete()
+        if os.path.exists(self.legacy_storage_path):
+            os.remove(self.legacy_storage_path)
 
     def to_dict(self):
         return {
             **super().to_dict(),
             "kb_id": self.kb_id,
             "storage_directory": self.storage_directory,
+            "max_cached_documents": self.max_cached_documents,
+            "compression": self.compression,
+            "compression_dictionary": self.compression_dictionary,
         }
@@ -0,0 +1,268 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Union
+
+from dsrag.database.chunk.db import CHUNK_FIELDS, ChunkDB, validate_chunk_fields
+from dsrag.database.chunk.types import ChunkDBStats, FormattedDocument
+
+
+def _estimate_size(value: Any) -> int:
+    # Approximate memory use of a cached value: the strings dominate, so containers are summed recursively
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_estimate_size(k) + _estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class CachedChunkDB(ChunkDB):
+    """
+    Read-through cache in front of another ChunkDB, for chunk stores where every lookup is a network round
+    trip (e.g. DynamoDB or Postgres).
+
+    Chunks are cached with all their fields, so e.g. fetching a segment also caches the document titles used
+    for its header. Documents (without their content) are cached too. The least recently used entries are
+    evicted once the cache holds more than max_bytes, and entries expire after ttl seconds if ttl is set.
+    Adding or removing a document through this object drops its cached entries; writes made to the inner
+    ChunkDB directly (e.g. by another process) are only picked up once the entries expire.
+    """
+
+    def __init__(
+        self,
+        inner: Union[ChunkDB, dict],
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: Optional[float] = None,
+    ) -> None:
+        if max_bytes < 1:
+            raise ValueError("max_bytes must be at least 1")
+        if ttl is not None and ttl <= 0:
+            raise ValueError("ttl must be positive")
+        if isinstance(inner, dict):
+            # Loaded from to_dict()
+            inner = ChunkDB.from_dict(dict(inner))
+        self.inner = inner
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        # key -> (value, size, expires_at). Keys are ("chunk", doc_id, chunk_index) and ("document", doc_id);
+        # a cached chunk value of None means the chunk doesn't exist.
+        self._cache: OrderedDict[tuple, tuple[Any, int, Optional[float]]] = OrderedDict()
+        # Keys cached for each document, so they can be dropped when the document changes
+        self._doc_keys: dict[str, set[tuple]] = {}
+        self._num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get(self, key: tuple) -> tuple[bool, Any]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                value, _, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                self._pop(key)
+            self.misses += 1
+            return False, None
+
+    def _put(self, key: tuple, value: Any) -> None:
+        size = _estimate_size(key) + _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._pop(key)
+            self._cache[key] = (value, size, expires_at)
+            self._doc_keys.setdefault(key[1], set()).add(key)
+            self._num_bytes += size
+            while self._num_bytes > self.max_bytes:
+                self._pop(next(iter(self._cache)))
+                self.evictions += 1
+
+    def _pop(self, key: tuple) -> None:
+        entry = self._cache.pop(key, None)
+        if entry is None:
+            return
+        self._num_bytes -= entry[1]
+        doc_keys = self._doc_keys.get(key[1])
+        if doc_keys is not None:
+            doc_keys.discard(key)
+            if not doc_keys:
+                del self._doc_keys[key[1]]
+
+    def invalidate(self, doc_id: Optional[str] = None) -> None:
+        """Drop the cached entries of a document, or of all documents if doc_id is None."""
+        with self._lock:
+            if doc_id is None:
+                self._cache.clear()
+                self._doc_keys.clear()
+                self._num_bytes = 0
+                return
+            for key in list(self._doc_keys.get(doc_id, ())):
+                self._pop(key)
+
+    def get_cache_stats(self) -> dict[str, int]:
+        """Hit, miss and eviction counts, and the current number of entries and (estimated) bytes."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "num_entries": len(self._cache),
+                "num_bytes": self._num_bytes,
+            }
+
+    def _get_cached_chunks(self, doc_id: str, chunk_start: int, chunk_end: int) -> tuple[dict[int, Optional[dict]], list[int]]:
+        # The cached chunks of a range, and the indices that aren't cached
+        cached = {}
+        missing = []
+        for chunk_index in range(chunk_start, chunk_end):
+            found, chunk = self._get(("chunk", doc_id, chunk_index))
+            if found:
+                cached[chunk_index] = chunk
+            else:
+                missing.append(chunk_index)
+        return cached, missing
+
+    def _cache_chunks(
+        self, doc_id: str, chunk_start: int, chunk_end: int, chunks: dict[int, dict[str, Any]]
+    ) -> dict[int, Optional[dict]]:
+        # Cache a range fetched with all fields, including the chunks that don't exist
+        fetched = {}
+        for chunk_index in range(chunk_start, chunk_end):
+            chunk = chunks.get(chunk_index)
+            self._put(("chunk", doc_id, chunk_index), chunk)
+            fetched[chunk_index] = chunk
+        return fetched
+
+    @staticmethod
+    def _select(chunks: dict[int, Optional[dict]], fields: list[str]) -> dict[int, dict[str, Any]]:
+        return {
+            chunk_index: {field: chunk[field] for field in fields}
+            for chunk_index, chunk in sorted(chunks.items())
+            if chunk is not None
+        }
+
+    def get_chunks(
+        self, doc_id: str, chunk_start: int, chunk_end: int, fields: Optional[list[str]] = None
+    ) -> dict[int, dict[str, Any]]:
+        fields = validate_chunk_fields(fields)
+        cached, missing = self._get_cached_chunks(doc_id, chunk_start, chunk_end)
+        if missing:
+            # Fetch everything between the first and last missing chunk in one call, with all fields
+            start, end = missing[0], missing[-1] + 1
+            chunks = self.inner.get_chunks(doc_id, start, end, fields=CHUNK_FIELDS)
+            cached.update(self._cache_chunks(doc_id, start, end, chunks))
+        return self._select(cached, fields)
+
+    def get_segments(
+        self, segments: list[tuple[str, int, int]], fields: Optional[list[str]] = None
+    ) -> list[dict[int, dict[str, Any]]]:
+        fields = validate_chunk_fields(fields)
+        results = []
+        to_fetch = []
+        for doc_id, chunk_start, chunk_end in segments:
+            cached, missing = self._get_cached_chunks(doc_id, chunk_start, chunk_end)
+            results.append(cached)
+            if missing:
+                to_fetch.append((len(results) - 1, (doc_id, missing[0], missing[-1] + 1)))
+        if to_fetch:
+            # The segments that aren't fully cached are fetched together, so the inner ChunkDB can fetch them
+            # concurrently
+            fetched = self.inner.get_segments([segment for _, segment in to_fetch], fields=CHUNK_FIELDS)
+            for (i, (doc_id, start, end)), chunks in zip(to_fetch, fetched):
+                results[i].update(self._cache_chunks(doc_id, start, end, chunks))
+        return [self._select(cached, fields) for cached in results]
+
+    def _get_chunk_field(self, doc_id: str, chunk_index: int, field: str) -> Any:
+        chunk = self.get_chunks(doc_id, chunk_index, chunk_index + 1).get(chunk_index)
+        if chunk is None:
+            return None
+        return chunk[field]
+
+    def get_chunk_text(self, doc_id: str, chunk_index: int) -> Optional[str]:
+        return self._get_chunk_field(doc_id, chunk_index, "chunk_text")
+
+    def get_is_visual(self, doc_id: str, chunk_index: int) -> Optional[bool]:
+        return self._get_chunk_field(doc_id, chunk_index, "is_visual")
+
+    def get_chunk_page_numbers(self, doc_id: str, chunk_index: int) -> Optional[tuple[int, int]]:
+        chunk = self.get_chunks(doc_id, chunk_index, chunk_index + 1).get(chunk_index)
+        if chunk is None:
+            return None, None
+        return chunk["chunk_page_start"], chunk["chunk_page_end"]
+
+    def get_document_title(self, doc_id: str, chunk_index: int) -> Optional[str]:
+        return self._get_chunk_field(doc_id, chunk_index, "document_title")
+
+    def get_document_summary(self, doc_id: str, chunk_index: int) -> Optional[str]:
+        return self._get_chunk_field(doc_id, chunk_index, "document_summary")
+
+    def get_section_title(self, doc_id: str, chunk_index: int) -> Optional[str]:
+        return self._get_chunk_field(doc_id, chunk_index, "section_title")
+
+    def get_section_summary(self, doc_id: str, chunk_index: int) -> Optional[str]:
+        return self._get_chunk_field(doc_id, chunk_index, "section_summary")
+
+    def get_document(self, doc_id: str, include_content: bool = False) -> Optional[FormattedDocument]:
+        if include_content:
+            # Full documents can be large, so they aren't cached
+            return self.inner.get_document(doc_id, include_content=True)
+        found, document = self._get(("document", doc_id))
+        if not found:
+            document = self.inner.get_document(doc_id)
+            self._put(("document", doc_id), document)
+        if document is None:
+            return None
+        # A copy, so callers modifying the document (or its metadata) don't change the cached one
+        document = FormattedDocument(**document)
+        if document.get("metadata") is not None:
+            document["metadata"] = dict(document["metadata"])
+        return document
+
+    def add_document(self, doc_id: str, chunks: dict[int, dict[str, Any]], supp_id: str = "", metadata: dict = {}) -> None:
+        self.inner.add_document(doc_id, chunks, supp_id=supp_id, metadata=metadata)
+        self.invalidate(doc_id)
+
+    def add_documents(self, documents: list[dict[str, Any]]) -> None:
+        self.inner.add_documents(documents)
+        for document in documents:
+            self.invalidate(document["doc_id"])
+
+    def remove_document(self, doc_id: str) -> None:
+        self.inner.remove_document(doc_id)
+        self.invalidate(doc_id)
+
+    def has_document(self, doc_id: str) -> bool:
+        return self.inner.has_document(doc_id)
+
+    def get_existing_doc_ids(self, doc_ids: list[str]) -> set[str]:
+        return self.inner.get_existing_doc_ids(doc_ids)
+
+    def get_all_doc_ids(self, supp_id: Optional[str] = None) -> list[str]:
+        return self.inner.get_all_doc_ids(supp_id)
+
+    def get_stats(self) -> ChunkDBStats:
+        return self.inner.get_stats()
+
+    def get_document_count(self) -> int:
+        return self.inner.get_stats()["num_documents"]
+
+    def get_total_num_characters(self) -> int:
+        return self.inner.get_stats()["num_characters"]
+
+    def delete(self) -> None:
+        self.inner.delete()
+        self.invalidate()
+
+    def to_dict(self):
+        return {
+            **super().to_dict(),
+            "inner": self.inner.to_dict(),
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+        }
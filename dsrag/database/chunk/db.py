@@ -1,7 +1,42 @@
 from abc import ABC, abstractmethod
 from typing import Any, Optional
 
-from dsrag.database.chunk.types import FormattedDocument
+from dsrag.database.chunk.types import ChunkDBStats, FormattedDocument
+
+
+# Per-chunk fields that can be requested from ChunkDB.get_chunks
+CHUNK_FIELDS = [
+    "chunk_text",
+    "is_visual",
+    "chunk_page_start",
+    "chunk_page_end",
+    "document_title",
+    "document_summary",
+    "section_title",
+    "section_summary",
+]
+
+
+# Fields that are the same for every chunk of a document. Chunk stores keep them once per document, taken
+# from the document's first chunk, rather than repeating them on every chunk.
+DOCUMENT_FIELDS = ["document_title", "document_summary"]
+
+
+def get_document_fields(chunks: dict[int, dict[str, Any]]) -> dict[str, Any]:
+    """The document-level fields of a document, from its first chunk."""
+    if not chunks:
+        return {field: None for field in DOCUMENT_FIELDS}
+    first_chunk = chunks[min(chunks)]
+    return {field: first_chunk.get(field) for field in DOCUMENT_FIELDS}
+
+
+def validate_chunk_fields(fields: Optional[list[str]]) -> list[str]:
+    if fields is None:
+        return list(CHUNK_FIELDS)
+    for field in fields:
+        if field not in CHUNK_FIELDS:
+            raise ValueError(f"Unsupported chunk field: {field}")
+    return list(fields)
 
 
 class ChunkDB(ABC):
@@ -34,6 +69,17 @@ class ChunkDB(ABC):
         """
         pass
 
+    def add_documents(self, documents: list[dict[str, Any]]) -> None:
+        """
+        Store several documents at once. Each document is a dictionary with the arguments of add_document
+        (doc_id, chunks, and optionally supp_id and metadata).
+
+        This default implementation calls add_document for each document; subclasses should override it
+        with a single bulk write.
+        """
+        for document in documents:
+            self.add_document(**document)
+
     @abstractmethod
     def remove_document(self, doc_id: str) -> None:
         """
@@ -62,6 +108,58 @@ class ChunkDB(ABC):
         """
         pass
 
+    def get_chunks(
+        self, doc_id: str, chunk_start: int, chunk_end: int, fields: Optional[list[str]] = None
+    ) -> dict[int, dict[str, Any]]:
+        """
+        Retrieve several fields of a range of chunks (chunk_end is non-inclusive) in one call, e.g. everything
+        needed to build a segment. Returns a dictionary keyed on chunk_index with one dictionary of the
+        requested fields (all of CHUNK_FIELDS by default) per chunk; chunks that don't exist are left out.
+
+        This default implementation calls the single-chunk getters; subclasses should override it with a
+        single query.
+        """
+        fields = validate_chunk_fields(fields)
+        getters = {
+            "chunk_text": self.get_chunk_text,
+            "is_visual": self.get_is_visual,
+            "document_title": self.get_document_title,
+            "document_summary": self.get_document_summary,
+            "section_title": self.get_section_title,
+            "section_summary": self.get_section_summary,
+        }
+        chunks = {}
+        for chunk_index in range(chunk_start, chunk_end):
+            chunk_text = self.get_chunk_text(doc_id, chunk_index)
+            if chunk_text is None:
+                continue
+            chunk = {}
+            for field in fields:
+                if field == "chunk_text":
+                    chunk[field] = chunk_text
+                elif field in ["chunk_page_start", "chunk_page_end"]:
+                    page_numbers = self.get_chunk_page_numbers(doc_id, chunk_index) or (None, None)
+                    chunk[field] = page_numbers[0] if field == "chunk_page_start" else page_numbers[1]
+                else:
+                    chunk[field] = getters[field](doc_id, chunk_index)
+            chunks[chunk_index] = chunk
+        return chunks
+
+    def get_segments(
+        self, segments: list[tuple[str, int, int]], fields: Optional[list[str]] = None
+    ) -> list[dict[int, dict[str, Any]]]:
+        """
+        Retrieve several ranges of chunks at once. Each segment is a (doc_id, chunk_start, chunk_end) tuple;
+        returns the get_chunks result for each segment, in order.
+
+        This default implementation calls get_chunks for each segment; subclasses with high per-request
+        latency should override it to fetch the segments concurrently.
+        """
+        return [
+            self.get_chunks(doc_id, chunk_start, chunk_end, fields=fields)
+            for doc_id, chunk_start, chunk_end in segments
+        ]
+
     @abstractmethod
     def get_document(self, doc_id: str) -> Optional[FormattedDocument]:
         """
@@ -104,6 +202,45 @@ class ChunkDB(ABC):
         """
         pass
 
+    def has_document(self, doc_id: str) -> bool:
+        """
+        Check whether a document is in the chunk database.
+
+        This default implementation lists every document; subclasses should override it with a keyed lookup.
+        """
+        return doc_id in self.get_all_doc_ids()
+
+    def get_existing_doc_ids(self, doc_ids: list[str]) -> set[str]:
+        """
+        Return the subset of doc_ids that are already in the chunk database, e.g. to check a batch of
+        documents before ingesting them.
+
+        This default implementation calls has_document for each document; subclasses should override it with
+        a single query.
+        """
+        return {doc_id for doc_id in doc_ids if self.has_document(doc_id)}
+
+    def get_stats(self) -> ChunkDBStats:
+        """
+        Return the number of documents, chunks and characters in the chunk database, and the number of
+        documents with each supp_id.
+
+        This default implementation reads every document; subclasses should override it with counters that
+        are kept up to date as documents are added and removed.
+        """
+        stats = ChunkDBStats(num_documents=0, num_chunks=0, num_characters=0, supp_id_counts={})
+        for doc_id in self.get_all_doc_ids():
+            document = self.get_document(doc_id)
+            if document is None:
+                continue
+            chunks = self.get_chunks(doc_id, 0, document["chunk_count"], fields=["chunk_text"])
+            stats["num_documents"] += 1
+            stats["num_chunks"] += len(chunks)
+            stats["num_characters"] += sum(len(chunk["chunk_text"] or "") for chunk in chunks.values())
+            if document.get("supp_id"):
+                stats["supp_id_counts"][document["supp_id"]] = stats["supp_id_counts"].get(document["supp_id"], 0) + 1
+        return stats
+
     @abstractmethod
     def delete(self) -> None:
         """
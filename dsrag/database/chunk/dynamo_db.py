@@ -1,10 +1,27 @@
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Optional
 from decimal import Decimal
 import time
 from dsrag.utils.imports import boto3
-from dsrag.database.chunk.db import ChunkDB
-from dsrag.database.chunk.types import FormattedDocument
+from dsrag.database.chunk.db import ChunkDB, DOCUMENT_FIELDS, get_document_fields, validate_chunk_fields
+from dsrag.database.chunk.types import ChunkDBStats, FormattedDocument
+
+
+# Document-level attributes (document_title, document_summary, supp_id, metadata) are stored once per
+# document, in an item with this chunk_index, instead of on every chunk. Items written by older versions
+# still have them on every chunk, so the getters fall back to the chunk items when there's no such item.
+DOCUMENT_RECORD_INDEX = -1
+
+# Key of the item with the KB-wide counters. Documents only use chunk_index DOCUMENT_RECORD_INDEX and up, so
+# it can't clash with one, even if a document has the same doc_id; queries on a document's partition start
+# at DOCUMENT_RECORD_INDEX to leave it out.
+STATS_RECORD_INDEX = -2
+STATS_RECORD_KEY = {'doc_id': 'dsrag/stats', 'chunk_index': STATS_RECORD_INDEX}
+
+# Prefix of the counter attributes of each supp_id in the stats item
+SUPP_ID_COUNT_PREFIX = 'supp_id_count:'
 
 
 def get_key():
@@ -12,6 +29,11 @@ def get_key():
     return boto3.dynamodb.conditions.Key
 
 
+def get_document_key_condition(doc_id: str):
+    """Key condition matching all the items of a document, and not the stats item"""
+    return get_key()('doc_id').eq(doc_id) & get_key()('chunk_index').gte(DOCUMENT_RECORD_INDEX)
+
+
 def process_items(items):
 
     def convert_decimal(obj):
@@ -29,9 +51,19 @@ def process_items(items):
 
 class DynamoDB(ChunkDB):
 
-    def __init__(self, kb_id: str, table_name: str = None, billing_mode: str = "PAY_PER_REQUEST") -> None:
+    def __init__(self, kb_id: str, table_name: str = None, billing_mode: str = "PAY_PER_REQUEST", max_workers: int = 8) -> None:
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
         self.kb_id = kb_id
         self.billing_mode = billing_mode
+        # Number of threads used for concurrent reads (several segments at once) and parallel batch writes
+        self.max_workers = max_workers
+        # boto3 resources aren't thread-safe, so each thread keeps its own resource and table handle
+        self._local = threading.local()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        # Set once the table is known to be ACTIVE, so writes don't have to check its status again
+        self._table_active = False
         if table_name is not None:
             self.table_name = table_name
         else:
@@ -87,23 +119,58 @@ class DynamoDB(ChunkDB):
     def check_table_status(self):
         # Need to make sure the table has been created before proceeding
         dynamodb = self.create_dynamo_client()
-        table = dynamodb.Table(self.table_name)
         try:
-            response = table.table_status
-            return response
+            # Describe the table rather than reading Table.table_status, which is cached on the table handle
+            response = dynamodb.meta.client.describe_table(TableName=self.table_name)
+            return response['Table']['TableStatus']
         except Exception as e:
             print(e)
             return None
-    
+
+    def wait_for_table(self) -> bool:
+        """Wait until the table is ACTIVE. Returns False if the table doesn't exist."""
+        if self._table_active:
+            return True
+        table_status = self.check_table_status()
+        if table_status is None:
+            return False
+        if table_status == "CREATING":
+            print ("Table is still creating")
+            # Poll every second instead of sleeping a fixed amount of time
+            waiter = self.create_dynamo_client().meta.client.get_waiter('table_exists')
+            waiter.wait(TableName=self.table_name, WaiterConfig={'Delay': 1, 'MaxAttempts': 120})
+        self._table_active = True
+        return True
+
     def create_dynamo_client(self):
-        dynamodb_client = boto3.resource(
-            'dynamodb',
-            region_name=os.environ.get("AWS_REGION"),
-            aws_access_key_id=os.environ.get("AWS_DYNAMO_ACCESS_KEY"),
-            aws_secret_access_key=os.environ.get("AWS_DYNAMO_SECRET_KEY")
-        )
+        # Creating a boto3 resource is slow (it loads the service model), so each thread creates one and reuses it
+        dynamodb_client = getattr(self._local, 'resource', None)
+        if dynamodb_client is None:
+            session = boto3.session.Session()
+            dynamodb_client = session.resource(
+                'dynamodb',
+                region_name=os.environ.get("AWS_REGION"),
+                aws_access_key_id=os.environ.get("AWS_DYNAMO_ACCESS_KEY"),
+                aws_secret_access_key=os.environ.get("AWS_DYNAMO_SECRET_KEY")
+            )
+            self._local.resource = dynamodb_client
         return dynamodb_client
 
+    def _get_table(self):
+        table = getattr(self._local, 'table', None)
+        if table is None:
+            table = self.create_dynamo_client().Table(self.table_name)
+            self._local.table = table
+        return table
+
+    def _map(self, function, items: list) -> list:
+        # Run function over items on the worker threads, returning the results in order
+        if self.max_workers == 1 or len(items) <= 1:
+            return [function(item) for item in items]
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return list(self._executor.map(function, items))
 
     def create_db_table(self, table_name: str) -> None:
         dynamodb = self.create_dynamo_client()
@@ -135,96 +202,173 @@ class DynamoDB(ChunkDB):
                 BillingMode=self.billing_mode,  # On-demand billing
             )
             print("Table creation initiated. Status:", response)
-            time.sleep(5)
+            self.wait_for_table()
+            # A new table starts with zeroed counters
+            self._get_table().put_item(Item={**STATS_RECORD_KEY, 'initialized': True})
         except Exception as e:
             print(e)
 
 
-    def add_document(self, doc_id: str, chunks: dict[int, dict[str, Any]], supp_id: str = "", metadata: dict = {}) -> None:
-        # Initialize DynamoDB resource
-        dynamo_db = self.create_dynamo_client()
-        table = dynamo_db.Table(self.table_name)
-
-        table_status = self.check_table_status()
-        if table_status is None:
-            print ("Table not created")
-            return
-        elif table_status == "CREATING":
-            print ("Table is still creating")
-            time.sleep(10)
-            table_status = self.check_table_status()
-            if table_status == "CREATING":
-                print ("Table is still creating")
-                time.sleep(10)
-
+    def _get_items(
+        self, doc_id: str, chunks: dict[int, dict[str, Any]], supp_id: str = "", metadata: dict = {}
+    ) -> list[dict[str, Any]]:
         # Create a 'created_on' timestamp
         created_on = int(time.time())
 
-        with table.batch_writer() as batch:
-            for chunk_index, chunk in chunks.items():
-                try:
-                    # Initialize the item with mandatory attributes
-                    item = {
-                        'doc_id': doc_id,
-                        'chunk_index': Decimal(str(chunk_index)),
-                        'created_on': Decimal(str(created_on))
-                    }
-
-                    if supp_id:
-                        item['supp_id'] = supp_id
-
-                    if metadata:
-                        item['metadata'] = metadata  # Assuming metadata is a dict
-
-                    # Process 'chunk_text'
-                    chunk_text = chunk.get('chunk_text')
-                    if chunk_text and chunk_text.strip() != '':
-                        item['chunk_text'] = chunk_text
-                        item['chunk_length'] = Decimal(str(len(chunk_text)))
-
-                    # Process other string attributes, avoiding empty strings
-                    for attr in ['document_title', 'document_summary', 'section_title', 'section_summary']:
-                        value = chunk.get(attr)
-                        if value and value.strip() != '':
-                            item[attr] = value
-
-                    # Process numerical attributes 'chunk_page_start', 'chunk_page_end'
-                    for attr in ['chunk_page_start', 'chunk_page_end']:
-                        value = chunk.get(attr)
-                        if value is not None:
-                            item[attr] = Decimal(str(value))
-
-                    # Process boolean attributes
-                    if 'is_visual' in chunk:
-                        is_visual = chunk['is_visual']
-                        if isinstance(is_visual, bool):
-                            item['is_visual'] = is_visual
-                        else:
-                            item['is_visual'] = bool(is_visual)
-
-                    # Remove attributes with None values or empty strings
-                    item = {k: v for k, v in item.items() if v not in [None, '', []]}
-
-                    # Write the item to DynamoDB
+        # The document-level attributes are written once, in the document record
+        document_record = {
+            'doc_id': doc_id,
+            'chunk_index': Decimal(str(DOCUMENT_RECORD_INDEX)),
+            'created_on': Decimal(str(created_on)),
+            'supp_id': supp_id,
+            'metadata': metadata,  # Assuming metadata is a dict
+            **get_document_fields(chunks),
+        }
+        # Remove attributes with None values or empty strings
+        document_record = {k: v for k, v in document_record.items() if v not in [None, '', [], {}]}
+        items = [document_record]
+
+        for chunk_index, chunk in chunks.items():
+            try:
+                # Initialize the item with mandatory attributes
+                item = {
+                    'doc_id': doc_id,
+                    'chunk_index': Decimal(str(chunk_index)),
+                    'created_on': Decimal(str(created_on))
+                }
+
+                # Process 'chunk_text'
+                chunk_text = chunk.get('chunk_text')
+                if chunk_text and chunk_text.strip() != '':
+                    item['chunk_text'] = chunk_text
+                    item['chunk_length'] = Decimal(str(len(chunk_text)))
+
+                # Process other string attributes, avoiding empty strings
+                for attr in ['section_title', 'section_summary']:
+                    value = chunk.get(attr)
+                    if value and value.strip() != '':
+                        item[attr] = value
+
+                # Process numerical attributes 'chunk_page_start', 'chunk_page_end'
+                for attr in ['chunk_page_start', 'chunk_page_end']:
+                    value = chunk.get(attr)
+                    if value is not None:
+                        item[attr] = Decimal(str(value))
+
+                # Process boolean attributes
+                if 'is_visual' in chunk:
+                    is_visual = chunk['is_visual']
+                    if isinstance(is_visual, bool):
+                        item['is_visual'] = is_visual
+                    else:
+                        item['is_visual'] = bool(is_visual)
+
+                # Remove attributes with None values or empty strings
+                item = {k: v for k, v in item.items() if v not in [None, '', []]}
+
+                items.append(item)
+
+            except Exception as e:
+                print(f"Error processing chunk_index {chunk_index}: {e}")
+                # Handle exceptions as needed (e.g., log, skip, or raise)
+
+        # The size of the document, for the counters
+        document_record['num_chunks'] = Decimal(len(items) - 1)
+        document_record['num_characters'] = Decimal(sum(int(item.get('chunk_length', 0)) for item in items[1:]))
+        return items
+
+    def _write_items(self, items: list[dict[str, Any]]) -> None:
+        def write(partition: list[dict[str, Any]]) -> None:
+            # Each batch writer sends its items 25 at a time, retrying unprocessed ones
+            with self._get_table().batch_writer() as batch:
+                for item in partition:
                     batch.put_item(Item=item)
 
-                except Exception as e:
-                    print(f"Error processing chunk_index {chunk_index}: {e}")
-                    # Handle exceptions as needed (e.g., log, skip, or raise)
+        # Split the items across several batch writers that run in parallel
+        num_partitions = min(self.max_workers, -(-len(items) // 25))
+        self._map(write, [items[i::num_partitions] for i in range(num_partitions)])
+
+    def _get_document_record(self, doc_id: str) -> Optional[dict[str, Any]]:
+        response = self._get_table().get_item(
+            Key={
+                'doc_id': doc_id,
+                'chunk_index': DOCUMENT_RECORD_INDEX
+            }
+        )
+        return response.get('Item')
+
+    def _update_stats(self, document_records: list[dict[str, Any]], sign: int) -> None:
+        # Add (sign=1) or subtract (sign=-1) documents to or from the counters with a single atomic update
+        if not document_records:
+            return
+        values = {
+            ':num_documents': sign * len(document_records),
+            ':num_chunks': sign * sum(int(record.get('num_chunks', 0)) for record in document_records),
+            ':num_characters': sign * sum(int(record.get('num_characters', 0)) for record in document_records),
+        }
+        supp_id_counts = {}
+        for record in document_records:
+            if record.get('supp_id'):
+                supp_id_counts[record['supp_id']] = supp_id_counts.get(record['supp_id'], 0) + sign
+        names = {}
+        updates = ['num_documents :num_documents', 'num_chunks :num_chunks', 'num_characters :num_characters']
+        for i, (supp_id, count) in enumerate(supp_id_counts.items()):
+            names[f'#supp_id_{i}'] = SUPP_ID_COUNT_PREFIX + supp_id
+            values[f':supp_id_{i}'] = count
+            updates.append(f'#supp_id_{i} :supp_id_{i}')
+        update_kwargs = {
+            'Key': STATS_RECORD_KEY,
+            'UpdateExpression': 'ADD ' + ', '.join(updates),
+            'ExpressionAttributeValues': {key: Decimal(value) for key, value in values.items()},
+        }
+        if names:
+            update_kwargs['ExpressionAttributeNames'] = names
+        self._get_table().update_item(**update_kwargs)
+
+    def _add_documents(self, documents: list[dict[str, Any]]) -> None:
+        if not self.wait_for_table():
+            print ("Table not created")
+            return
+        # Documents that are being replaced are subtracted from the counters
+        replaced_records = [
+            record for record in self._map(self._get_document_record, [document['doc_id'] for document in documents])
+            if record is not None
+        ]
+        # Write the chunks of all the documents together, so small documents still fill whole batches
+        items = []
+        document_records = []
+        for document in documents:
+            document_items = self._get_items(**document)
+            document_records.append(document_items[0])
+            items.extend(document_items)
+        self._write_items(items)
+        self._update_stats(replaced_records, -1)
+        self._update_stats(document_records, 1)
+
+    def add_document(self, doc_id: str, chunks: dict[int, dict[str, Any]], supp_id: str = "", metadata: dict = {}) -> None:
+        self._add_documents([{'doc_id': doc_id, 'chunks': chunks, 'supp_id': supp_id, 'metadata': metadata}])
+
+    def add_documents(self, documents: list[dict[str, Any]]) -> None:
+        self._add_documents(documents)
 
 
     def remove_document(self, doc_id: str) -> None:
         # Have to get all the items first
-        dynamo_db = self.create_dynamo_client()
-        table = dynamo_db.Table(self.table_name)
+        table = self._get_table()
         
         # Get all items from the table with the given doc_id
-        response = table.query(
-            KeyConditionExpression=get_key()('doc_id').eq(doc_id),
-            ProjectionExpression='doc_id, chunk_index'
-        )
+        query_kwargs = {
+            'KeyConditionExpression': get_document_key_condition(doc_id),
+            'ProjectionExpression': 'doc_id, chunk_index, chunk_length, supp_id',
+        }
+        response = table.query(**query_kwargs)
         items = response.get('Items', [])
 
+        # Handle pagination
+        while 'LastEvaluatedKey' in response:
+            response = table.query(**query_kwargs, ExclusiveStartKey=response['LastEvaluatedKey'])
+            items.extend(response.get('Items', []))
+
         # Delete the items in batches (25 items per batch)
         # Keep track of which items have been deleted
         deleted_items = []
@@ -238,17 +382,25 @@ class DynamoDB(ChunkDB):
                 )
                 deleted_items.append(item['doc_id'])
 
+        if items:
+            # Documents added by older versions don't have a document record, so the size is taken from the chunks
+            chunk_items = [item for item in items if item['chunk_index'] != DOCUMENT_RECORD_INDEX]
+            self._update_stats([{
+                'supp_id': next((item['supp_id'] for item in items if item.get('supp_id')), None),
+                'num_chunks': len(chunk_items),
+                'num_characters': sum(int(item.get('chunk_length', 0)) for item in chunk_items),
+            }], -1)
+
         return deleted_items
 
 
     def get_document(self, doc_id: str, include_content: bool = False) -> Optional[FormattedDocument]:
-        dynamo_db = self.create_dynamo_client()
-        table = dynamo_db.Table(self.table_name)
+        table = self._get_table()
 
         # Define the attributes to retrieve
-        projection_attributes = ['supp_id', 'document_title', 'document_summary', 'created_on', 'metadata']
+        projection_attributes = ['chunk_index', 'supp_id', 'document_title', 'document_summary', 'created_on', 'metadata']
         if include_content:
-            projection_attributes += ['chunk_text', 'chunk_index']
+            projection_attributes += ['chunk_text']
 
         # Build the ProjectionExpression and ExpressionAttributeNames to handle reserved words
         expression_attribute_names = {f'#{attr}': attr for attr in projection_attributes}
@@ -257,7 +409,7 @@ class DynamoDB(ChunkDB):
         try:
             # Query the table for all items with the given doc_id
             response = table.query(
-                KeyConditionExpression=get_key()('doc_id').eq(doc_id),
+                KeyConditionExpression=get_document_key_condition(doc_id),
                 ProjectionExpression=projection_expression,
                 ExpressionAttributeNames=expression_attribute_names
             )
@@ -267,7 +419,7 @@ class DynamoDB(ChunkDB):
             # Handle pagination
             while 'LastEvaluatedKey' in response:
                 response = table.query(
-                    KeyConditionExpression=get_key()('doc_id').eq(doc_id),
+                    KeyConditionExpression=get_document_key_condition(doc_id),
                     ProjectionExpression=projection_expression,
                     ExpressionAttributeNames=expression_attribute_names,
                     ExclusiveStartKey=response['LastEvaluatedKey']
@@ -282,24 +434,29 @@ class DynamoDB(ChunkDB):
             full_document_string = ""
             chunks = []
 
-            # Process items
-            for item in items:
-                # Extract attributes from the first item
-                if items.index(item) == 0:
-                    supp_id = item.get('supp_id')
-                    title = item.get('document_title')
-                    summary = item.get('document_summary')
-                    created_on = item.get('created_on')
-                    if isinstance(created_on, Decimal):
-                        created_on = int(created_on)
-                    metadata = item.get('metadata')
-
-                    # If metadata is stored as a string, convert it back to a dictionary
-                    if metadata and isinstance(metadata, str):
-                        metadata = eval(metadata)  # Be cautious with eval; consider safer alternatives
-
-                # Collect chunks if include_content is True
-                if include_content:
+            # Items are sorted by chunk_index, so the document record (if there is one) comes first; otherwise
+            # the document-level attributes are on every chunk
+            if items[0].get('chunk_index') == DOCUMENT_RECORD_INDEX:
+                document_record, items = items[0], items[1:]
+            else:
+                document_record = items[0]
+
+            # Extract the document-level attributes
+            supp_id = document_record.get('supp_id')
+            title = document_record.get('document_title')
+            summary = document_record.get('document_summary')
+            created_on = document_record.get('created_on')
+            if isinstance(created_on, Decimal):
+                created_on = int(created_on)
+            metadata = document_record.get('metadata')
+
+            # If metadata is stored as a string, convert it back to a dictionary
+            if metadata and isinstance(metadata, str):
+                metadata = eval(metadata)  # Be cautious with eval; consider safer alternatives
+
+            # Collect chunks if include_content is True
+            if include_content:
+                for item in items:
                     chunk_text = item.get('chunk_text', '')
                     chunk_index = item.get('chunk_index')
                     if isinstance(chunk_index, Decimal):
@@ -330,8 +487,7 @@ class DynamoDB(ChunkDB):
             return None
 
     def get_chunk_text(self, doc_id: str, chunk_index: int) -> Optional[str]:
-        dynamo_db = self.create_dynamo_client()
-        table = dynamo_db.Table(self.table_name)
+        table = self._get_table()
 
         response = table.get_item(
             Key={
@@ -347,10 +503,63 @@ class DynamoDB(ChunkDB):
         else:
             return None
 
+    def get_chunks(
+        self, doc_id: str, chunk_start: int, chunk_end: int, fields: Optional[list[str]] = None
+    ) -> dict[int, dict[str, Any]]:
+        fields = validate_chunk_fields(fields)
+        # Chunks start at 0; the items below that are the document and stats records
+        chunk_start = max(chunk_start, 0)
+        if chunk_end <= chunk_start:
+            return {}
+        table = self._get_table()
+
+        # A single range query on the sort key fetches the whole segment
+        projection_attributes = ['chunk_index'] + fields
+        expression_attribute_names = {f'#{attr}': attr for attr in projection_attributes}
+        query_kwargs = {
+            'KeyConditionExpression': get_key()('doc_id').eq(doc_id) & get_key()('chunk_index').between(chunk_start, chunk_end - 1),
+            'ProjectionExpression': ', '.join(expression_attribute_names.keys()),
+            'ExpressionAttributeNames': expression_attribute_names,
+        }
+        response = table.query(**query_kwargs)
+        items = response.get('Items', [])
+
+        # Handle pagination
+        while 'LastEvaluatedKey' in response:
+            response = table.query(**query_kwargs, ExclusiveStartKey=response['LastEvaluatedKey'])
+            items.extend(response.get('Items', []))
+
+        chunks = {}
+        for item in process_items(items):
+            # Attributes that were empty when the document was added aren't stored
+            chunks[item['chunk_index']] = {field: item.get(field) for field in fields}
+
+        document_fields = [field for field in fields if field in DOCUMENT_FIELDS]
+        if chunks and document_fields:
+            response = table.get_item(
+                Key={
+                    'doc_id': doc_id,
+                    'chunk_index': DOCUMENT_RECORD_INDEX
+                },
+                ProjectionExpression=', '.join(f'#{field}' for field in document_fields),
+                ExpressionAttributeNames={f'#{field}': field for field in document_fields}
+            )
+            document_record = response.get('Item')
+            if document_record is not None:
+                for chunk in chunks.values():
+                    chunk.update({field: document_record.get(field) for field in document_fields})
+        return chunks
+
+    def get_segments(
+        self, segments: list[tuple[str, int, int]], fields: Optional[list[str]] = None
+    ) -> list[dict[int, dict[str, Any]]]:
+        # Each segment is a single range query; the queries run concurrently
+        fields = validate_chunk_fields(fields)
+        return self._map(lambda segment: self.get_chunks(*segment, fields=fields), list(segments))
+
     def get_is_visual(self, doc_id: str, chunk_index: int) -> Optional[bool]:
         # Get the 'is_visual' attribute for the given doc_id and chunk_index
-        dynamo_db = self.create_dynamo_client()
-        table = dynamo_db.Table(self.table_name)
+        table = self._get_table()
         response = table.get_item(
             Key={
                 'doc_id': doc_id,
@@ -366,8 +575,7 @@ class DynamoDB(ChunkDB):
 
     def get_chunk_page_numbers(self, doc_id: str, chunk_index: int) -> Optional[tuple[int, int]]:
         # Get the chunk page start and end
-        dynamo_db = self.create_dynamo_client()
-        table = dynamo_db.Table(self.table_name)
+        table = self._get_table()
         response = table.get_item(
             Key={
                 'doc_id': doc_id,
@@ -384,42 +592,30 @@ class DynamoDB(ChunkDB):
         else:
             return None, None
 
+    def _get_document_field(self, doc_id: str, chunk_index: int, field: str) -> Optional[str]:
+        table = self._get_table()
+        # Read the document record, falling back to the chunk for documents added by older versions
+        for index in [DOCUMENT_RECORD_INDEX, chunk_index]:
+            response = table.get_item(
+                Key={
+                    'doc_id': doc_id,
+                    'chunk_index': index
+                },
+                ProjectionExpression=field
+            )
+            item = response.get('Item')
+            if item:
+                return item.get(field)
+        return None
+
     def get_document_title(self, doc_id: str, chunk_index: int) -> Optional[str]:
-        dynamo_db = self.create_dynamo_client()
-        table = dynamo_db.Table(self.table_name)
-        response = table.get_item(
-            Key={
-                'doc_id': doc_id,
-                'chunk_index': chunk_index
-            },
-            ProjectionExpression='document_title'
-        )
-        item = response.get('Item')
-        if item:
-            return item.get('document_title')
-        else:
-            return None
+        return self._get_document_field(doc_id, chunk_index, 'document_title')
 
     def get_document_summary(self, doc_id: str, chunk_index: int) -> Optional[str]:
-        dynamo_db = self.create_dynamo_client()
-        table = dynamo_db.Table(self.table_name)
-        response = table.get_item(
-            Key={
-                'doc_id': doc_id,
-                'chunk_index': chunk_index
-            },
-            ProjectionExpression='document_summary'
-        )
-
-        item = response.get('Item')
-        if item:
-            return item.get('document_summary')
-        else:
-            return None
+        return self._get_document_field(doc_id, chunk_index, 'document_summary')
 
     def get_section_title(self, doc_id: str, chunk_index: int) -> Optional[str]:
-        dynamo_db = self.create_dynamo_client()
-        table = dynamo_db.Table(self.table_name)
+        table = self._get_table()
         response = table.get_item(
             Key={
                 'doc_id': doc_id,
@@ -434,8 +630,7 @@ class DynamoDB(ChunkDB):
             return None
 
     def get_section_summary(self, doc_id: str, chunk_index: int) -> Optional[str]:
-        dynamo_db = self.create_dynamo_client()
-        table = dynamo_db.Table(self.table_name)
+        table = self._get_table()
         response = table.get_item(
             Key={
                 'doc_id': doc_id,
@@ -450,8 +645,7 @@ class DynamoDB(ChunkDB):
             return None
 
     def get_all_doc_ids(self, supp_id: Optional[str] = None) -> list[str]:
-        dynamo_db = self.create_dynamo_client()
-        table = dynamo_db.Table(self.table_name)
+        table = self._get_table()
 
         doc_ids = set()
 
@@ -466,12 +660,14 @@ class DynamoDB(ChunkDB):
             else:
                 # Scan the table
                 response = table.scan(
-                    ProjectionExpression='doc_id',
+                    ProjectionExpression='doc_id, chunk_index',
                 )
 
             items = response.get('Items', [])
             for item in items:
-                doc_ids.add(item['doc_id'])
+                # The stats item isn't a document
+                if item.get('chunk_index') != STATS_RECORD_INDEX:
+                    doc_ids.add(item['doc_id'])
 
             # Handle pagination
             while 'LastEvaluatedKey' in response:
@@ -484,12 +680,13 @@ class DynamoDB(ChunkDB):
                     )
                 else:
                     response = table.scan(
-                        ProjectionExpression='doc_id',
+                        ProjectionExpression='doc_id, chunk_index',
                         ExclusiveStartKey=response['LastEvaluatedKey']
                     )
                 items = response.get('Items', [])
                 for item in items:
-                    doc_ids.add(item['doc_id'])
+                    if item.get('chunk_index') != STATS_RECORD_INDEX:
+                        doc_ids.add(item['doc_id'])
 
         except Exception as e:
             print(f"Error retrieving doc_ids: {e}")
@@ -498,41 +695,89 @@ class DynamoDB(ChunkDB):
 
         return list(doc_ids)
 
-    def get_document_count(self) -> int:
-        dynamo_db = self.create_dynamo_client()
-        table = dynamo_db.Table(self.table_name)
-
-        doc_ids = set()
-
-        response = table.scan(
-            ProjectionExpression='doc_id'
+    def has_document(self, doc_id: str) -> bool:
+        table = self._get_table()
+        # Querying the partition for a single key is enough, and also finds documents added by older versions,
+        # which don't have a document record
+        response = table.query(
+            KeyConditionExpression=get_document_key_condition(doc_id),
+            ProjectionExpression='doc_id',
+            Limit=1
         )
+        return len(response.get('Items', [])) > 0
 
-        items = response.get('Items', [])
-        for item in items:
-            doc_ids.add(item['doc_id'])
-
-        # Handle pagination
-        while 'LastEvaluatedKey' in response:
-            response = table.scan(
-                ProjectionExpression='doc_id',
-                ExclusiveStartKey=response['LastEvaluatedKey']
-            )
-            items = response.get('Items', [])
-            for item in items:
-                doc_ids.add(item['doc_id'])
+    def get_existing_doc_ids(self, doc_ids: list[str]) -> set[str]:
+        # One keyed query per document, run concurrently
+        doc_ids = list(doc_ids)
+        exists = self._map(self.has_document, doc_ids)
+        return {doc_id for doc_id, doc_exists in zip(doc_ids, exists) if doc_exists}
 
-        return len(doc_ids)
+    def get_document_count(self) -> int:
+        return self.get_stats()["num_documents"]
 
     def get_total_num_characters(self) -> int:
-        # Not super feasible to calculate this in DynamoDB
-        pass
+        return self.get_stats()["num_characters"]
+
+    def get_stats(self) -> ChunkDBStats:
+        # The counters are maintained by add_document and remove_document
+        response = self._get_table().get_item(Key=STATS_RECORD_KEY, ConsistentRead=True)
+        record = response.get('Item')
+        if record is None or not record.get('initialized'):
+            record = self._rebuild_stats()
+        return ChunkDBStats(
+            num_documents=int(record.get('num_documents', 0)),
+            num_chunks=int(record.get('num_chunks', 0)),
+            num_characters=int(record.get('num_characters', 0)),
+            supp_id_counts={
+                key[len(SUPP_ID_COUNT_PREFIX):]: int(value)
+                for key, value in record.items()
+                if key.startswith(SUPP_ID_COUNT_PREFIX) and value > 0
+            },
+        )
+
+    def _rebuild_stats(self) -> dict[str, Any]:
+        """
+        Count the documents with a full table scan and store the result in the stats item. Only needed once
+        for tables created by older versions; after that the counters are updated as documents are added and
+        removed.
+        """
+        table = self._get_table()
+        scan_kwargs = {'ProjectionExpression': 'doc_id, chunk_index, chunk_length, supp_id'}
+        documents = {}
+        while True:
+            response = table.scan(**scan_kwargs)
+            for item in response.get('Items', []):
+                if item['chunk_index'] == STATS_RECORD_INDEX:
+                    continue
+                document = documents.setdefault(item['doc_id'], {'num_chunks': 0, 'num_characters': 0, 'supp_id': None})
+                if item.get('supp_id'):
+                    document['supp_id'] = item['supp_id']
+                if item['chunk_index'] != DOCUMENT_RECORD_INDEX:
+                    document['num_chunks'] += 1
+                    document['num_characters'] += int(item.get('chunk_length', 0))
+            if 'LastEvaluatedKey' not in response:
+                break
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+        record = {
+            **STATS_RECORD_KEY,
+            'initialized': True,
+            'num_documents': Decimal(len(documents)),
+            'num_chunks': Decimal(sum(document['num_chunks'] for document in documents.values())),
+            'num_characters': Decimal(sum(document['num_characters'] for document in documents.values())),
+        }
+        for document in documents.values():
+            if document['supp_id']:
+                key = SUPP_ID_COUNT_PREFIX + document['supp_id']
+                record[key] = record.get(key, Decimal(0)) + 1
+        table.put_item(Item=record)
+        return record
 
     def delete(self) -> None:
         # Delete the dynamo db table
-        dynamo_db = self.create_dynamo_client()
-        table = dynamo_db.Table(self.table_name)
+        table = self._get_table()
         response = table.delete()
+        self._table_active = False
         return response
 
     def to_dict(self) -> dict[str, str]:
@@ -540,4 +785,5 @@ class DynamoDB(ChunkDB):
             **super().to_dict(),
             "kb_id": self.kb_id,
             "table_name": self.table_name,
+            "max_workers": self.max_workers,
         }
\ No newline at end of file
@@ -1,24 +1,56 @@
 import time
-from typing import Any, Optional
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
 
-from dsrag.database.chunk.db import ChunkDB
-from dsrag.database.chunk.types import FormattedDocument
+from dsrag.database.chunk.db import ChunkDB, CHUNK_FIELDS, DOCUMENT_FIELDS, get_document_fields, validate_chunk_fields
+from dsrag.database.chunk.types import ChunkDBStats, FormattedDocument
+from dsrag.database.postgres_pool import PostgresConnectionPool
 from dsrag.utils.imports import LazyLoader
 
 # Lazy load PostgreSQL dependencies
-psycopg2 = LazyLoader("psycopg2", "psycopg2-binary")
+psycopg2_extras = LazyLoader("psycopg2.extras", "psycopg2-binary")
 
 
 class PostgresChunkDB(ChunkDB):
 
-    def __init__(self, kb_id: str, username: str, password: str, database: str, host: str="localhost", port: int = 5432) -> None:
+    def __init__(
+        self,
+        kb_id: str,
+        username: str,
+        password: str,
+        database: str,
+        host: str = "localhost",
+        port: int = 5432,
+        min_connections: int = 1,
+        max_connections: int = 10,
+    ) -> None:
         self.kb_id = kb_id
         self.username = username
         self.password = password
         self.database = database
         self.host = host
         self.port = port
+        self.min_connections = min_connections
+        self.max_connections = max_connections
         self.table_name = f"{kb_id}_documents"
+        # Document-level fields are stored once per document in their own table
+        self.document_table_name = f"{kb_id}_document_info"
+        # KB-wide counters, kept up to date by add_document and remove_document
+        self.stats_table_name = f"{kb_id}_stats"
+        self.supp_id_stats_table_name = f"{kb_id}_supp_id_stats"
+        # Unique (doc_id, chunk_index) index on the chunk table
+        self.chunk_index_name = f"{kb_id}_documents_chunk_key"
+
+        # Connections are shared by all the methods (and threads) of this object instead of opening one per call
+        self.pool = PostgresConnectionPool(
+            min_connections=min_connections,
+            max_connections=max_connections,
+            dbname=database,
+            user=username,
+            password=password,
+            host=host,
+            port=port,
+        )
 
         self.columns = [
             {"name": "doc_id", "type": "TEXT"},
@@ -38,140 +70,299 @@ class PostgresChunkDB(ChunkDB):
         ]
 
         # Create a table for this kb_id if it doesn't exist
-        conn = psycopg2.connect(
-            dbname=self.database,
-            user=self.username,
-            password=self.password,
-            host=self.host,
-            port=self.port
-        )
-        cur = conn.cursor()
-        cur.execute(f"SELECT EXISTS (SELECT 1 FROM pg_tables WHERE schemaname = 'public' AND tablename = '{self.table_name}')")
-        exists = cur.fetchone()[0]
-
-        if not exists:
-            # Create a table for this kb_id
-            query_statement = f"CREATE TABLE {self.table_name} ("
-            for column in self.columns:
-                query_statement += f"{column['name']} {column['type']}, "
-            query_statement = query_statement[:-2] + ")"
-            cur.execute(query_statement)
-            conn.commit()
-        else:
-            # Check if we need to add any columns to the table. This happens if the columns have been updated
-            cur.execute(f"SELECT column_name FROM information_schema.columns WHERE table_name = '{self.table_name}'")
-            columns = cur.fetchall()
-            column_names = [column[0] for column in columns]
-            for column in self.columns:
-                if column["name"] not in column_names:
-                    # Add the column to the table
-                    cur.execute("ALTER TABLE {}_chunks ADD COLUMN {} {}".format(kb_id, column["name"], column["type"]))
-        conn.close()
-
-    def add_document(self, doc_id: str, chunks: dict[int, dict[str, Any]], supp_id: str = "", metadata: dict = {}) -> None:
-        # Add the docs to the sqlite table
-        conn = psycopg2.connect(
-            dbname=self.database,
-            user=self.username,
-            password=self.password,
-            host=self.host,
-            port=self.port
-        )
-        cur = conn.cursor()
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT EXISTS (SELECT 1 FROM pg_tables WHERE schemaname = 'public' AND tablename = %s)",
+                (self.table_name,),
+            )
+            exists = cur.fetchone()[0]
+
+            if not exists:
+                # Create a table for this kb_id
+                query_statement = f"CREATE TABLE {self.table_name} ("
+                for column in self.columns:
+                    query_statement += f"{column['name']} {column['type']}, "
+                query_statement = query_statement[:-2] + ")"
+                cur.execute(query_statement)
+            else:
+                # Check if we need to add any columns to the table. This happens if the columns have been updated
+                cur.execute(
+                    "SELECT column_name FROM information_schema.columns WHERE table_name = %s",
+                    (self.table_name,),
+                )
+                columns = cur.fetchall()
+                column_names = [column[0] for column in columns]
+                for column in self.columns:
+                    if column["name"] not in column_names:
+                        # Add the column to the table
+                        cur.execute(f"ALTER TABLE {self.table_name} ADD COLUMN {column['name']} {column['type']}")
+
+            cur.execute(
+                "SELECT EXISTS (SELECT 1 FROM pg_tables WHERE schemaname = 'public' AND tablename = %s)",
+                (self.document_table_name,),
+            )
+            if not cur.fetchone()[0]:
+                cur.execute(
+                    f"CREATE TABLE {self.document_table_name} (doc_id TEXT PRIMARY KEY, document_title TEXT, "
+                    "document_summary TEXT, supp_id TEXT, created_on TEXT, metadata TEXT)"
+                )
+                cur.execute(f"CREATE INDEX ON {self.document_table_name} (supp_id)")
+                if exists:
+                    # Older versions stored the document-level fields on every chunk; move them out, taking them
+                    # from the first chunk of each document
+                    cur.execute(
+                        f"INSERT INTO {self.document_table_name} (doc_id, document_title, document_summary, supp_id, created_on, metadata) "
+                        f"SELECT DISTINCT ON (doc_id) doc_id, document_title, document_summary, supp_id, created_on, metadata "
+                        f"FROM {self.table_name} ORDER BY doc_id, chunk_index"
+                    )
+                    cur.execute(
+                        f"UPDATE {self.table_name} SET document_title=NULL, document_summary=NULL, metadata=NULL"
+                    )
+
+            cur.execute(
+                "SELECT EXISTS (SELECT 1 FROM pg_tables WHERE schemaname = 'public' AND tablename = %s)",
+                (self.stats_table_name,),
+            )
+            if not cur.fetchone()[0]:
+                # Per-document sizes and KB-wide counters, so the statistics don't need to scan the chunks. The
+                # counts of existing documents are filled in once, here.
+                cur.execute(f"ALTER TABLE {self.document_table_name} ADD COLUMN IF NOT EXISTS num_chunks INTEGER")
+                cur.execute(f"ALTER TABLE {self.document_table_name} ADD COLUMN IF NOT EXISTS num_characters BIGINT")
+                cur.execute(
+                    f"UPDATE {self.document_table_name} AS d SET num_chunks = c.num_chunks, num_characters = c.num_characters "
+                    f"FROM (SELECT doc_id, COUNT(*) AS num_chunks, "
+                    f"COALESCE(SUM(COALESCE(chunk_length, LENGTH(chunk_text))), 0) AS num_characters "
+                    f"FROM {self.table_name} GROUP BY doc_id) AS c WHERE c.doc_id = d.doc_id"
+                )
+                cur.execute(
+                    f"CREATE TABLE {self.stats_table_name} (id INT PRIMARY KEY CHECK (id = 0), "
+                    "num_documents BIGINT NOT NULL, num_chunks BIGINT NOT NULL, num_characters BIGINT NOT NULL)"
+                )
+                cur.execute(
+                    f"INSERT INTO {self.stats_table_name} (id, num_documents, num_chunks, num_characters) "
+                    f"SELECT 0, COUNT(*), COALESCE(SUM(num_chunks), 0), COALESCE(SUM(num_characters), 0) "
+                    f"FROM {self.document_table_name}"
+                )
+                cur.execute(
+                    f"CREATE TABLE {self.supp_id_stats_table_name} (supp_id TEXT PRIMARY KEY, num_documents BIGINT NOT NULL)"
+                )
+                cur.execute(
+                    f"INSERT INTO {self.supp_id_stats_table_name} (supp_id, num_documents) "
+                    f"SELECT supp_id, COUNT(*) FROM {self.document_table_name} WHERE supp_id != '' GROUP BY supp_id"
+                )
+
+            cur.execute(
+                "SELECT EXISTS (SELECT 1 FROM pg_indexes WHERE schemaname = 'public' AND indexname = %s)",
+                # Unquoted names are stored lowercased
+                (self.chunk_index_name.lower(),),
+            )
+            if not cur.fetchone()[0]:
+                # Re-adding a chunk replaces it (see _insert_rows), which needs a unique index. Older versions
+                # inserted duplicates instead, so those are dropped first, keeping the last one written.
+                cur.execute(
+                    f"DELETE FROM {self.table_name} AS a USING {self.table_name} AS b "
+                    "WHERE a.doc_id = b.doc_id AND a.chunk_index = b.chunk_index AND a.ctid < b.ctid"
+                )
+                if cur.rowcount > 0:
+                    cur.execute(
+                        f"UPDATE {self.document_table_name} AS d SET num_chunks = c.num_chunks, num_characters = c.num_characters "
+                        f"FROM (SELECT doc_id, COUNT(*) AS num_chunks, COALESCE(SUM(chunk_length), 0) AS num_characters "
+                        f"FROM {self.table_name} GROUP BY doc_id) AS c WHERE c.doc_id = d.doc_id"
+                    )
+                    cur.execute(
+                        f"UPDATE {self.stats_table_name} SET num_chunks = s.num_chunks, num_characters = s.num_characters "
+                        f"FROM (SELECT COALESCE(SUM(num_chunks), 0) AS num_chunks, COALESCE(SUM(num_characters), 0) AS num_characters "
+                        f"FROM {self.document_table_name}) AS s"
+                    )
+                cur.execute(f"CREATE UNIQUE INDEX {self.chunk_index_name} ON {self.table_name} (doc_id, chunk_index)")
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """
+        Check out a pooled connection for the duration of the with block. Calls made inside the block (from
+        the same thread) reuse this connection, so e.g. all the lookups for a segment share one checkout.
+        """
+        with self.pool.connection() as conn:
+            yield conn
+
+    def _fetch_chunk_fields(self, doc_id: str, chunk_index: int, fields: list[str]) -> Optional[tuple]:
+        # The single-chunk getters are on the query path, so they run as prepared statements. Statement names
+        # only need to be unique per connection, and the pool's connections are only used for this table.
+        with self.connection() as conn:
+            cur = conn.cursor()
+            self.pool.execute_prepared(
+                cur,
+                f"get_{'_'.join(fields)}",
+                f"SELECT {', '.join(fields)} FROM {self.table_name} WHERE doc_id=$1 AND chunk_index=$2",
+                (doc_id, chunk_index),
+            )
+            return cur.fetchone()
+
+    # Columns written by add_document, in the order of the rows built by _get_rows
+    DOCUMENT_INSERT_COLUMNS = ["doc_id", "document_title", "document_summary", "supp_id", "created_on", "metadata"]
+    INSERT_COLUMNS = [
+        "doc_id", "section_title", "section_summary", "chunk_text", "chunk_page_start", "chunk_page_end",
+        "is_visual", "chunk_index", "chunk_length", "created_on", "supp_id",
+    ]
+
+    def _get_rows(
+        self, doc_id: str, chunks: dict[int, dict[str, Any]], supp_id: str, metadata: dict
+    ) -> tuple[tuple, list[tuple]]:
+        """The document_info row and the chunk rows of a document."""
         # Create a created on timestamp
         created_on = str(int(time.time()))
 
-        # Turn the metadata object into a string
-        metadata = str(metadata)
+        document_fields = get_document_fields(chunks)
+        document_row = (
+            doc_id,
+            document_fields["document_title"] or "",
+            document_fields["document_summary"] or "",
+            supp_id,
+            created_on,
+            # Turn the metadata object into a string
+            str(metadata),
+        )
 
-        # Get the data from the dictionary
+        chunk_rows = []
         for chunk_index, chunk in chunks.items():
             chunk_text = chunk.get("chunk_text", "")
-            chunk_length = len(chunk_text)
-
-            values_dict = {
-                'doc_id': doc_id,
-                'document_title': chunk.get("document_title", ""),
-                'document_summary': chunk.get("document_summary", ""),
-                'section_title': chunk.get("section_title", ""),
-                'section_summary': chunk.get("section_summary", ""),
-                'chunk_text': chunk.get("chunk_text", ""),
-                'chunk_page_start': chunk.get("chunk_page_start", None),
-                'chunk_page_end': chunk.get("chunk_page_end", None),
-                'is_visual': chunk.get("is_visual", False),
-                'chunk_index': chunk_index,
-                'chunk_length': chunk_length,
-                'created_on': created_on,
-                'supp_id': supp_id,
-                'metadata': metadata
-            }
-
-            # Generate the column names and placeholders
-            columns = ', '.join(values_dict.keys())
-            placeholders = ', '.join(['%s'] * len(values_dict))
-
-            sql = f"INSERT INTO {self.table_name} ({columns}) VALUES ({placeholders})"
-            cur.execute(sql, tuple(values_dict.values()))
-
-        conn.commit()
-        conn.close()
+            chunk_rows.append((
+                doc_id,
+                chunk.get("section_title", ""),
+                chunk.get("section_summary", ""),
+                chunk_text,
+                chunk.get("chunk_page_start", None),
+                chunk.get("chunk_page_end", None),
+                chunk.get("is_visual", False),
+                chunk_index,
+                len(chunk_text),
+                created_on,
+                supp_id,
+            ))
+        return document_row, chunk_rows
+
+    def _get_document_sizes(self, cur: Any, doc_ids: list[str]) -> list[tuple]:
+        # The (supp_id, num_chunks, num_characters) of the documents that exist. FOR UPDATE keeps concurrent
+        # writers of the same documents from counting them twice.
+        cur.execute(
+            f"SELECT supp_id, num_chunks, num_characters FROM {self.document_table_name} WHERE doc_id = ANY(%s) FOR UPDATE",
+            (doc_ids,),
+        )
+        return cur.fetchall()
 
-    def remove_document(self, doc_id: str) -> None:
-        # Remove the docs from the sqlite table
-        conn = psycopg2.connect(
-            dbname=self.database,
-            user=self.username,
-            password=self.password,
-            host=self.host,
-            port=self.port
+    def _update_stats(self, cur: Any, sizes: list[tuple], sign: int) -> None:
+        # Add (sign=1) or subtract (sign=-1) documents to or from the counters, in the caller's transaction
+        if not sizes:
+            return
+        cur.execute(
+            f"UPDATE {self.stats_table_name} SET num_documents = num_documents + %s, num_chunks = num_chunks + %s, "
+            "num_characters = num_characters + %s",
+            (
+                sign * len(sizes),
+                sign * sum(num_chunks or 0 for _, num_chunks, _ in sizes),
+                sign * sum(num_characters or 0 for _, _, num_characters in sizes),
+            ),
         )
-        cur = conn.cursor()
-        cur.execute(f"DELETE FROM {self.table_name} WHERE doc_id='{doc_id}'")
-        conn.commit()
-        conn.close()
+        supp_id_counts = {}
+        for supp_id, _, _ in sizes:
+            if supp_id:
+                supp_id_counts[supp_id] = supp_id_counts.get(supp_id, 0) + sign
+        if supp_id_counts:
+            psycopg2_extras.execute_values(
+                cur,
+                f"INSERT INTO {self.supp_id_stats_table_name} (supp_id, num_documents) VALUES %s ON CONFLICT (supp_id) "
+                f"DO UPDATE SET num_documents = {self.supp_id_stats_table_name}.num_documents + EXCLUDED.num_documents",
+                list(supp_id_counts.items()),
+            )
+        if sign < 0:
+            cur.execute(f"DELETE FROM {self.supp_id_stats_table_name} WHERE num_documents <= 0")
+
+    def _insert_rows(self, document_rows: list[tuple], chunk_rows: list[tuple]) -> None:
+        # execute_values sends the rows as multi-row INSERT statements (page_size rows each) instead of one
+        # round trip per chunk, all in one transaction along with the counter updates
+        with self.connection() as conn:
+            cur = conn.cursor()
+            doc_ids = list(dict.fromkeys(row[0] for row in document_rows))
+            # A statement can't update the same row twice, so only the last copy of a repeated document or
+            # chunk is written
+            document_rows = list({row[0]: row for row in document_rows}.values())
+            chunk_rows = list({(row[0], row[7]): row for row in chunk_rows}.values())
+            # Documents that are being replaced are subtracted first
+            self._update_stats(cur, self._get_document_sizes(cur, doc_ids), -1)
+            updates = ", ".join(f"{column}=EXCLUDED.{column}" for column in self.DOCUMENT_INSERT_COLUMNS[1:])
+            psycopg2_extras.execute_values(
+                cur,
+                f"INSERT INTO {self.document_table_name} ({', '.join(self.DOCUMENT_INSERT_COLUMNS)}) VALUES %s "
+                f"ON CONFLICT (doc_id) DO UPDATE SET {updates}",
+                document_rows,
+                page_size=1000,
+            )
+            updates = ", ".join(
+                f"{column}=EXCLUDED.{column}" for column in self.INSERT_COLUMNS if column not in ("doc_id", "chunk_index")
+            )
+            psycopg2_extras.execute_values(
+                cur,
+                f"INSERT INTO {self.table_name} ({', '.join(self.INSERT_COLUMNS)}) VALUES %s "
+                f"ON CONFLICT (doc_id, chunk_index) DO UPDATE SET {updates}",
+                chunk_rows,
+                page_size=1000,
+            )
+            # Count what's stored, so chunks that were already in the table are included
+            cur.execute(
+                f"UPDATE {self.document_table_name} AS d SET num_chunks = c.num_chunks, num_characters = c.num_characters "
+                f"FROM (SELECT doc_id, COUNT(*) AS num_chunks, COALESCE(SUM(chunk_length), 0) AS num_characters "
+                f"FROM {self.table_name} WHERE doc_id = ANY(%s) GROUP BY doc_id) AS c WHERE c.doc_id = d.doc_id",
+                (doc_ids,),
+            )
+            self._update_stats(cur, self._get_document_sizes(cur, doc_ids), 1)
+
+    def add_document(self, doc_id: str, chunks: dict[int, dict[str, Any]], supp_id: str = "", metadata: dict = {}) -> None:
+        document_row, chunk_rows = self._get_rows(doc_id, chunks, supp_id, metadata)
+        self._insert_rows([document_row], chunk_rows)
+
+    def add_documents(self, documents: list[dict[str, Any]]) -> None:
+        document_rows = []
+        chunk_rows = []
+        for document in documents:
+            document_row, rows = self._get_rows(
+                document["doc_id"], document["chunks"], document.get("supp_id", ""), document.get("metadata", {})
+            )
+            document_rows.append(document_row)
+            chunk_rows += rows
+        self._insert_rows(document_rows, chunk_rows)
+
+    def remove_document(self, doc_id: str) -> None:
+        # Remove the docs from the postgres table
+        with self.connection() as conn:
+            cur = conn.cursor()
+            self._update_stats(cur, self._get_document_sizes(cur, [doc_id]), -1)
+            cur.execute(f"DELETE FROM {self.table_name} WHERE doc_id=%s", (doc_id,))
+            cur.execute(f"DELETE FROM {self.document_table_name} WHERE doc_id=%s", (doc_id,))
 
     def get_document(
         self, doc_id: str, include_content: bool = False
     ) -> Optional[FormattedDocument]:
-        # Retrieve the document from the sqlite table
-        conn = psycopg2.connect(
-            dbname=self.database,
-            user=self.username,
-            password=self.password,
-            host=self.host,
-            port=self.port
-        )
-        cur = conn.cursor()
-        columns = ["supp_id", "document_title", "document_summary", "created_on", "metadata"]
-        if include_content:
-            columns += ["chunk_text", "chunk_index"]
-
-        query_statement = (
-            f"SELECT {', '.join(columns)} FROM {self.table_name} WHERE doc_id='{doc_id}'"
-        )
-        cur.execute(query_statement)
-        results = cur.fetchall()
-        conn.close()
-
-        # If there are no results, return None
-        if not results:
-            return None
-
-        # Turn the results into an object where the columns are keys
-        full_document_string = ""
-        if include_content:
-            # Concatenate the chunks into a single string
-            for result in results:
+        # Retrieve the document from the postgres tables
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                f"SELECT supp_id, document_title, document_summary, created_on, metadata FROM {self.document_table_name} WHERE doc_id=%s",
+                (doc_id,),
+            )
+            document = cur.fetchone()
+            # If there are no results, return None
+            if document is None:
+                return None
+            full_document_string = ""
+            if include_content:
+                cur.execute(
+                    f"SELECT chunk_text FROM {self.table_name} WHERE doc_id=%s ORDER BY chunk_index", (doc_id,)
+                )
                 # Join each chunk text with a new line character
-                full_document_string += result[columns.index("chunk_text")] + "\n"
-            # Remove the last new line character
-            full_document_string = full_document_string[:-1]
+                full_document_string = "\n".join(result[0] for result in cur.fetchall())
 
-        supp_id = results[0][columns.index("supp_id")]
-        title = results[0][columns.index("document_title")]
-        summary = results[0][columns.index("document_summary")]
-        created_on = results[0][columns.index("created_on")]
-        metadata = results[0][columns.index("metadata")]
+        supp_id, title, summary, created_on, metadata = document
 
         # Convert the metadata string back into a dictionary
         if metadata:
@@ -188,203 +379,144 @@ class PostgresChunkDB(ChunkDB):
         )
 
     def get_chunk_text(self, doc_id: str, chunk_index: int) -> Optional[str]:
-        # Retrieve the chunk text from the sqlite table
-        conn = psycopg2.connect(
-            dbname=self.database,
-            user=self.username,
-            password=self.password,
-            host=self.host,
-            port=self.port
-        )
-        cur = conn.cursor()
-        cur.execute(
-            f"SELECT chunk_text FROM {self.table_name} WHERE doc_id='{doc_id}' AND chunk_index={chunk_index}"
-        )
-        result = cur.fetchone()
-        conn.close()
+        # Retrieve the chunk text from the postgres table
+        result = self._fetch_chunk_fields(doc_id, chunk_index, ["chunk_text"])
         if result:
             return result[0]
         return None
-    
+
+    def get_chunks(
+        self, doc_id: str, chunk_start: int, chunk_end: int, fields: Optional[list[str]] = None
+    ) -> dict[int, dict[str, Any]]:
+        # Field names are validated against CHUNK_FIELDS, so they're safe to use as column names
+        fields = validate_chunk_fields(fields)
+        # Document-level fields come from the document_info table
+        columns = [f"d.{field}" if field in DOCUMENT_FIELDS else f"c.{field}" for field in fields]
+        with self.connection() as conn:
+            cur = conn.cursor()
+            # Statement names are limited to 63 characters, so the fields are identified by their position
+            self.pool.execute_prepared(
+                cur,
+                f"get_chunks_{'_'.join(str(CHUNK_FIELDS.index(field)) for field in fields)}",
+                f"SELECT c.chunk_index, {', '.join(columns)} FROM {self.table_name} AS c "
+                f"LEFT JOIN {self.document_table_name} AS d ON d.doc_id = c.doc_id "
+                "WHERE c.doc_id=$1 AND c.chunk_index>=$2 AND c.chunk_index<$3",
+                (doc_id, chunk_start, chunk_end),
+            )
+            results = cur.fetchall()
+        return {result[0]: dict(zip(fields, result[1:])) for result in results}
+
     def get_is_visual(self, doc_id: str, chunk_index: int) -> Optional[bool]:
-        # Retrieve the is_visual flag from the sqlite table
-        conn = psycopg2.connect(
-            dbname=self.database,
-            user=self.username,
-            password=self.password,
-            host=self.host,
-            port=self.port
-        )
-        cur = conn.cursor()
-        cur.execute(
-            f"SELECT is_visual FROM {self.table_name} WHERE doc_id='{doc_id}' AND chunk_index={chunk_index}"
-        )
-        result = cur.fetchone()
-        conn.close()
+        # Retrieve the is_visual flag from the postgres table
+        result = self._fetch_chunk_fields(doc_id, chunk_index, ["is_visual"])
         if result:
             return result[0]
         return None
-    
+
     def get_chunk_page_numbers(self, doc_id: str, chunk_index: int) -> Optional[tuple[int, int]]:
-        # Retrieve the chunk page numbers from the sqlite table
-        conn = psycopg2.connect(
-            dbname=self.database,
-            user=self.username,
-            password=self.password,
-            host=self.host,
-            port=self.port
-        )
-        cur = conn.cursor()
-        cur.execute(
-            f"SELECT chunk_page_start, chunk_page_end FROM {self.table_name} WHERE doc_id='{doc_id}' AND chunk_index={chunk_index}"
-        )
-        result = cur.fetchone()
-        conn.close()
+        # Retrieve the chunk page numbers from the postgres table
+        result = self._fetch_chunk_fields(doc_id, chunk_index, ["chunk_page_start", "chunk_page_end"])
         if result:
             return result
         return None
 
-    def get_document_title(self, doc_id: str, chunk_index: int) -> Optional[str]:
-        # Retrieve the document title from the sqlite table
-        conn = psycopg2.connect(
-            dbname=self.database,
-            user=self.username,
-            password=self.password,
-            host=self.host,
-            port=self.port
-        )
-        cur = conn.cursor()
-        cur.execute(
-            f"SELECT document_title FROM {self.table_name} WHERE doc_id='{doc_id}' AND chunk_index={chunk_index}"
-        )
-        result = cur.fetchone()
-        conn.close()
+    def _fetch_document_field(self, doc_id: str, field: str) -> Optional[str]:
+        with self.connection() as conn:
+            cur = conn.cursor()
+            self.pool.execute_prepared(
+                cur,
+                f"get_{field}",
+                f"SELECT {field} FROM {self.document_table_name} WHERE doc_id=$1",
+                (doc_id,),
+            )
+            result = cur.fetchone()
         if result:
             return result[0]
         return None
 
+    def get_document_title(self, doc_id: str, chunk_index: int) -> Optional[str]:
+        # The title is stored once per document, so it's the same for every chunk
+        return self._fetch_document_field(doc_id, "document_title")
+
     def get_document_summary(self, doc_id: str, chunk_index: int) -> Optional[str]:
-        # Retrieve the document summary from the sqlite table
-        conn = psycopg2.connect(
-            dbname=self.database,
-            user=self.username,
-            password=self.password,
-            host=self.host,
-            port=self.port
-        )
-        cur = conn.cursor()
-        cur.execute(
-            f"SELECT document_summary FROM {self.table_name} WHERE doc_id='{doc_id}' AND chunk_index={chunk_index}"
-        )
-        result = cur.fetchone()
-        conn.close()
-        if result:
-            return result[0]
-        return None
+        # The summary is stored once per document, so it's the same for every chunk
+        return self._fetch_document_field(doc_id, "document_summary")
 
     def get_section_title(self, doc_id: str, chunk_index: int) -> Optional[str]:
-        # Retrieve the section title from the sqlite table
-        conn = psycopg2.connect(
-            dbname=self.database,
-            user=self.username,
-            password=self.password,
-            host=self.host,
-            port=self.port
-        )
-        cur = conn.cursor()
-        cur.execute(
-            f"SELECT section_title FROM {self.table_name} WHERE doc_id='{doc_id}' AND chunk_index={chunk_index}"
-        )
-        result = cur.fetchone()
-        conn.close()
+        # Retrieve the section title from the postgres table
+        result = self._fetch_chunk_fields(doc_id, chunk_index, ["section_title"])
         if result:
             return result[0]
         return None
 
     def get_section_summary(self, doc_id: str, chunk_index: int) -> Optional[str]:
-        # Retrieve the section summary from the sqlite table
-        conn = psycopg2.connect(
-            dbname=self.database,
-            user=self.username,
-            password=self.password,
-            host=self.host,
-            port=self.port
-        )
-        cur = conn.cursor()
-        cur.execute(
-            f"SELECT section_summary FROM {self.table_name} WHERE doc_id='{doc_id}' AND chunk_index={chunk_index}"
-        )
-        result = cur.fetchone()
-        conn.close()
+        # Retrieve the section summary from the postgres table
+        result = self._fetch_chunk_fields(doc_id, chunk_index, ["section_summary"])
         if result:
             return result[0]
         return None
 
     def get_all_doc_ids(self, supp_id: Optional[str] = None) -> list[str]:
-        # Retrieve all document IDs from the sqlite table
-        conn = psycopg2.connect(
-            dbname=self.database,
-            user=self.username,
-            password=self.password,
-            host=self.host,
-            port=self.port
-        )
-        cur = conn.cursor()
-        query_statement = f"SELECT DISTINCT doc_id FROM {self.table_name}"
-        if supp_id:
-            query_statement += f" WHERE supp_id='{supp_id}'"
-        cur.execute(query_statement)
-        results = cur.fetchall()
-        conn.close()
+        # Retrieve all document IDs from the postgres table
+        with self.connection() as conn:
+            cur = conn.cursor()
+            if supp_id:
+                cur.execute(f"SELECT doc_id FROM {self.document_table_name} WHERE supp_id=%s", (supp_id,))
+            else:
+                cur.execute(f"SELECT doc_id FROM {self.document_table_name}")
+            results = cur.fetchall()
         return [result[0] for result in results]
-    
+
+    def has_document(self, doc_id: str) -> bool:
+        with self.connection() as conn:
+            cur = conn.cursor()
+            self.pool.execute_prepared(
+                cur,
+                "has_document",
+                f"SELECT EXISTS (SELECT 1 FROM {self.document_table_name} WHERE doc_id=$1)",
+                (doc_id,),
+            )
+            return cur.fetchone()[0]
+
+    def get_existing_doc_ids(self, doc_ids: list[str]) -> set[str]:
+        with self.connection() as conn:
+            cur = conn.cursor()
+            # psycopg2 adapts the list to an array
+            cur.execute(f"SELECT doc_id FROM {self.document_table_name} WHERE doc_id = ANY(%s)", (list(doc_ids),))
+            results = cur.fetchall()
+        return {result[0] for result in results}
+
     def get_document_count(self) -> int:
-        # Retrieve the number of documents in the sqlite table
-        conn = psycopg2.connect(
-            dbname=self.database,
-            user=self.username,
-            password=self.password,
-            host=self.host,
-            port=self.port
-        )
-        cur = conn.cursor()
-        cur.execute(f"SELECT COUNT(DISTINCT doc_id) FROM {self.table_name}")
-        result = cur.fetchone()
-        conn.close()
-        if result is None:
-            return 0
-        return result[0]
+        return self.get_stats()["num_documents"]
 
     def get_total_num_characters(self) -> int:
-        # Retrieve the total number of characters in the sqlite table
-        conn = psycopg2.connect(
-            dbname=self.database,
-            user=self.username,
-            password=self.password,
-            host=self.host,
-            port=self.port
+        return self.get_stats()["num_characters"]
+
+    def get_stats(self) -> ChunkDBStats:
+        # The counters are maintained by add_document and remove_document
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f"SELECT num_documents, num_chunks, num_characters FROM {self.stats_table_name} WHERE id = 0")
+            num_documents, num_chunks, num_characters = cur.fetchone()
+            cur.execute(f"SELECT supp_id, num_documents FROM {self.supp_id_stats_table_name}")
+            supp_id_counts = dict(cur.fetchall())
+        return ChunkDBStats(
+            num_documents=num_documents,
+            num_chunks=num_chunks,
+            num_characters=num_characters,
+            supp_id_counts=supp_id_counts,
         )
-        cur = conn.cursor()
-        cur.execute(f"SELECT SUM(chunk_length) FROM {self.table_name}")
-        result = cur.fetchone()
-        conn.close()
-        if result is None or result[0] is None:
-            return 0
-        return result[0]
 
     def delete(self) -> None:
         # Delete the postgres table
-        conn = psycopg2.connect(
-            dbname=self.database,
-            user=self.username,
-            password=self.password,
-            host=self.host,
-            port=self.port
-        )
-        cur = conn.cursor()
-        cur.execute(f"DROP TABLE {self.table_name}")
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f"DROP TABLE {self.table_name}")
+            cur.execute(f"DROP TABLE IF EXISTS {self.document_table_name}")
+            cur.execute(f"DROP TABLE IF EXISTS {self.stats_table_name}")
+            cur.execute(f"DROP TABLE IF EXISTS {self.supp_id_stats_table_name}")
+        # The prepared statements refer to the dropped table, so the pooled connections can't be reused
+        self.pool.close()
 
     def to_dict(self) -> dict[str, str]:
         return {
@@ -395,4 +527,6 @@ class PostgresChunkDB(ChunkDB):
             "database": self.database,
             "host": self.host,
             "port": self.port,
-        }
\ No newline at end of file
+            "min_connections": self.min_connections,
+            "max_connections": self.max_connections,
+        }
@@ -1,18 +1,58 @@
 import os
 import time
 import sqlite3
+import threading
+import weakref
 from typing import Any, Optional, ContextManager
 import contextlib
 import logging
 
-from dsrag.database.chunk.db import ChunkDB
-from dsrag.database.chunk.types import FormattedDocument
+from dsrag.database.chunk.db import ChunkDB, DOCUMENT_FIELDS, get_document_fields, validate_chunk_fields
+from dsrag.database.chunk.types import ChunkDBStats, FormattedDocument
+from dsrag.database.compression import TextCodec, validate_compression
 
 
-class SQLiteDB(ChunkDB):
+# Version of the indexes and settings below, stored in the database file with PRAGMA user_version
+SCHEMA_VERSION = 3
+
+# Size of the memory map SQLite reads the database through, instead of copying pages into its own cache
+MMAP_SIZE = 256 * 1024 * 1024
+
+# Most doc_ids bound to a single IN (...) query
+MAX_QUERY_PARAMETERS = 500
+
+
+class _ThreadConnection:
+    """A thread's connection. It's only referenced by the thread's local storage, so it's garbage-collected
+    (and the connection closed by a finalizer) when the thread exits."""
+
+    def __init__(self, conn: sqlite3.Connection, generation: int) -> None:
+        self.conn = conn
+        self.generation = generation
 
-    def __init__(self, kb_id: str, storage_directory: str = "~/dsRAG") -> None:
+
+class SQLiteDB(ChunkDB):
+    """
+    ChunkDB stored in a SQLite database file per KB.
+
+    With compression="zstd", the chunk text is stored as a zstd-compressed BLOB (see TextCodec) and only
+    decompressed by the getters; chunk_length is still the length of the uncompressed text. With
+    compression_dictionary, a dictionary is trained on the first chunks added and stored in the database.
+    """
+
+    def __init__(
+        self,
+        kb_id: str,
+        storage_directory: str = "~/dsRAG",
+        compression: Optional[str] = None,
+        compression_dictionary: bool = False,
+    ) -> None:
+        validate_compression(compression)
         self.kb_id = kb_id
+        self.compression = compression
+        self.compression_dictionary = compression_dictionary
+        # Used to read compressed chunk text even if compression has since been turned off
+        self.codec = TextCodec(train_dictionary=compression_dictionary)
         self.storage_directory = os.path.expanduser(storage_directory)
         os.makedirs(
             os.path.join(self.storage_directory, "chunk_storage"), exist_ok=True
@@ -35,47 +75,192 @@ class SQLiteDB(ChunkDB):
             {"name": "metadata", "type": "TEXT"},
         ]
 
-        # Create a table for this kb_id if it doesn't exist
-        conn = sqlite3.connect(os.path.join(self.db_path, f"{kb_id}.db"))
-        c = conn.cursor()
-        result = c.execute(
-            "SELECT name FROM sqlite_master WHERE type='table' AND name='documents'"
-        )
-        if not result.fetchone():
-            # Create a table for this kb_id
-            query_statement = "CREATE TABLE documents ("
-            for column in self.columns:
-                query_statement += f"{column['name']} {column['type']}, "
-            query_statement = query_statement[:-2] + ")"
-            c.execute(query_statement)
-            conn.commit()
-        else:
-            # Check if we need to add any columns to the table. This happens if the columns have been updated
-            c.execute("PRAGMA table_info(documents)")
-            columns = c.fetchall()
-            column_names = [column[1] for column in columns]
-            for column in self.columns:
-                if column["name"] not in column_names:
-                    # Add the column to the table
-                    c.execute("ALTER TABLE documents ADD COLUMN {} {}".format(column["name"], column["type"]))
-        conn.close()
-
         # Add these settings
         self.timeout = 60.0  # seconds
         self.max_retries = 3
         self.retry_delay = 1.0  # seconds
 
-    @contextlib.contextmanager
-    def get_connection(self) -> ContextManager[sqlite3.Connection]:
-        """Get a database connection with proper timeout settings."""
+        # Each thread keeps its own long-lived connection, which is closed when the thread exits. They're
+        # tracked weakly, so delete() can close the ones that are still open.
+        self._local = threading.local()
+        self._connections: "weakref.WeakSet[_ThreadConnection]" = weakref.WeakSet()
+        self._connections_lock = threading.Lock()
+        self._generation = 0
+
+        with self.get_connection() as conn:
+            c = conn.cursor()
+            # Create a table for this kb_id if it doesn't exist
+            result = c.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name='documents'"
+            )
+            if not result.fetchone():
+                # Create a table for this kb_id
+                query_statement = "CREATE TABLE documents ("
+                for column in self.columns:
+                    query_statement += f"{column['name']} {column['type']}, "
+                query_statement = query_statement[:-2] + ")"
+                c.execute(query_statement)
+                conn.commit()
+            else:
+                # Check if we need to add any columns to the table. This happens if the columns have been updated
+                c.execute("PRAGMA table_info(documents)")
+                columns = c.fetchall()
+                column_names = [column[1] for column in columns]
+                for column in self.columns:
+                    if column["name"] not in column_names:
+                        # Add the column to the table
+                        c.execute("ALTER TABLE documents ADD COLUMN {} {}".format(column["name"], column["type"]))
+                conn.commit()
+            self._migrate_schema(conn)
+            self._load_compression_dictionaries(conn)
+
+    def _load_compression_dictionaries(self, conn: sqlite3.Connection) -> None:
+        # Every dictionary ever trained for this KB is kept, so older chunks stay readable
+        c = conn.cursor()
+        c.execute(
+            "CREATE TABLE IF NOT EXISTS compression_dictionaries (dict_id INTEGER PRIMARY KEY, dictionary BLOB NOT NULL)"
+        )
+        conn.commit()
+        for (dictionary,) in c.execute("SELECT dictionary FROM compression_dictionaries ORDER BY rowid").fetchall():
+            self.codec.load_dictionary(dictionary)
+
+    def _train_compression_dictionary(self, chunks: dict[int, dict[str, Any]]) -> None:
+        if not self.compression_dictionary or self.codec.has_dictionary:
+            return
+        dictionary = self.codec.add_training_samples(chunk.get("chunk_text", "") for chunk in chunks.values())
+        if dictionary is not None:
+            self._execute_with_retry(self._save_compression_dictionary, dictionary)
+
+    @staticmethod
+    def _save_compression_dictionary(conn: sqlite3.Connection, dictionary: bytes) -> None:
+        compression_dict = TextCodec.parse_dictionary(dictionary)
+        conn.execute(
+            "INSERT OR IGNORE INTO compression_dictionaries (dict_id, dictionary) VALUES (?, ?)",
+            (compression_dict.dict_id(), dictionary),
+        )
+        conn.commit()
+
+    def _decompress(self, chunk_text: Any) -> Optional[str]:
+        try:
+            return self.codec.decompress(chunk_text)
+        except ValueError:
+            # Compressed with a dictionary trained by another connection since this one was opened
+            with self.get_connection() as conn:
+                self._load_compression_dictionaries(conn)
+            return self.codec.decompress(chunk_text)
+
+    def _decompress_chunk_text(self, chunks: dict[int, dict[str, Any]]) -> dict[int, dict[str, Any]]:
+        for chunk in chunks.values():
+            if "chunk_text" in chunk:
+                chunk["chunk_text"] = self._decompress(chunk["chunk_text"])
+        return chunks
+
+    def _migrate_schema(self, conn: sqlite3.Connection) -> None:
+        """Bring databases created by older versions up to SCHEMA_VERSION."""
+        c = conn.cursor()
+        version = c.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+
+        if version < 1:
+            # WAL lets readers run concurrently with a writer. The journal mode is stored in the database file.
+            c.execute("PRAGMA journal_mode=WAL")
+
+            # Older versions didn't enforce unique chunk keys; keep the most recently added copy of each chunk
+            c.execute(
+                "DELETE FROM documents WHERE rowid NOT IN "
+                "(SELECT MAX(rowid) FROM documents GROUP BY doc_id, chunk_index)"
+            )
+            # Chunk lookups by (doc_id, chunk_index) and (doc_id, chunk_index range) use this index instead of a
+            # full table scan
+            c.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS documents_doc_id_chunk_index ON documents (doc_id, chunk_index)"
+            )
+            c.execute("CREATE INDEX IF NOT EXISTS documents_supp_id ON documents (supp_id)")
+
+        if version < 2:
+            # Document-level fields are stored once per document instead of on every chunk (the chunk table is
+            # still called documents, for compatibility)
+            c.execute(
+                "CREATE TABLE IF NOT EXISTS document_info (doc_id TEXT PRIMARY KEY, document_title TEXT, "
+                "document_summary TEXT, supp_id TEXT, created_on TEXT, metadata TEXT)"
+            )
+            c.execute("CREATE INDEX IF NOT EXISTS document_info_supp_id ON document_info (supp_id)")
+            # Move the fields of existing documents out of their chunks, taking them from the first chunk
+            c.execute(
+                "INSERT OR IGNORE INTO document_info (doc_id, document_title, document_summary, supp_id, created_on, metadata) "
+                "SELECT doc_id, document_title, document_summary, supp_id, created_on, metadata FROM documents AS c "
+                "WHERE chunk_index = (SELECT MIN(chunk_index) FROM documents WHERE doc_id = c.doc_id)"
+            )
+            c.execute("UPDATE documents SET document_title=NULL, document_summary=NULL, metadata=NULL")
+
+        if version < 3:
+            # Per-document sizes and KB-wide counters, kept up to date by add_document and remove_document so
+            # the statistics don't need to scan the chunks
+            column_names = [column[1] for column in c.execute("PRAGMA table_info(document_info)").fetchall()]
+            for column in ["num_chunks", "num_characters"]:
+                if column not in column_names:
+                    c.execute(f"ALTER TABLE document_info ADD COLUMN {column} INTEGER")
+            c.execute(
+                "UPDATE document_info SET "
+                "num_chunks = (SELECT COUNT(*) FROM documents WHERE documents.doc_id = document_info.doc_id), "
+                "num_characters = (SELECT COALESCE(SUM(COALESCE(chunk_length, LENGTH(chunk_text))), 0) FROM documents "
+                "WHERE documents.doc_id = document_info.doc_id)"
+            )
+            c.execute(
+                "CREATE TABLE IF NOT EXISTS kb_stats (id INTEGER PRIMARY KEY CHECK (id = 0), "
+                "num_documents INTEGER NOT NULL, num_chunks INTEGER NOT NULL, num_characters INTEGER NOT NULL)"
+            )
+            c.execute(
+                "INSERT OR REPLACE INTO kb_stats (id, num_documents, num_chunks, num_characters) "
+                "SELECT 0, COUNT(*), COALESCE(SUM(num_chunks), 0), COALESCE(SUM(num_characters), 0) FROM document_info"
+            )
+            c.execute("CREATE TABLE IF NOT EXISTS supp_id_stats (supp_id TEXT PRIMARY KEY, num_documents INTEGER NOT NULL)")
+            c.execute("DELETE FROM supp_id_stats")
+            c.execute(
+                "INSERT INTO supp_id_stats (supp_id, num_documents) "
+                "SELECT supp_id, COUNT(*) FROM document_info WHERE supp_id != '' GROUP BY supp_id"
+            )
+
+        c.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
         conn = sqlite3.connect(
             os.path.join(self.db_path, f"{self.kb_id}.db"),
-            timeout=self.timeout
+            timeout=self.timeout,
+            # Connections are only used by the thread that opened them, but delete() may close them from another one
+            check_same_thread=False,
         )
+        # In WAL mode, NORMAL only syncs at checkpoints, which is still safe against corruption
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        return conn
+
+    @contextlib.contextmanager
+    def get_connection(self) -> ContextManager[sqlite3.Connection]:
+        """Get this thread's database connection, opening it on first use."""
+        thread_connection = getattr(self._local, "connection", None)
+        if thread_connection is None or thread_connection.generation != self._generation:
+            thread_connection = _ThreadConnection(self._connect(), self._generation)
+            weakref.finalize(thread_connection, thread_connection.conn.close)
+            with self._connections_lock:
+                self._connections.add(thread_connection)
+            self._local.connection = thread_connection
+        conn = thread_connection.conn
         try:
             yield conn
-        finally:
-            conn.close()
+        except BaseException:
+            # Don't leave a failed write's transaction (and its lock) open on the long-lived connection
+            conn.rollback()
+            raise
+
+    def _close_connections(self) -> None:
+        with self._connections_lock:
+            connections = list(self._connections)
+            self._generation += 1
+        for thread_connection in connections:
+            thread_connection.conn.close()
 
     def _execute_with_retry(self, operation: callable, *args, **kwargs) -> Any:
         """Execute a database operation with retries."""
@@ -99,47 +284,135 @@ class SQLiteDB(ChunkDB):
 
         raise last_error
 
-    def add_document(self, doc_id: str, chunks: dict[int, dict[str, Any]], supp_id: str = "", metadata: dict = {}) -> None:
-        def _add_doc(conn: sqlite3.Connection, doc_id: str, chunks: dict, supp_id: str, metadata: dict) -> None:
-            c = conn.cursor()
-            created_on = str(int(time.time()))
-            metadata_str = str(metadata)
-
-            for chunk_index, chunk in chunks.items():
-                chunk_text = chunk.get("chunk_text", "")
-                chunk_length = len(chunk_text)
-
-                values_dict = {
-                    'doc_id': doc_id,
-                    'document_title': chunk.get("document_title", ""),
-                    'document_summary': chunk.get("document_summary", ""),
-                    'section_title': chunk.get("section_title", ""),
-                    'section_summary': chunk.get("section_summary", ""),
-                    'chunk_text': chunk_text,
-                    'chunk_page_start': chunk.get("chunk_page_start", None),
-                    'chunk_page_end': chunk.get("chunk_page_end", None),
-                    'is_visual': chunk.get("is_visual", False),
-                    'chunk_index': chunk_index,
-                    'chunk_length': chunk_length,
-                    'created_on': created_on,
-                    'supp_id': supp_id,
-                    'metadata': metadata_str
-                }
-
-                columns = ', '.join(values_dict.keys())
-                placeholders = ', '.join(['?'] * len(values_dict))
-                sql = f"INSERT INTO documents ({columns}) VALUES ({placeholders})"
-                
-                c.execute(sql, tuple(values_dict.values()))
-            
-            conn.commit()
+    # Columns written by add_document, in the order of the rows built by _get_rows
+    DOCUMENT_INSERT_COLUMNS = ["doc_id", "document_title", "document_summary", "supp_id", "created_on", "metadata"]
+    INSERT_COLUMNS = [
+        "doc_id", "section_title", "section_summary", "chunk_text", "chunk_page_start", "chunk_page_end",
+        "is_visual", "chunk_index", "chunk_length", "created_on", "supp_id",
+    ]
+
+    def _get_rows(
+        self, doc_id: str, chunks: dict[int, dict[str, Any]], supp_id: str, metadata: dict
+    ) -> tuple[tuple, list[tuple]]:
+        """The document_info row and the chunk rows of a document."""
+        created_on = str(int(time.time()))
+        document_fields = get_document_fields(chunks)
+        document_row = (
+            doc_id,
+            document_fields["document_title"] or "",
+            document_fields["document_summary"] or "",
+            supp_id,
+            created_on,
+            str(metadata),
+        )
+        chunk_rows = []
+        if self.compression:
+            self._train_compression_dictionary(chunks)
+        for chunk_index, chunk in chunks.items():
+            chunk_text = chunk.get("chunk_text", "")
+            chunk_rows.append((
+                doc_id,
+                chunk.get("section_title", ""),
+                chunk.get("section_summary", ""),
+                self.codec.compress(chunk_text) if self.compression else chunk_text,
+                chunk.get("chunk_page_start", None),
+                chunk.get("chunk_page_end", None),
+                chunk.get("is_visual", False),
+                chunk_index,
+                len(chunk_text),
+                created_on,
+                supp_id,
+            ))
+        return document_row, chunk_rows
+
+    @staticmethod
+    def _get_document_sizes(c: sqlite3.Cursor, doc_ids: list[str]) -> list[tuple]:
+        # The (supp_id, num_chunks, num_characters) of the documents that exist
+        sizes = []
+        for i in range(0, len(doc_ids), MAX_QUERY_PARAMETERS):
+            batch = doc_ids[i:i + MAX_QUERY_PARAMETERS]
+            c.execute(
+                f"SELECT supp_id, num_chunks, num_characters FROM document_info WHERE doc_id IN ({', '.join(['?'] * len(batch))})",
+                batch,
+            )
+            sizes += c.fetchall()
+        return sizes
+
+    @staticmethod
+    def _update_stats(c: sqlite3.Cursor, sizes: list[tuple], sign: int) -> None:
+        # Add (sign=1) or subtract (sign=-1) documents to or from the counters, in the caller's transaction
+        if not sizes:
+            return
+        c.execute(
+            "UPDATE kb_stats SET num_documents = num_documents + ?, num_chunks = num_chunks + ?, "
+            "num_characters = num_characters + ?",
+            (
+                sign * len(sizes),
+                sign * sum(num_chunks or 0 for _, num_chunks, _ in sizes),
+                sign * sum(num_characters or 0 for _, _, num_characters in sizes),
+            ),
+        )
+        supp_id_counts = {}
+        for supp_id, _, _ in sizes:
+            if supp_id:
+                supp_id_counts[supp_id] = supp_id_counts.get(supp_id, 0) + sign
+        c.executemany(
+            "INSERT INTO supp_id_stats (supp_id, num_documents) VALUES (?, ?) ON CONFLICT (supp_id) "
+            "DO UPDATE SET num_documents = supp_id_stats.num_documents + excluded.num_documents",
+            list(supp_id_counts.items()),
+        )
+        if sign < 0:
+            c.execute("DELETE FROM supp_id_stats WHERE num_documents <= 0")
+
+    def _insert_rows(self, conn: sqlite3.Connection, document_rows: list[tuple], chunk_rows: list[tuple]) -> None:
+        # One prepared statement per table for all the rows, committed as a single transaction along with the
+        # counter updates
+        c = conn.cursor()
+        doc_ids = list(dict.fromkeys(row[0] for row in document_rows))
+        # Documents that are being replaced are subtracted first
+        self._update_stats(c, self._get_document_sizes(c, doc_ids), -1)
+        placeholders = ', '.join(['?'] * len(self.DOCUMENT_INSERT_COLUMNS))
+        conn.executemany(
+            f"INSERT OR REPLACE INTO document_info ({', '.join(self.DOCUMENT_INSERT_COLUMNS)}) VALUES ({placeholders})",
+            document_rows,
+        )
+        placeholders = ', '.join(['?'] * len(self.INSERT_COLUMNS))
+        conn.executemany(
+            f"INSERT OR REPLACE INTO documents ({', '.join(self.INSERT_COLUMNS)}) VALUES ({placeholders})",
+            chunk_rows,
+        )
+        # Chunks that were already stored under the same key are counted once, so count what's in the table
+        c.executemany(
+            "UPDATE document_info SET "
+            "num_chunks = (SELECT COUNT(*) FROM documents WHERE doc_id = ?), "
+            "num_characters = (SELECT COALESCE(SUM(chunk_length), 0) FROM documents WHERE doc_id = ?) "
+            "WHERE doc_id = ?",
+            [(doc_id, doc_id, doc_id) for doc_id in doc_ids],
+        )
+        self._update_stats(c, self._get_document_sizes(c, doc_ids), 1)
+        conn.commit()
 
-        self._execute_with_retry(_add_doc, doc_id, chunks, supp_id, metadata)
+    def add_document(self, doc_id: str, chunks: dict[int, dict[str, Any]], supp_id: str = "", metadata: dict = {}) -> None:
+        document_row, chunk_rows = self._get_rows(doc_id, chunks, supp_id, metadata)
+        self._execute_with_retry(self._insert_rows, [document_row], chunk_rows)
+
+    def add_documents(self, documents: list[dict[str, Any]]) -> None:
+        document_rows = []
+        chunk_rows = []
+        for document in documents:
+            document_row, rows = self._get_rows(
+                document["doc_id"], document["chunks"], document.get("supp_id", ""), document.get("metadata", {})
+            )
+            document_rows.append(document_row)
+            chunk_rows += rows
+        self._execute_with_retry(self._insert_rows, document_rows, chunk_rows)
 
     def remove_document(self, doc_id: str) -> None:
         def _remove_doc(conn: sqlite3.Connection, doc_id: str) -> None:
             c = conn.cursor()
-            c.execute(f"DELETE FROM documents WHERE doc_id=?", (doc_id,))
+            self._update_stats(c, self._get_document_sizes(c, [doc_id]), -1)
+            c.execute("DELETE FROM documents WHERE doc_id=?", (doc_id,))
+            c.execute("DELETE FROM document_info WHERE doc_id=?", (doc_id,))
             conn.commit()
 
         self._execute_with_retry(_remove_doc, doc_id)
@@ -147,39 +420,29 @@ class SQLiteDB(ChunkDB):
     def get_document(
         self, doc_id: str, include_content: bool = False
     ) -> Optional[FormattedDocument]:
-        # Retrieve the document from the sqlite table
-        conn = sqlite3.connect(os.path.join(self.db_path, f"{self.kb_id}.db"))
-        c = conn.cursor()
-        columns = ["supp_id", "document_title", "document_summary", "created_on", "metadata"]
-        if include_content:
-            columns += ["chunk_text", "chunk_index"]
-
-        query_statement = (
-            f"SELECT {', '.join(columns)} FROM documents WHERE doc_id='{doc_id}'"
-        )
-        c.execute(query_statement)
-        results = c.fetchall()
-        conn.close()
-
-        # If there are no results, return None
-        if not results:
-            return None
-
-        # Turn the results into an object where the columns are keys
-        full_document_string = ""
-        if include_content:
-            # Concatenate the chunks into a single string
-            for result in results:
-                # Join each chunk text with a new line character
-                full_document_string += result[columns.index("chunk_text")] + "\n"
-            # Remove the last new line character
-            full_document_string = full_document_string[:-1]
-
-        supp_id = results[0][columns.index("supp_id")]
-        title = results[0][columns.index("document_title")]
-        summary = results[0][columns.index("document_summary")]
-        created_on = results[0][columns.index("created_on")]
-        metadata = results[0][columns.index("metadata")]
+        # Retrieve the document from the sqlite tables
+        with self.get_connection() as conn:
+            c = conn.cursor()
+            c.execute(
+                "SELECT supp_id, document_title, document_summary, created_on, metadata FROM document_info WHERE doc_id=?",
+                (doc_id,),
+            )
+            document = c.fetchone()
+            # If there are no results, return None
+            if document is None:
+                return None
+            if include_content:
+                c.execute("SELECT chunk_text FROM documents WHERE doc_id=? ORDER BY chunk_index", (doc_id,))
+                chunk_texts = [self._decompress(result[0]) for result in c.fetchall()]
+                chunk_count = len(chunk_texts)
+            else:
+                c.execute("SELECT COUNT(*) FROM documents WHERE doc_id=?", (doc_id,))
+                chunk_count = c.fetchone()[0]
+
+        # Join each chunk text with a new line character
+        full_document_string = "\n".join(chunk_texts) if include_content else ""
+
+        supp_id, title, summary, created_on, metadata = document
 
         # Convert the metadata string back into a dictionary
         if metadata:
@@ -193,142 +456,154 @@ class SQLiteDB(ChunkDB):
             summary=summary,
             created_on=created_on,
             metadata=metadata,
-            chunk_count=len(results)
+            chunk_count=chunk_count
         )
 
+    def _fetch_chunk_fields(self, doc_id: str, chunk_index: int, fields: list[str]) -> Optional[tuple]:
+        with self.get_connection() as conn:
+            c = conn.cursor()
+            c.execute(
+                f"SELECT {', '.join(fields)} FROM documents WHERE doc_id=? AND chunk_index=?",
+                (doc_id, chunk_index),
+            )
+            return c.fetchone()
+
     def get_chunk_text(self, doc_id: str, chunk_index: int) -> Optional[str]:
         # Retrieve the chunk text from the sqlite table
-        conn = sqlite3.connect(os.path.join(self.db_path, f"{self.kb_id}.db"))
-        c = conn.cursor()
-        c.execute(
-            f"SELECT chunk_text FROM documents WHERE doc_id='{doc_id}' AND chunk_index={chunk_index}"
-        )
-        result = c.fetchone()
-        conn.close()
+        result = self._fetch_chunk_fields(doc_id, chunk_index, ["chunk_text"])
         if result:
-            return result[0]
+            return self._decompress(result[0])
         return None
-    
+
+    def get_chunks(
+        self, doc_id: str, chunk_start: int, chunk_end: int, fields: Optional[list[str]] = None
+    ) -> dict[int, dict[str, Any]]:
+        # Field names are validated against CHUNK_FIELDS, so they're safe to use as column names
+        fields = validate_chunk_fields(fields)
+        # Document-level fields come from the document_info table
+        columns = [f"d.{field}" if field in DOCUMENT_FIELDS else f"c.{field}" for field in fields]
+        with self.get_connection() as conn:
+            c = conn.cursor()
+            c.execute(
+                f"SELECT c.chunk_index, {', '.join(columns)} FROM documents AS c "
+                "LEFT JOIN document_info AS d ON d.doc_id = c.doc_id "
+                "WHERE c.doc_id=? AND c.chunk_index>=? AND c.chunk_index<?",
+                (doc_id, chunk_start, chunk_end),
+            )
+            results = c.fetchall()
+        return self._decompress_chunk_text({result[0]: dict(zip(fields, result[1:])) for result in results})
+
     def get_is_visual(self, doc_id: str, chunk_index: int) -> Optional[bool]:
         # Retrieve the is_visual param from the sqlite table
-        conn = sqlite3.connect(os.path.join(self.db_path, f"{self.kb_id}.db"))
-        c = conn.cursor()
-        c.execute(
-            f"SELECT is_visual FROM documents WHERE doc_id='{doc_id}' AND chunk_index={chunk_index}"
-        )
-        result = c.fetchone()
-        conn.close()
+        result = self._fetch_chunk_fields(doc_id, chunk_index, ["is_visual"])
         if result:
             return result[0]
         return None
-    
+
     def get_chunk_page_numbers(self, doc_id: str, chunk_index: int) -> Optional[tuple[int, int]]:
         # Retrieve the chunk page numbers from the sqlite table
-        conn = sqlite3.connect(os.path.join(self.db_path, f"{self.kb_id}.db"))
-        c = conn.cursor()
-        c.execute(
-            f"SELECT chunk_page_start, chunk_page_end FROM documents WHERE doc_id='{doc_id}' AND chunk_index={chunk_index}"
-        )
-        result = c.fetchone()
-        conn.close()
+        result = self._fetch_chunk_fields(doc_id, chunk_index, ["chunk_page_start", "chunk_page_end"])
         if result:
             return result
         return None, None
 
-    def get_document_title(self, doc_id: str, chunk_index: int) -> Optional[str]:
-        # Retrieve the document title from the sqlite table
-        conn = sqlite3.connect(os.path.join(self.db_path, f"{self.kb_id}.db"))
-        c = conn.cursor()
-        c.execute(
-            f"SELECT document_title FROM documents WHERE doc_id='{doc_id}' AND chunk_index={chunk_index}"
-        )
-        result = c.fetchone()
-        conn.close()
+    def _fetch_document_field(self, doc_id: str, field: str) -> Optional[str]:
+        with self.get_connection() as conn:
+            c = conn.cursor()
+            c.execute(f"SELECT {field} FROM document_info WHERE doc_id=?", (doc_id,))
+            result = c.fetchone()
         if result:
             return result[0]
         return None
 
+    def get_document_title(self, doc_id: str, chunk_index: int) -> Optional[str]:
+        # The title is stored once per document, so it's the same for every chunk
+        return self._fetch_document_field(doc_id, "document_title")
+
     def get_document_summary(self, doc_id: str, chunk_index: int) -> Optional[str]:
-        # Retrieve the document summary from the sqlite table
-        conn = sqlite3.connect(os.path.join(self.db_path, f"{self.kb_id}.db"))
-        c = conn.cursor()
-        c.execute(
-            f"SELECT document_summary FROM documents WHERE doc_id='{doc_id}' AND chunk_index={chunk_index}"
-        )
-        result = c.fetchone()
-        conn.close()
-        if result:
-            return result[0]
-        return None
+        # The summary is stored once per document, so it's the same for every chunk
+        return self._fetch_document_field(doc_id, "document_summary")
 
     def get_section_title(self, doc_id: str, chunk_index: int) -> Optional[str]:
         # Retrieve the section title from the sqlite table
-        conn = sqlite3.connect(os.path.join(self.db_path, f"{self.kb_id}.db"))
-        c = conn.cursor()
-        c.execute(
-            f"SELECT section_title FROM documents WHERE doc_id='{doc_id}' AND chunk_index={chunk_index}"
-        )
-        result = c.fetchone()
-        conn.close()
+        result = self._fetch_chunk_fields(doc_id, chunk_index, ["section_title"])
         if result:
             return result[0]
         return None
 
     def get_section_summary(self, doc_id: str, chunk_index: int) -> Optional[str]:
         # Retrieve the section summary from the sqlite table
-        conn = sqlite3.connect(os.path.join(self.db_path, f"{self.kb_id}.db"))
-        c = conn.cursor()
-        c.execute(
-            f"SELECT section_summary FROM documents WHERE doc_id='{doc_id}' AND chunk_index={chunk_index}"
-        )
-        result = c.fetchone()
-        conn.close()
+        result = self._fetch_chunk_fields(doc_id, chunk_index, ["section_summary"])
         if result:
             return result[0]
         return None
 
     def get_all_doc_ids(self, supp_id: Optional[str] = None) -> list[str]:
         # Retrieve all document IDs from the sqlite table
-        conn = sqlite3.connect(os.path.join(self.db_path, f"{self.kb_id}.db"))
-        c = conn.cursor()
-        query_statement = "SELECT DISTINCT doc_id FROM documents"
-        if supp_id:
-            query_statement += f" WHERE supp_id='{supp_id}'"
-        c.execute(query_statement)
-        results = c.fetchall()
-        conn.close()
+        with self.get_connection() as conn:
+            c = conn.cursor()
+            if supp_id:
+                c.execute("SELECT doc_id FROM document_info WHERE supp_id=?", (supp_id,))
+            else:
+                c.execute("SELECT doc_id FROM document_info")
+            results = c.fetchall()
         return [result[0] for result in results]
-    
+
+    def has_document(self, doc_id: str) -> bool:
+        with self.get_connection() as conn:
+            c = conn.cursor()
+            c.execute("SELECT 1 FROM document_info WHERE doc_id=? LIMIT 1", (doc_id,))
+            return c.fetchone() is not None
+
+    def get_existing_doc_ids(self, doc_ids: list[str]) -> set[str]:
+        doc_ids = list(doc_ids)
+        existing_doc_ids = set()
+        with self.get_connection() as conn:
+            c = conn.cursor()
+            # Older SQLite versions allow at most 999 parameters per statement, so long lists are split up
+            for i in range(0, len(doc_ids), MAX_QUERY_PARAMETERS):
+                batch = doc_ids[i:i + MAX_QUERY_PARAMETERS]
+                c.execute(
+                    f"SELECT doc_id FROM document_info WHERE doc_id IN ({', '.join(['?'] * len(batch))})",
+                    batch,
+                )
+                existing_doc_ids.update(result[0] for result in c.fetchall())
+        return existing_doc_ids
+
     def get_document_count(self) -> int:
-        # Retrieve the number of documents in the sqlite table
-        conn = sqlite3.connect(os.path.join(self.db_path, f'{self.kb_id}.db'))
-        c = conn.cursor()
-        c.execute(f"SELECT COUNT(DISTINCT doc_id) FROM documents")
-        result = c.fetchone()
-        conn.close()
-        if result is None:
-            return 0
-        return result[0]
+        return self.get_stats()["num_documents"]
 
     def get_total_num_characters(self) -> int:
-        # Retrieve the total number of characters in the sqlite table
-        conn = sqlite3.connect(os.path.join(self.db_path, f'{self.kb_id}.db'))
-        c = conn.cursor()
-        c.execute(f"SELECT SUM(chunk_length) FROM documents")
-        result = c.fetchone()
-        conn.close()
-        if result is None or result[0] is None:
-            return 0
-        return result[0]
+        return self.get_stats()["num_characters"]
+
+    def get_stats(self) -> ChunkDBStats:
+        # The counters are maintained by add_document and remove_document
+        with self.get_connection() as conn:
+            c = conn.cursor()
+            num_documents, num_chunks, num_characters = c.execute(
+                "SELECT num_documents, num_chunks, num_characters FROM kb_stats WHERE id = 0"
+            ).fetchone()
+            supp_id_counts = dict(c.execute("SELECT supp_id, num_documents FROM supp_id_stats").fetchall())
+        return ChunkDBStats(
+            num_documents=num_documents,
+            num_chunks=num_chunks,
+            num_characters=num_characters,
+            supp_id_counts=supp_id_counts,
+        )
 
     def delete(self) -> None:
-        # Delete the sqlite database
-        if os.path.exists(os.path.join(self.db_path, f"{self.kb_id}.db")):
-            os.remove(os.path.join(self.db_path, f"{self.kb_id}.db"))
+        # Delete the sqlite database, along with its WAL files
+        self._close_connections()
+        for suffix in ["", "-wal", "-shm"]:
+            path = os.path.join(self.db_path, f"{self.kb_id}.db{suffix}")
+            if os.path.exists(path):
+                os.remove(path)
 
     def to_dict(self) -> dict[str, str]:
         return {
             **super().to_dict(),
             "kb_id": self.kb_id,
             "storage_directory": self.storage_directory,
+            "compression": self.compression,
+            "compression_dictionary": self.compression_dictionary,
         }
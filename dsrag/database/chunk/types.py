@@ -11,3 +11,10 @@ class FormattedDocument(TypedDict):
     supp_id: Optional[str]
     metadata: Optional[dict]
     chunk_count: int
+
+class ChunkDBStats(TypedDict):
+    num_documents: int
+    num_chunks: int
+    num_characters: int
+    # Number of documents with each (non-empty) supp_id
+    supp_id_counts: dict[str, int]
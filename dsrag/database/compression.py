@@ -0,0 +1,118 @@
+import threading
+from typing import Iterable, Optional, Union
+
+from dsrag.utils.imports import LazyLoader
+
+# Lazy load zstandard
+zstandard = LazyLoader("zstandard")
+
+COMPRESSION_METHODS = ["zstd"]
+
+
+def validate_compression(compression: Optional[str]) -> None:
+    if compression is not None and compression not in COMPRESSION_METHODS:
+        raise ValueError(f"Unsupported compression: {compression}")
+
+
+class TextCodec:
+    """
+    zstd codec for chunk text, used by the chunk and vector databases when compression is enabled.
+
+    Compressed text is stored as bytes, so values written before compression was enabled (plain strings)
+    are still read as they are. Chunks are short, so they compress much better with a dictionary: with
+    train_dictionary, the texts passed to add_training_samples are collected until there are
+    num_training_samples of them, and a dictionary is trained on them. The caller persists the dictionary
+    and passes it back with load_dictionary when the database is reopened. Each compressed value records
+    the id of the dictionary it was compressed with (0 if none), so values compressed before the dictionary
+    was trained stay readable.
+    """
+
+    def __init__(
+        self,
+        level: int = 3,
+        train_dictionary: bool = False,
+        dictionary_size: int = 32 * 1024,
+        num_training_samples: int = 1000,
+    ) -> None:
+        self.level = level
+        self.train_dictionary = train_dictionary
+        self.dictionary_size = dictionary_size
+        self.num_training_samples = num_training_samples
+        self._lock = threading.Lock()
+        self._training_samples: list[bytes] = []
+        # dict_id -> dictionary, and the id of the one new values are compressed with
+        self._dictionaries: dict[int, "zstandard.ZstdCompressionDict"] = {}
+        self._dictionary_id = 0
+        # zstd compressors and decompressors aren't thread-safe, so each thread keeps its own
+        self._local = threading.local()
+
+    @property
+    def has_dictionary(self) -> bool:
+        return self._dictionary_id != 0
+
+    @property
+    def dictionary(self) -> Optional[bytes]:
+        """The dictionary new values are compressed with, or None if there isn't one."""
+        compression_dict = self._dictionaries.get(self._dictionary_id)
+        return compression_dict.as_bytes() if compression_dict is not None else None
+
+    @staticmethod
+    def parse_dictionary(dictionary: bytes) -> "zstandard.ZstdCompressionDict":
+        return zstandard.ZstdCompressionDict(dictionary)
+
+    def load_dictionary(self, dictionary: bytes) -> None:
+        """Load a trained dictionary. New values are compressed with the dictionary loaded last."""
+        compression_dict = self.parse_dictionary(dictionary)
+        with self._lock:
+            self._dictionaries[compression_dict.dict_id()] = compression_dict
+            self._dictionary_id = compression_dict.dict_id()
+            self._training_samples = []
+
+    def add_training_samples(self, texts: Iterable[str]) -> Optional[bytes]:
+        """
+        Collect texts to train the dictionary on. Returns the trained dictionary (which the caller should
+        persist) once there are enough samples, and None otherwise.
+        """
+        if not self.train_dictionary or self.has_dictionary:
+            return None
+        with self._lock:
+            self._training_samples += [text.encode("utf-8") for text in texts if text]
+            if len(self._training_samples) < self.num_training_samples:
+                return None
+            samples, self._training_samples = self._training_samples, []
+        try:
+            dictionary = zstandard.train_dictionary(self.dictionary_size, samples).as_bytes()
+        except zstandard.ZstdError:
+            # Not enough distinct content to train on; keep compressing without a dictionary
+            return None
+        self.load_dictionary(dictionary)
+        return dictionary
+
+    def _get_compressor(self) -> "zstandard.ZstdCompressor":
+        compressors = self._local.__dict__.setdefault("compressors", {})
+        dictionary_id = self._dictionary_id
+        if dictionary_id not in compressors:
+            compressors[dictionary_id] = zstandard.ZstdCompressor(
+                level=self.level, dict_data=self._dictionaries.get(dictionary_id)
+            )
+        return compressors[dictionary_id]
+
+    def _get_decompressor(self, dictionary_id: int) -> "zstandard.ZstdDecompressor":
+        decompressors = self._local.__dict__.setdefault("decompressors", {})
+        if dictionary_id not in decompressors:
+            if dictionary_id and dictionary_id not in self._dictionaries:
+                raise ValueError(f"Missing compression dictionary {dictionary_id}")
+            decompressors[dictionary_id] = zstandard.ZstdDecompressor(
+                dict_data=self._dictionaries.get(dictionary_id)
+            )
+        return decompressors[dictionary_id]
+
+    def compress(self, text: str) -> bytes:
+        return self._get_compressor().compress(text.encode("utf-8"))
+
+    def decompress(self, data: Union[bytes, str, None]) -> Optional[str]:
+        """Decompress a value written by compress. Plain strings (and None) are returned as they are."""
+        if not isinstance(data, bytes):
+            return data
+        dictionary_id = zstandard.get_frame_parameters(data).dict_id
+        return self._get_decompressor(dictionary_id).decompress(data).decode("utf-8")
@@ -0,0 +1,156 @@
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, Sequence
+
+from dsrag.utils.imports import LazyLoader
+
+# Lazy load PostgreSQL dependencies
+psycopg2 = LazyLoader("psycopg2", "psycopg2-binary")
+
+
+class PostgresConnectionPool:
+    """
+    Thread-safe pool of Postgres connections, owned by a PostgresChunkDB or PostgresVectorDB.
+
+    Connections are opened lazily, up to max_connections at a time; threads that need a connection while
+    all of them are checked out wait for one to be returned. Up to min_connections idle connections are kept
+    open between calls, so most calls don't pay for a new TCP connection and authentication.
+
+    Checkouts are re-entrant: nested connection() blocks in the same thread share the outer block's
+    connection, so several calls can be grouped onto one connection (and one transaction). The transaction
+    is committed when the outermost block exits, or rolled back if it raised.
+    """
+
+    def __init__(
+        self,
+        min_connections: int = 1,
+        max_connections: int = 10,
+        connect: Optional[Callable[[], Any]] = None,
+        on_connect: Optional[Callable[[Any], None]] = None,
+        **connect_kwargs,
+    ) -> None:
+        if min_connections < 0:
+            raise ValueError("min_connections must be non-negative")
+        if max_connections < 1 or max_connections < min_connections:
+            raise ValueError("max_connections must be at least 1 and at least min_connections")
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self._connect = connect or (lambda: psycopg2.connect(**connect_kwargs))
+        self._on_connect = on_connect
+        self._condition = threading.Condition()
+        self._idle: list[Any] = []
+        self._num_open = 0
+        self._local = threading.local()
+        # Names of the statements prepared on each connection
+        self._prepared: "weakref.WeakKeyDictionary[Any, set[str]]" = weakref.WeakKeyDictionary()
+        # Incremented by close(), so connections that were checked out at the time aren't reused
+        self._generation = 0
+        self._connection_generations: "weakref.WeakKeyDictionary[Any, int]" = weakref.WeakKeyDictionary()
+
+    def _open_connection(self) -> Any:
+        conn = self._connect()
+        if self._on_connect is not None:
+            try:
+                self._on_connect(conn)
+            except Exception:
+                # The connection isn't tracked yet, so nothing else would close it
+                conn.close()
+                raise
+        with self._condition:
+            self._connection_generations[conn] = self._generation
+        return conn
+
+    def _checkout(self) -> Any:
+        with self._condition:
+            while True:
+                while self._idle:
+                    conn = self._idle.pop()
+                    if not conn.closed:
+                        return conn
+                    # The server closed this connection while it was idle
+                    self._num_open -= 1
+                if self._num_open < self.max_connections:
+                    self._num_open += 1
+                    break
+                self._condition.wait()
+        try:
+            return self._open_connection()
+        except Exception:
+            with self._condition:
+                self._num_open -= 1
+                self._condition.notify()
+            raise
+
+    def _release(self, conn: Any, discard: bool = False) -> None:
+        with self._condition:
+            # Keep at most min_connections idle connections open (at least one, so back to back calls
+            # from a single thread never reconnect)
+            discard = (
+                discard
+                or conn.closed
+                or self._connection_generations.get(conn) != self._generation
+                or len(self._idle) >= max(self.min_connections, 1)
+            )
+            if discard:
+                self._num_open -= 1
+            else:
+                self._idle.append(conn)
+            self._condition.notify()
+        if discard:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """Check out a connection for the duration of the with block."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            # Nested checkout in the same thread
+            yield conn
+            return
+
+        conn = self._checkout()
+        self._local.conn = conn
+        discard = False
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except Exception:
+                # The connection is broken, e.g. because the server went away
+                discard = True
+            raise
+        finally:
+            self._local.conn = None
+            self._release(conn, discard=discard)
+
+    def execute_prepared(self, cursor: Any, name: str, statement: str, params: Sequence[Any]) -> None:
+        """
+        Execute a statement as a server-side prepared statement, preparing it first if this is the first
+        time the cursor's connection runs it. The statement uses $1, $2, ... placeholders.
+        """
+        prepared = self._prepared.setdefault(cursor.connection, set())
+        if name not in prepared:
+            cursor.execute(f"PREPARE {name} AS {statement}")
+            prepared.add(name)
+        if params:
+            cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", tuple(params))
+        else:
+            cursor.execute(f"EXECUTE {name}")
+
+    def close(self) -> None:
+        """Close the idle connections. Connections that are checked out are closed when they're returned."""
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._num_open -= len(idle)
+            self._generation += 1
+        for conn in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
@@ -1,23 +1,209 @@
+import base64
+import operator
 import pickle
 from dsrag.database.vector.db import VectorDB
-from typing import Sequence, Optional
-from dsrag.database.vector.types import ChunkMetadata, Vector, VectorSearchResult
-from sklearn.metrics.pairwise import cosine_similarity
+from typing import Any, Sequence, Optional
+from dsrag.database.vector.types import ChunkMetadata, MetadataFilter, Vector, VectorSearchResult
+from dsrag.database.vector.memmap_storage import MemmapVectorStorage, MemmapMetadataView
+from dsrag.database.vector.quantization import QUANTIZATION_METHODS, QuantizedVectors
+from dsrag.database.vector.ivf_index import IVFIndex, MAX_TRAINING_ROWS_PER_LIST, MIN_ROWS_PER_LIST
+from dsrag.database.compression import TextCodec, validate_compression
 import os
 import numpy as np
 from dsrag.utils.imports import faiss
 
 
+# Comparison used by each MetadataFilter operator; the not_* operators negate their positive counterpart
+FILTER_OPERATORS = {
+    "equals": operator.eq,
+    "not_equals": operator.eq,
+    "in": None,
+    "not_in": None,
+    "greater_than": operator.gt,
+    "less_than": operator.lt,
+    "greater_than_equals": operator.ge,
+    "less_than_equals": operator.le,
+}
+
+# Below this fraction of eligible rows, only the eligible rows are scored instead of masking a full scan
+SELECTIVE_FILTER_FRACTION = 0.2
+
+# Metadata key the compressed chunk text is stored under, in place of chunk_text
+COMPRESSED_CHUNK_TEXT_KEY = "chunk_text_zstd"
+
+
+def build_metadata_column(values: list) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Convert the values of one metadata field into a typed column and a mask of the rows where the field
+    is present. Numeric fields become float64 arrays and string fields become unicode arrays, so filters
+    on them are evaluated with vectorized numpy comparisons; anything else falls back to an object array.
+    """
+    present = np.fromiter((value is not None for value in values), dtype=bool, count=len(values))
+    present_values = [value for value in values if value is not None]
+    if all(isinstance(value, (int, float)) for value in present_values):
+        column = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    elif all(isinstance(value, str) for value in present_values):
+        column = np.array(["" if value is None else value for value in values], dtype=str)
+    else:
+        column = np.empty(len(values), dtype=object)
+        for i, value in enumerate(values):
+            column[i] = value
+    return column, present
+
+
+def _is_comparable(column: np.ndarray, value: Any) -> bool:
+    if column.dtype == np.float64:
+        return isinstance(value, (int, float)) and not isinstance(value, str)
+    if column.dtype.kind == "U":
+        return isinstance(value, str)
+    return True
+
+
+def _compare_objects(compare, left, right) -> bool:
+    try:
+        return bool(compare(left, right))
+    except TypeError:
+        return False
+
+
+def get_metadata_filter_mask(
+    column: np.ndarray, present: np.ndarray, metadata_filter: MetadataFilter
+) -> np.ndarray:
+    """Evaluate a MetadataFilter against a column built by build_metadata_column."""
+    filter_operator = metadata_filter["operator"]
+    value = metadata_filter["value"]
+    if filter_operator not in FILTER_OPERATORS:
+        raise ValueError(f"Unsupported operator: {filter_operator}")
+
+    if filter_operator in ["in", "not_in"]:
+        values = [v for v in (value if isinstance(value, list) else [value]) if _is_comparable(column, v)]
+        if not values:
+            matches = np.zeros(len(column), dtype=bool)
+        elif column.dtype == object:
+            matches = np.fromiter(
+                (any(_compare_objects(operator.eq, item, v) for v in values) for item in column),
+                dtype=bool,
+                count=len(column),
+            )
+        else:
+            matches = np.isin(column, np.array(values, dtype=column.dtype))
+    else:
+        compare = FILTER_OPERATORS[filter_operator]
+        if not _is_comparable(column, value):
+            matches = np.zeros(len(column), dtype=bool)
+        elif column.dtype == object:
+            matches = np.fromiter(
+                (_compare_objects(compare, item, value) for item in column),
+                dtype=bool,
+                count=len(column),
+            )
+        else:
+            matches = compare(column, value)
+
+    # Like SQL, rows where the field is missing never match, not even the negated operators
+    if filter_operator.startswith("not_"):
+        return present & ~matches
+    return present & matches
+
+
 class BasicVectorDB(VectorDB):
+    """
+    Local vector database that keeps everything on disk under storage_directory.
+
+    Two storage formats are supported:
+    - "pickle" (default): vectors and metadata are pickled together into a single file.
+    - "memmap": vectors are stored as float32 segment files that are memory-mapped on load and metadata
+      is kept in a SQLite sidecar, so large KBs load near-instantly and can be shared between processes.
+      Adding and removing documents only touches the affected rows; call compact() to merge segments and
+      reclaim the space used by removed documents.
+
+    With use_faiss=True, searches go through a persisted FAISS index that is updated incrementally as
+    vectors are added. faiss_index_type selects the index: "flat" (exact inner product), "ivf" (inverted
+    file, tuned with faiss_nlist and faiss_nprobe, and retrained as the KB grows) or "hnsw" (graph index,
+    tuned with faiss_hnsw_m and faiss_ef_search).
+
+    Metadata filters are evaluated against column arrays built from the stored metadata (and cached per
+    field), and only the rows that pass the filter are scored.
+
+    With quantization="int8" or "binary", and/or truncate_dimension set, exact searches run in two stages.
+    The first stage scans a compact copy of the vectors: quantized (4x or 32x smaller than float32) and/or
+    truncated to their first truncate_dimension dimensions (Matryoshka-style). The second stage rescores the
+    best top_k * rescore_oversample candidates with the full-precision vectors. The compact copy is kept in
+    memory and persisted next to the vector storage; combined with storage_format="memmap", the full-precision
+    vectors only need to be paged in for the rows that get rescored.
+
+    With ivf_nlist set, searches use an inverted file index that doesn't need faiss: the vectors are
+    clustered with k-means into up to ivf_nlist clusters and only the ivf_nprobe clusters closest to the
+    query are scored (combined with the two-stage search if that's enabled). New vectors are assigned to
+    the existing clusters, and the clusters are retrained whenever the KB has doubled in size.
+
+    With compression="zstd", the chunk_text in the stored metadata is zstd-compressed (see TextCodec) and
+    decompressed when search results are built. With compression_dictionary, a dictionary is trained on the
+    first chunks added and persisted next to the vector storage.
+    """
+
     def __init__(
-        self, kb_id: str, storage_directory: str = "~/dsRAG", use_faiss: bool = False
+        self,
+        kb_id: str,
+        storage_directory: str = "~/dsRAG",
+        use_faiss: bool = False,
+        storage_format: str = "pickle",
+        faiss_index_type: str = "flat",
+        faiss_nlist: int = 1024,
+        faiss_nprobe: int = 16,
+        faiss_hnsw_m: int = 32,
+        faiss_ef_search: int = 128,
+        quantization: Optional[str] = None,
+        truncate_dimension: Optional[int] = None,
+        rescore_oversample: int = 4,
+        ivf_nlist: Optional[int] = None,
+        ivf_nprobe: int = 8,
+        compression: Optional[str] = None,
+        compression_dictionary: bool = False,
     ) -> None:
+        validate_compression(compression)
+        if storage_format not in ["pickle", "memmap"]:
+            raise ValueError(f"Unsupported storage_format: {storage_format}")
+        if faiss_index_type not in ["flat", "ivf", "hnsw"]:
+            raise ValueError(f"Unsupported faiss_index_type: {faiss_index_type}")
+        if quantization is not None and quantization not in QUANTIZATION_METHODS:
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        if truncate_dimension is not None and truncate_dimension < 1:
+            raise ValueError("truncate_dimension must be at least 1")
+        if (quantization is not None or truncate_dimension is not None) and use_faiss:
+            raise ValueError("quantization and truncate_dimension are not supported with use_faiss")
+        if ivf_nlist is not None and ivf_nlist < 1:
+            raise ValueError("ivf_nlist must be at least 1")
+        if ivf_nlist is not None and use_faiss:
+            raise ValueError("ivf_nlist is not supported with use_faiss, use faiss_index_type='ivf' instead")
+        if rescore_oversample < 1:
+            raise ValueError("rescore_oversample must be at least 1")
         self.kb_id = kb_id
         self.storage_directory = storage_directory
         self.use_faiss = use_faiss
-        self.vector_storage_path = os.path.join(
-            self.storage_directory, "vector_storage", f"{kb_id}.pkl"
-        )
+        self.storage_format = storage_format
+        self.faiss_index_type = faiss_index_type
+        self.faiss_nlist = faiss_nlist
+        self.faiss_nprobe = faiss_nprobe
+        self.faiss_hnsw_m = faiss_hnsw_m
+        self.faiss_ef_search = faiss_ef_search
+        self.quantization = quantization
+        self.truncate_dimension = truncate_dimension
+        self.rescore_oversample = rescore_oversample
+        self.ivf_nlist = ivf_nlist
+        self.ivf_nprobe = ivf_nprobe
+        self.compression = compression
+        self.compression_dictionary = compression_dictionary
+        # Used to read compressed metadata even if compression has since been turned off
+        self.codec = TextCodec(train_dictionary=compression_dictionary)
+        if self.storage_format == "memmap":
+            self.vector_storage_path = os.path.join(
+                self.storage_directory, "vector_storage", kb_id
+            )
+        else:
+            self.vector_storage_path = os.path.join(
+                self.storage_directory, "vector_storage", f"{kb_id}.pkl"
+            )
         self.load()
 
     def add_vectors(
@@ -29,92 +215,617 @@ class BasicVectorDB(VectorDB):
             raise ValueError(
                 "Error in add_vectors: the number of vectors and metadata items must be the same."
             )
-        self.vectors.extend(vectors)
-        self.metadata.extend(metadata)
+        if self.compression:
+            metadata = self._compress_metadata(metadata)
+        if self.storage_format == "memmap":
+            if len(vectors) == 0:
+                return
+            generation = self.storage.generation
+            self.storage.add(self._normalize(vectors), metadata)
+            if generation is not None and generation != self.storage.generation:
+                # The add triggered a compaction, which renumbers the rows
+                self._metadata_columns = {}
+        else:
+            self.vectors.extend(vectors)
+            self.metadata.extend(metadata)
+            self._normalized_vectors = None
+        for field, values in self._metadata_columns.items():
+            values.extend(item.get(field) for item in metadata)
+        self._typed_metadata_columns = {}
+        if self.use_faiss:
+            # Bring the index up to date with the new rows before it's persisted
+            try:
+                self._get_faiss_index()
+            except ImportError as e:
+                print(f"Could not update the faiss index: {e}")
+        if self._uses_two_stage_search():
+            self._get_quantized_vectors()
+        if self.ivf_nlist is not None:
+            self._get_ivf_index()
         self.save()
 
-    def search(self, query_vector, top_k=10, metadata_filter: Optional[dict] = None) -> list[VectorSearchResult]:
-        if not self.vectors:
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        """Convert vectors to a 2D float32 array with unit L2 norm (zero vectors are left as is)."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def search(self, query_vector, top_k=10, metadata_filter: Optional[MetadataFilter] = None) -> list[VectorSearchResult]:
+        return self.search_many([query_vector], top_k, metadata_filter)[0]
+
+    def search_many(
+        self, query_vectors, top_k=10, metadata_filter: Optional[MetadataFilter] = None
+    ) -> list[list[VectorSearchResult]]:
+        """
+        Search for several query vectors at once. The queries are scored together with one matrix-matrix
+        product per segment (or one batched faiss search), and the filter mask is only built once.
+        """
+        if len(query_vectors) == 0:
             return []
+        if self._num_vectors() == 0:
+            return [[] for _ in query_vectors]
+
+        mask = self._get_search_mask(metadata_filter)
+        if mask is not None and not mask.any():
+            return [[] for _ in query_vectors]
 
+        queries = self._normalize(query_vectors)
         if self.use_faiss:
             try:
-                return self.search_faiss(query_vector, top_k)
+                return self._search_faiss_many(queries, top_k, mask)
             except Exception as e:
                 print(f"Faiss search failed: {e}. Falling back to numpy search.")
-                return self._fallback_search(query_vector, top_k)
-        else:
-            return self._fallback_search(query_vector, top_k)
+        return self._fallback_search(queries, top_k, mask)
 
-    def _fallback_search(self, query_vector, top_k=10) -> list[VectorSearchResult]:
-        """Fallback search method using numpy when faiss is not available."""
-        similarities = cosine_similarity([query_vector], self.vectors)[0]
-        indexed_similarities = sorted(
-            enumerate(similarities), key=lambda x: x[1], reverse=True
+    def _get_search_mask(self, metadata_filter: Optional[MetadataFilter]) -> Optional[np.ndarray]:
+        """Boolean mask of the rows a search may return, or None if every stored row is eligible."""
+        mask = self._get_live_mask()
+        if metadata_filter:
+            column, present = self._get_metadata_column(metadata_filter["field"])
+            filter_mask = get_metadata_filter_mask(column, present, metadata_filter)
+            mask = filter_mask if mask is None else mask & filter_mask
+        return mask
+
+    def _get_metadata_column(self, field: str) -> tuple[np.ndarray, np.ndarray]:
+        """The typed column for a metadata field. Raw values are cached and extended as vectors are added."""
+        if field not in self._typed_metadata_columns:
+            if field not in self._metadata_columns:
+                if self.storage_format == "memmap":
+                    self._metadata_columns[field] = self.storage.get_metadata_field(field)
+                else:
+                    self._metadata_columns[field] = [item.get(field) for item in self.metadata]
+            self._typed_metadata_columns[field] = build_metadata_column(self._metadata_columns[field])
+        return self._typed_metadata_columns[field]
+
+    def _fallback_search(self, queries: np.ndarray, top_k=10, mask: Optional[np.ndarray] = None) -> list[list[VectorSearchResult]]:
+        """Exact search using numpy when faiss is not available or not enabled."""
+        # Stored vectors and queries are normalized, so cosine similarity is one BLAS matmul per segment
+        if mask is not None:
+            num_eligible = int(mask.sum())
+            if num_eligible < SELECTIVE_FILTER_FRACTION * len(mask):
+                # Selective filter: only score the eligible rows
+                row_ids = np.flatnonzero(mask)
+                similarities = self._score_rows(row_ids, queries)
+                indices = [self._top_k_indices(row, min(top_k, num_eligible)) for row in similarities]
+                return self._build_results_many(
+                    [row_ids[i] for i in indices],
+                    [row[i] for row, i in zip(similarities, indices)],
+                )
+        else:
+            num_eligible = self._num_vectors()
+        if self.ivf_nlist is not None:
+            ivf_index = self._get_ivf_index()
+            if ivf_index is not None:
+                return self._ivf_search(ivf_index, queries, top_k, mask)
+        if self._uses_two_stage_search():
+            return self._quantized_search(queries, top_k, mask, num_eligible)
+        # One row of similarities per query
+        similarities = np.concatenate(
+            [queries @ vectors.T for _, vectors in self._get_segments()], axis=1
         )
-        results: list[VectorSearchResult] = []
-        for i, similarity in indexed_similarities[:top_k]:
-            result = VectorSearchResult(
-                doc_id=None,
-                vector=None,
-                metadata=self.metadata[i],
-                similarity=similarity,
-            )
-            results.append(result)
+        if mask is not None:
+            similarities[:, ~mask] = -np.inf
+        indices = [self._top_k_indices(row, min(top_k, num_eligible)) for row in similarities]
+        return self._build_results_many(
+            indices, [row[i] for row, i in zip(similarities, indices)]
+        )
+
+    def _quantized_search(
+        self, queries: np.ndarray, top_k: int, mask: Optional[np.ndarray], num_eligible: int
+    ) -> list[list[VectorSearchResult]]:
+        """Shortlist candidates with the quantized or truncated vectors, then rescore them with the full vectors."""
+        approximate_scores = self._get_quantized_vectors().scores(queries)
+        if mask is not None:
+            approximate_scores[:, ~mask] = -np.inf
+        num_candidates = min(top_k * self.rescore_oversample, num_eligible)
+        all_indices, all_similarities = [], []
+        for query, query_scores in zip(queries, approximate_scores):
+            candidates = np.sort(self._top_k_indices(query_scores, num_candidates))
+            similarities = self._score_rows(candidates, query[None, :])[0]
+            indices = self._top_k_indices(similarities, min(top_k, num_candidates))
+            all_indices.append(candidates[indices])
+            all_similarities.append(similarities[indices])
+        return self._build_results_many(all_indices, all_similarities)
+
+    def _ivf_search(
+        self, ivf_index: IVFIndex, queries: np.ndarray, top_k: int, mask: Optional[np.ndarray]
+    ) -> list[list[VectorSearchResult]]:
+        """Score only the rows in the clusters closest to each query."""
+        all_indices, all_similarities = [], []
+        for query in queries:
+            candidates = ivf_index.probe(query, self.ivf_nprobe, mask, min_rows=top_k)
+            if self._uses_two_stage_search() and len(candidates) > top_k * self.rescore_oversample:
+                approximate_scores = self._get_quantized_vectors().scores(query[None, :], candidates)[0]
+                candidates = np.sort(
+                    candidates[self._top_k_indices(approximate_scores, top_k * self.rescore_oversample)]
+                )
+            if len(candidates) == 0:
+                all_indices.append(candidates)
+                all_similarities.append(np.zeros(0, dtype=np.float32))
+                continue
+            similarities = self._score_rows(candidates, query[None, :])[0]
+            indices = self._top_k_indices(similarities, min(top_k, len(candidates)))
+            all_indices.append(candidates[indices])
+            all_similarities.append(similarities[indices])
+        return self._build_results_many(all_indices, all_similarities)
+
+    def _get_rows(self, row_ids: np.ndarray) -> np.ndarray:
+        """The normalized vectors of the given (sorted) rows, reading only those rows."""
+        rows = []
+        for start_row, vectors in self._get_segments():
+            lo, hi = np.searchsorted(row_ids, [start_row, start_row + vectors.shape[0]])
+            if lo < hi:
+                rows.append(vectors[row_ids[lo:hi] - start_row])
+        return np.concatenate(rows)
+
+    def _score_rows(self, row_ids: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """Similarities of the given (sorted) rows to each query, reading only those rows."""
+        similarities = []
+        for start_row, vectors in self._get_segments():
+            lo, hi = np.searchsorted(row_ids, [start_row, start_row + vectors.shape[0]])
+            if lo < hi:
+                similarities.append(queries @ vectors[row_ids[lo:hi] - start_row].T)
+        return np.concatenate(similarities, axis=1)
+
+    @staticmethod
+    def _top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+        """Indices of the top_k highest scores, sorted from highest to lowest."""
+        if top_k <= 0:
+            return np.array([], dtype=np.int64)
+        if top_k < len(scores):
+            candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            candidates = np.arange(len(scores))
+        return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+    def _build_results(self, indices, similarities) -> list[VectorSearchResult]:
+        return self._build_results_many([indices], [similarities])[0]
+
+    def _build_results_many(self, indices, similarities) -> list[list[VectorSearchResult]]:
+        """Build the results of several queries, fetching the metadata of all their rows in one go."""
+        all_indices = np.concatenate(indices) if indices else np.array([], dtype=np.int64)
+        all_metadata = iter(self._get_metadata(all_indices))
+        results: list[list[VectorSearchResult]] = []
+        for query_similarities in similarities:
+            query_results: list[VectorSearchResult] = []
+            for similarity in query_similarities:
+                result = VectorSearchResult(
+                    doc_id=None,
+                    vector=None,
+                    metadata=next(all_metadata),
+                    similarity=float(similarity),
+                )
+                query_results.append(result)
+            results.append(query_results)
         return results
 
-    def search_faiss(self, query_vector, top_k=10) -> list[VectorSearchResult]:
+    def _get_segments(self) -> list[tuple[int, np.ndarray]]:
+        """
+        The normalized float32 vectors as (start_row, matrix) pairs. In pickle mode the normalized matrix
+        is built on first use and cached until the vectors change.
+        """
+        if self.storage_format == "memmap":
+            return self.storage.segments
+        if self._normalized_vectors is None or len(self._normalized_vectors) != len(self.vectors):
+            self._normalized_vectors = self._normalize(self.vectors)
+        return [(0, self._normalized_vectors)]
+
+    def _get_live_mask(self) -> Optional[np.ndarray]:
+        """Boolean mask of the rows that haven't been removed, or None if all rows are live."""
+        if self.storage_format == "memmap":
+            return self.storage.live_mask
+        return None
+
+    def _num_vectors(self) -> int:
+        if self.storage_format == "memmap":
+            return len(self.storage)
+        return len(self.vectors)
+
+    def get_num_vectors(self) -> Optional[int]:
+        return self._num_vectors()
+
+    def _get_metadata(self, indices) -> list[ChunkMetadata]:
+        if self.storage_format == "memmap":
+            metadata = self.storage.get_metadata(indices)
+        else:
+            metadata = [self.metadata[i] for i in indices]
+        return [self._decompress_metadata(item) for item in metadata]
+
+    def _get_compression_dictionary_path(self) -> str:
+        if self.storage_format == "memmap":
+            return os.path.join(self.vector_storage_path, "compression.dict")
+        return os.path.join(self.storage_directory, "vector_storage", f"{self.kb_id}.compression.dict")
+
+    def _compress_metadata(self, metadata: Sequence[ChunkMetadata]) -> list[ChunkMetadata]:
+        self.codec.add_training_samples(item.get("chunk_text") or "" for item in metadata)
+        path = self._get_compression_dictionary_path()
+        # Written once the dictionary is trained, and again if it has been removed since (delete() removes it,
+        # and so does compacting the memmap storage once every row has been removed)
+        if self.codec.has_dictionary and not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                f.write(self.codec.dictionary)
+            os.replace(path + ".tmp", path)
+        compressed = []
+        for item in metadata:
+            if isinstance(item.get("chunk_text"), str):
+                item = dict(item)
+                data = self.codec.compress(item.pop("chunk_text"))
+                # The memmap metadata is stored as JSON, which has no bytes type
+                item[COMPRESSED_CHUNK_TEXT_KEY] = (
+                    base64.b64encode(data).decode("ascii") if self.storage_format == "memmap" else data
+                )
+            compressed.append(item)
+        return compressed
+
+    def _decompress_metadata(self, item: ChunkMetadata) -> ChunkMetadata:
+        if COMPRESSED_CHUNK_TEXT_KEY not in item:
+            return item
+        item = dict(item)
+        data = item.pop(COMPRESSED_CHUNK_TEXT_KEY)
+        if isinstance(data, str):
+            data = base64.b64decode(data)
+        item["chunk_text"] = self.codec.decompress(data)
+        return item
+
+    def search_faiss(self, query_vector, top_k=10, mask: Optional[np.ndarray] = None) -> list[VectorSearchResult]:
+        return self._search_faiss_many(self._normalize(query_vector), top_k, mask)[0]
+
+    def _search_faiss_many(self, queries: np.ndarray, top_k=10, mask: Optional[np.ndarray] = None) -> list[list[VectorSearchResult]]:
+        if mask is not None and mask.sum() < SELECTIVE_FILTER_FRACTION * len(mask):
+            # Scoring a small subset exactly is both faster and more accurate than a filtered ANN search
+            return self._fallback_search(queries, top_k, mask)
+        index = self._get_faiss_index()
+
         # Limit top_k to the number of vectors we have - Faiss doesn't automatically handle this
-        top_k = min(top_k, len(self.vectors))
+        search_k = min(top_k, index.ntotal if mask is None else int(mask.sum()))
 
-        # faiss expects 2D arrays of vectors
-        vectors_array = (
-            np.array(self.vectors).astype("float32").reshape(len(self.vectors), -1)
+        # Removed or filtered-out rows are excluded inside faiss with a bitmap over the row numbers
+        selector = None
+        if mask is not None:
+            bitmap = np.packbits(mask, bitorder="little")
+            selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+        if self.faiss_index_type == "ivf":
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=self.faiss_nprobe)
+        elif self.faiss_index_type == "hnsw":
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=max(self.faiss_ef_search, search_k))
+        else:
+            params = faiss.SearchParameters(sel=selector)
+
+        # Stored vectors are normalized, so the inner products faiss returns are cosine similarities
+        D, I = index.search(np.ascontiguousarray(queries), search_k, params=params)
+        keep = I >= 0  # faiss pads with -1 when fewer than search_k results are found
+        return self._build_results_many(
+            [labels[k] for labels, k in zip(I, keep)],
+            [distances[k] for distances, k in zip(D, keep)],
         )
-        query_vector_array = np.array(query_vector).astype("float32").reshape(1, -1)
 
-        try:
-            # Access nested modules step by step
-            contrib = faiss.contrib
-            exhaustive_search = contrib.exhaustive_search
-            knn_func = exhaustive_search.knn
-            
-            _, I = knn_func(query_vector_array, vectors_array, top_k)
-        except AttributeError:
-            # If the nested module structure doesn't work, try direct import as a fallback
-            try:
-                from faiss.contrib.exhaustive_search import knn as direct_knn
-                _, I = direct_knn(query_vector_array, vectors_array, top_k)
-            except (ImportError, AttributeError):
-                # If both approaches fail, raise an error
-                raise ImportError(
-                    "Could not import faiss.contrib.exhaustive_search.knn. "
-                    "Please ensure faiss is installed correctly."
+    def _get_faiss_index_path(self) -> str:
+        if self.storage_format == "memmap":
+            # The generation is part of the name because compaction renumbers the rows
+            return os.path.join(
+                self.vector_storage_path, f"{self.faiss_index_type}.{self.storage.generation}.faiss"
+            )
+        return os.path.join(
+            self.storage_directory, "vector_storage", f"{self.kb_id}.{self.faiss_index_type}.faiss"
+        )
+
+    def _get_faiss_nlist(self, num_rows: int) -> int:
+        # Up to faiss_nlist clusters, but no fewer than MIN_ROWS_PER_LIST rows per cluster
+        return max(1, min(self.faiss_nlist, num_rows // MIN_ROWS_PER_LIST))
+
+    def _create_faiss_index(self, dimension: int, nlist: int):
+        if self.faiss_index_type == "ivf":
+            quantizer = faiss.IndexFlatIP(dimension)
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+            index.own_fields = True
+            quantizer.this.disown()
+            return index
+        if self.faiss_index_type == "hnsw":
+            return faiss.IndexIDMap(
+                faiss.IndexHNSWFlat(dimension, self.faiss_hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            )
+        return faiss.IndexIDMap(faiss.IndexFlatIP(dimension))
+
+    def _get_faiss_index(self):
+        """
+        Load the persisted faiss index, or build it if it doesn't exist yet, and add any rows it's missing.
+        Rows are labelled with their row number in the vector storage. An "ivf" index is rebuilt whenever the
+        KB has grown enough for twice as many clusters as it was trained with.
+        """
+        num_rows = self.storage.num_rows if self.storage_format == "memmap" else len(self.vectors)
+        index_path = self._get_faiss_index_path()
+        if self._faiss_index is not None and self._faiss_index_path != index_path:
+            self._faiss_index = None
+        if self._faiss_index is None and os.path.exists(index_path):
+            self._faiss_index = faiss.read_index(index_path)
+            self._faiss_index_path = index_path
+            self._faiss_index_dirty = False
+        if self._faiss_index is not None and (
+            self._faiss_index.ntotal > num_rows
+            or (self.faiss_index_type == "ivf" and self._get_faiss_nlist(num_rows) >= 2 * self._faiss_index.nlist)
+        ):
+            # The rows have been renumbered since the index was built, or the KB has outgrown the clusters
+            self._faiss_index = None
+
+        segments = self._get_segments()
+        if self._faiss_index is None:
+            nlist = self._get_faiss_nlist(num_rows)
+            # Train on (up to) the first MAX_TRAINING_ROWS_PER_LIST vectors per cluster
+            max_training_vectors = MAX_TRAINING_ROWS_PER_LIST * nlist
+            training_vectors = []
+            for _, vectors in segments:
+                training_vectors.append(vectors[: max_training_vectors - sum(map(len, training_vectors))])
+                if sum(map(len, training_vectors)) >= max_training_vectors:
+                    break
+            training_vectors = np.concatenate(training_vectors)
+            self._faiss_index = self._create_faiss_index(training_vectors.shape[1], nlist)
+            if not self._faiss_index.is_trained:
+                self._faiss_index.train(np.ascontiguousarray(training_vectors))
+            self._faiss_index_path = index_path
+            self._faiss_index_dirty = True
+
+        first_missing_row = self._faiss_index.ntotal
+        if first_missing_row < num_rows:
+            for start_row, vectors in segments:
+                end_row = start_row + vectors.shape[0]
+                if end_row <= first_missing_row:
+                    continue
+                offset = max(first_missing_row - start_row, 0)
+                self._faiss_index.add_with_ids(
+                    np.ascontiguousarray(vectors[offset:]),
+                    np.arange(start_row + offset, end_row, dtype=np.int64),
                 )
-                
-        # I is a list of indices in the corpus_vectors array
-        results: list[VectorSearchResult] = []
-        for i in I[0]:
-            result = VectorSearchResult(
-                doc_id=None,
-                vector=None,
-                metadata=self.metadata[i],
-                similarity=cosine_similarity([query_vector], [self.vectors[i]])[0][0],
+            self._faiss_index_dirty = True
+        return self._faiss_index
+
+    def _save_faiss_index(self) -> None:
+        if self._faiss_index is None or not self._faiss_index_dirty:
+            return
+        os.makedirs(os.path.dirname(self._faiss_index_path), exist_ok=True)
+        # Indexes from earlier generations or other index types are no longer valid
+        self._remove_index_files(".faiss", keep_path=self._faiss_index_path)
+        faiss.write_index(self._faiss_index, self._faiss_index_path + ".tmp")
+        os.replace(self._faiss_index_path + ".tmp", self._faiss_index_path)
+        self._faiss_index_dirty = False
+
+    def _delete_faiss_index(self) -> None:
+        self._faiss_index = None
+        if self.storage_format == "pickle":
+            self._remove_index_files(".faiss")
+
+    def _remove_index_files(self, suffix: str, keep_path: Optional[str] = None) -> None:
+        """
+        Remove this KB's index files with the given suffix (except keep_path). In memmap mode they live in
+        the KB's own directory; in pickle mode they sit next to the .pkl file, prefixed with the kb_id.
+        """
+        if self.storage_format == "memmap":
+            directory = self.vector_storage_path
+        else:
+            directory = os.path.join(self.storage_directory, "vector_storage")
+        if not os.path.exists(directory):
+            return
+        for file_name in os.listdir(directory):
+            path = os.path.join(directory, file_name)
+            if path != keep_path and file_name.endswith(suffix) and (
+                self.storage_format == "memmap" or file_name.startswith(f"{self.kb_id}.")
+            ):
+                os.remove(path)
+
+    def _uses_two_stage_search(self) -> bool:
+        return self.quantization is not None or self.truncate_dimension is not None
+
+    def _get_quantized_vectors_path(self) -> str:
+        name = self.quantization or "float32"
+        if self.truncate_dimension is not None:
+            name += f"_{self.truncate_dimension}"
+        if self.storage_format == "memmap":
+            return os.path.join(
+                self.vector_storage_path, f"{name}.{self.storage.generation}.codes.npz"
             )
-            results.append(result)
-        return results
+        return os.path.join(
+            self.storage_directory, "vector_storage", f"{self.kb_id}.{name}.codes.npz"
+        )
+
+    def _get_quantized_vectors(self) -> QuantizedVectors:
+        """
+        Load the persisted quantized vectors, or build them if they don't exist yet, and quantize any rows
+        they're missing. The int8 scale is refit whenever the number of rows has doubled since it was fit.
+        """
+        num_rows = self.storage.num_rows if self.storage_format == "memmap" else len(self.vectors)
+        path = self._get_quantized_vectors_path()
+        segments = self._get_segments()
+        dimension = segments[0][1].shape[1]
+        if self._quantized_vectors is not None and self._quantized_vectors_path != path:
+            self._quantized_vectors = None
+        if self._quantized_vectors is None and os.path.exists(path):
+            self._quantized_vectors = QuantizedVectors.load(
+                path, self.quantization or "float32", dimension, self.truncate_dimension
+            )
+            self._quantized_vectors_path = path
+            self._quantized_vectors_dirty = False
+        if self._quantized_vectors is not None and (
+            len(self._quantized_vectors) > num_rows
+            or (self.quantization == "int8" and num_rows >= 2 * self._quantized_vectors.trained_rows)
+        ):
+            # The rows have been renumbered, or the scale was fit on too small a sample
+            self._quantized_vectors = None
+
+        if self._quantized_vectors is None:
+            self._quantized_vectors = QuantizedVectors(
+                self.quantization or "float32", dimension, truncate_dimension=self.truncate_dimension
+            )
+            self._quantized_vectors.train(vectors for _, vectors in segments)
+            self._quantized_vectors_path = path
+            self._quantized_vectors_dirty = True
+
+        first_missing_row = len(self._quantized_vectors)
+        if first_missing_row < num_rows:
+            for start_row, vectors in segments:
+                end_row = start_row + vectors.shape[0]
+                if end_row <= first_missing_row:
+                    continue
+                self._quantized_vectors.add(vectors[max(first_missing_row - start_row, 0):])
+            self._quantized_vectors_dirty = True
+        return self._quantized_vectors
+
+    def _save_quantized_vectors(self) -> None:
+        if self._quantized_vectors is None or not self._quantized_vectors_dirty:
+            return
+        # Quantized vectors from earlier generations or other methods are no longer valid
+        self._remove_index_files(".codes.npz", keep_path=self._quantized_vectors_path)
+        self._quantized_vectors.save(self._quantized_vectors_path)
+        self._quantized_vectors_dirty = False
+
+    def _delete_quantized_vectors(self) -> None:
+        self._quantized_vectors = None
+        if self.storage_format == "pickle":
+            self._remove_index_files(".codes.npz")
+
+    def _get_ivf_index_path(self) -> str:
+        if self.storage_format == "memmap":
+            return os.path.join(self.vector_storage_path, f"{self.storage.generation}.ivf.npz")
+        return os.path.join(self.storage_directory, "vector_storage", f"{self.kb_id}.ivf.npz")
+
+    def _get_ivf_index(self) -> Optional[IVFIndex]:
+        """
+        Load the persisted IVF index, or train it if it doesn't exist yet, and assign any rows it's missing.
+        The clusters are retrained whenever the number of rows has doubled since they were trained. Returns
+        None while the KB is too small for clustering to pay off.
+        """
+        num_rows = self.storage.num_rows if self.storage_format == "memmap" else len(self.vectors)
+        path = self._get_ivf_index_path()
+        if self._ivf_index is not None and self._ivf_index_path != path:
+            self._ivf_index = None
+        if self._ivf_index is None and os.path.exists(path):
+            self._ivf_index = IVFIndex.load(path)
+            self._ivf_index_path = path
+            self._ivf_index_dirty = False
+        if self._ivf_index is not None and (
+            len(self._ivf_index) > num_rows or num_rows >= 2 * self._ivf_index.trained_rows
+        ):
+            # The rows have been renumbered, or the KB has outgrown the clusters
+            self._ivf_index = None
+
+        if self._ivf_index is None:
+            num_live_rows = self._num_vectors()
+            nlist = min(self.ivf_nlist, num_live_rows // MIN_ROWS_PER_LIST)
+            if nlist < 2:
+                return None
+            # Train on a random sample of the live rows
+            live_row_ids = self.storage.live_row_ids() if self.storage_format == "memmap" else np.arange(num_rows)
+            num_training_rows = min(num_live_rows, MAX_TRAINING_ROWS_PER_LIST * nlist)
+            training_row_ids = np.sort(
+                np.random.default_rng(0).choice(live_row_ids, num_training_rows, replace=False)
+            )
+            self._ivf_index = IVFIndex.train(self._get_rows(training_row_ids), nlist, num_rows)
+            self._ivf_index_path = path
+            self._ivf_index_dirty = True
+
+        first_missing_row = len(self._ivf_index)
+        if first_missing_row < num_rows:
+            self._ivf_index.add(
+                vectors[max(first_missing_row - start_row, 0):]
+                for start_row, vectors in self._get_segments()
+                if start_row + vectors.shape[0] > first_missing_row
+            )
+            self._ivf_index_dirty = True
+        return self._ivf_index
+
+    def _save_ivf_index(self) -> None:
+        if self._ivf_index is None or not self._ivf_index_dirty:
+            return
+        # Indexes from earlier generations are no longer valid
+        self._remove_index_files(".ivf.npz", keep_path=self._ivf_index_path)
+        self._ivf_index.save(self._ivf_index_path)
+        self._ivf_index_dirty = False
 
     def remove_document(self, doc_id):
-        i = 0
-        while i < len(self.metadata):
-            if self.metadata[i]["doc_id"] == doc_id:
-                del self.vectors[i]
-                del self.metadata[i]
-            else:
-                i += 1
+        if self.storage_format == "memmap":
+            # Only writes a tombstone for the document's rows. The faiss index keeps them until the
+            # storage is compacted, and searches skip them in the meantime.
+            generation = self.storage.generation
+            self.storage.remove_document(doc_id)
+            if generation != self.storage.generation:
+                # Compaction renumbered the rows (or removed them all), so the indexes built on them are stale
+                self._metadata_columns = {}
+                self._typed_metadata_columns = {}
+                self._faiss_index = None
+                self._quantized_vectors = None
+                self._ivf_index = None
+            return
+        keep = [i for i, item in enumerate(self.metadata) if item["doc_id"] != doc_id]
+        if len(keep) == len(self.metadata):
+            return
+        if self.ivf_nlist is not None and self._get_ivf_index() is not None:
+            # Cluster assignments survive the removal, so the remaining rows don't need to be re-clustered
+            self._ivf_index.keep_rows(np.array(keep, dtype=np.int64))
+            self._ivf_index_dirty = True
+        self.vectors = [self.vectors[i] for i in keep]
+        self.metadata = [self.metadata[i] for i in keep]
+        self._normalized_vectors = None
+        self._metadata_columns = {}
+        self._typed_metadata_columns = {}
+        # Row numbers have shifted, so the faiss index and quantized vectors get rebuilt when next needed
+        self._delete_faiss_index()
+        self._delete_quantized_vectors()
         self.save()
 
+    def compact(self):
+        """
+        Merge the memmap storage segments into one and drop the rows of removed documents.
+
+        This happens automatically once there are many segments or many removed rows, but it can also be
+        called explicitly, e.g. after a large batch of deletions. It's a no-op for the pickle format.
+        """
+        if self.storage_format == "memmap":
+            self.storage.compact()
+            self._metadata_columns = {}
+            self._typed_metadata_columns = {}
+            if self.use_faiss:
+                self._get_faiss_index()
+                self._save_faiss_index()
+            if self._uses_two_stage_search() and self._num_vectors() > 0:
+                self._get_quantized_vectors()
+                self._save_quantized_vectors()
+            if self.ivf_nlist is not None and self._num_vectors() > 0:
+                self._get_ivf_index()
+                self._save_ivf_index()
+
     def save(self):
+        if self.use_faiss:
+            self._save_faiss_index()
+        if self._uses_two_stage_search():
+            self._save_quantized_vectors()
+        if self.ivf_nlist is not None:
+            self._save_ivf_index()
+        if self.storage_format == "memmap":
+            # The memmap storage persists every change as it is made
+            return
         os.makedirs(
             os.path.dirname(self.vector_storage_path), exist_ok=True
         )  # Ensure the directory exists
@@ -122,6 +833,25 @@ class BasicVectorDB(VectorDB):
             pickle.dump((self.vectors, self.metadata), f)
 
     def load(self):
+        self._normalized_vectors = None
+        self._metadata_columns: dict[str, list] = {}
+        self._typed_metadata_columns: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self._faiss_index = None
+        self._faiss_index_path = None
+        self._faiss_index_dirty = False
+        self._quantized_vectors: Optional[QuantizedVectors] = None
+        self._quantized_vectors_path = None
+        self._quantized_vectors_dirty = False
+        self._ivf_index: Optional[IVFIndex] = None
+        self._ivf_index_path = None
+        self._ivf_index_dirty = False
+        if os.path.exists(self._get_compression_dictionary_path()):
+            with open(self._get_compression_dictionary_path(), "rb") as f:
+                self.codec.load_dictionary(f.read())
+        if self.storage_format == "memmap":
+            self.storage = MemmapVectorStorage(self.vector_storage_path)
+            self.metadata = MemmapMetadataView(self.storage)
+            return
         if os.path.exists(self.vector_storage_path):
             with open(self.vector_storage_path, "rb") as f:
                 self.vectors, self.metadata = pickle.load(f)
@@ -130,6 +860,17 @@ class BasicVectorDB(VectorDB):
             self.metadata = []
 
     def delete(self):
+        if self.storage_format == "memmap":
+            self._faiss_index = None
+            self._quantized_vectors = None
+            self._ivf_index = None
+            self.storage.delete()
+            return
+        self._delete_faiss_index()
+        self._delete_quantized_vectors()
+        self._ivf_index = None
+        self._remove_index_files(".ivf.npz")
+        self._remove_index_files(".compression.dict")
         if os.path.exists(self.vector_storage_path):
             os.remove(self.vector_storage_path)
 
@@ -139,4 +880,17 @@ class BasicVectorDB(VectorDB):
             "kb_id": self.kb_id,
             "storage_directory": self.storage_directory,
             "use_faiss": self.use_faiss,
+            "storage_format": self.storage_format,
+            "faiss_index_type": self.faiss_index_type,
+            "faiss_nlist": self.faiss_nlist,
+            "faiss_nprobe": self.faiss_nprobe,
+            "faiss_hnsw_m": self.faiss_hnsw_m,
+            "faiss_ef_search": self.faiss_ef_search,
+            "quantization": self.quantization,
+            "truncate_dimension": self.truncate_dimension,
+            "rescore_oversample": self.rescore_oversample,
+            "ivf_nlist": self.ivf_nlist,
+            "ivf_nprobe": self.ivf_nprobe,
+            "compression": self.compression,
+            "compression_dictionary": self.compression_dictionary,
         }
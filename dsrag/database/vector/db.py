@@ -60,6 +60,29 @@ class VectorDB(ABC):
         """
         pass
 
+    def search_many(
+        self,
+        query_vectors: Sequence[Vector],
+        top_k: int = 10,
+        metadata_filter: Optional[dict] = None,
+    ) -> list[list[VectorSearchResult]]:
+        """
+        Run several searches with the same top_k and metadata_filter, returning one result list per query
+        vector, in order. The default implementation calls search once per query; databases with a native
+        batch query API should override it.
+        """
+        return [
+            self.search(query_vector, top_k, metadata_filter)
+            for query_vector in query_vectors
+        ]
+
+    def get_num_vectors(self) -> Optional[int]:
+        """
+        Return the number of vectors in the database, or None if the database can't count them without
+        scanning. Databases that keep a count should override this.
+        """
+        return None
+
     @abstractmethod
     def delete(self) -> None:
         """
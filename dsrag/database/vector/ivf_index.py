@@ -0,0 +1,153 @@
+import os
+from typing import Iterable, Optional
+
+import numpy as np
+
+
+# Fewer rows per cluster than this and the clusters aren't worth probing
+MIN_ROWS_PER_LIST = 32
+
+# Training uses a sample of at most this many rows per cluster
+MAX_TRAINING_ROWS_PER_LIST = 256
+
+# Rows are assigned in blocks so the temporary score matrix stays small
+_BLOCK_SIZE = 4096
+
+
+def train_kmeans(
+    vectors: np.ndarray,
+    num_clusters: int,
+    num_iterations: int = 50,
+    batch_size: int = 1024,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    Spherical mini-batch k-means: each iteration assigns a random batch to the closest centroid by inner
+    product and moves every centroid towards the mean of its batch members with a per-centroid learning
+    rate of 1 / (number of rows assigned to it so far). Returns L2-normalized centroids.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), num_clusters, replace=False)].astype(np.float32)
+    counts = np.zeros(num_clusters, dtype=np.float64)
+    for _ in range(num_iterations):
+        batch = vectors[rng.integers(len(vectors), size=min(batch_size, len(vectors)))]
+        assignments = np.argmax(batch @ centroids.T, axis=1)
+        batch_counts = np.bincount(assignments, minlength=num_clusters)
+        # Per-cluster sums of the batch, as a product with the one-hot assignment matrix
+        one_hot = np.zeros((len(batch), num_clusters), dtype=np.float32)
+        one_hot[np.arange(len(batch)), assignments] = 1
+        sums = one_hot.T @ batch
+        counts += batch_counts
+        updated = batch_counts > 0
+        learning_rate = (batch_counts[updated] / counts[updated]).astype(np.float32)[:, None]
+        batch_means = sums[updated] / batch_counts[updated, None]
+        centroids[updated] = (1 - learning_rate) * centroids[updated] + learning_rate * batch_means
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    # Clusters that never attracted a row are re-seeded so no posting list is wasted
+    empty = counts == 0
+    if empty.any():
+        centroids[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted file index over normalized vectors, implemented with numpy only.
+
+    The vectors are partitioned by k-means into clusters, and a search only scores the rows in the nprobe
+    clusters whose centroids are closest to the query. Rows are identified by their row number in the
+    vector storage; the index keeps one cluster assignment per row, and groups the row numbers of each
+    cluster into a contiguous posting list when it is searched.
+    """
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        assignments: Optional[np.ndarray] = None,
+        trained_rows: int = 0,
+    ) -> None:
+        self.centroids = centroids
+        self.assignments = assignments if assignments is not None else np.zeros(0, dtype=np.int32)
+        self.trained_rows = trained_rows
+        self._list_offsets: Optional[np.ndarray] = None
+        self._list_rows: Optional[np.ndarray] = None
+
+    @classmethod
+    def train(cls, training_vectors: np.ndarray, num_clusters: int, trained_rows: int) -> "IVFIndex":
+        return cls(train_kmeans(training_vectors, num_clusters), trained_rows=trained_rows)
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    def __len__(self) -> int:
+        return len(self.assignments)
+
+    def add(self, vector_blocks: Iterable[np.ndarray]) -> None:
+        """Assign new rows (which must directly follow the indexed rows) to their closest centroid."""
+        assignments = [self.assignments]
+        for vectors in vector_blocks:
+            for start in range(0, len(vectors), _BLOCK_SIZE):
+                block = np.asarray(vectors[start:start + _BLOCK_SIZE], dtype=np.float32)
+                assignments.append(np.argmax(block @ self.centroids.T, axis=1).astype(np.int32))
+        self.assignments = np.concatenate(assignments)
+        self._list_offsets = None
+
+    def keep_rows(self, keep: np.ndarray) -> None:
+        """Drop rows from the index; the remaining rows are renumbered consecutively."""
+        self.assignments = self.assignments[keep]
+        self._list_offsets = None
+
+    def _get_posting_lists(self) -> tuple[np.ndarray, np.ndarray]:
+        """Row numbers grouped by cluster, with offsets[i]:offsets[i + 1] delimiting cluster i."""
+        if self._list_offsets is None:
+            # A stable sort keeps the row numbers of each cluster in ascending order
+            self._list_rows = np.argsort(self.assignments, kind="stable")
+            self._list_offsets = np.concatenate(
+                [[0], np.cumsum(np.bincount(self.assignments, minlength=self.nlist))]
+            )
+        return self._list_offsets, self._list_rows
+
+    def probe(
+        self,
+        query: np.ndarray,
+        nprobe: int,
+        mask: Optional[np.ndarray] = None,
+        min_rows: int = 0,
+    ) -> np.ndarray:
+        """
+        Sorted row numbers in the nprobe clusters closest to the query, limited to the rows in mask. More
+        clusters are probed while fewer than min_rows rows are found, e.g. because of a selective filter.
+        """
+        offsets, list_rows = self._get_posting_lists()
+        cluster_order = np.argsort(-(self.centroids @ query), kind="stable")
+        nprobe = min(max(nprobe, 1), self.nlist)
+        while True:
+            probed = cluster_order[:nprobe]
+            rows = np.concatenate(
+                [list_rows[offsets[cluster]:offsets[cluster + 1]] for cluster in probed]
+            )
+            if mask is not None:
+                rows = rows[mask[rows]]
+            if len(rows) >= min_rows or nprobe == self.nlist:
+                return np.sort(rows)
+            nprobe = min(nprobe * 2, self.nlist)
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file and swap it in so readers never see a partially written file
+        with open(path + ".tmp", "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                assignments=self.assignments,
+                trained_rows=np.array(self.trained_rows),
+            )
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path) as data:
+            return cls(
+                data["centroids"], data["assignments"], trained_rows=int(data["trained_rows"])
+            )
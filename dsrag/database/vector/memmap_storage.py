@@ -0,0 +1,311 @@
+import collections.abc
+import contextlib
+import json
+import os
+import shutil
+import sqlite3
+import uuid
+from typing import Optional, Sequence
+
+import numpy as np
+
+from dsrag.database.vector.types import ChunkMetadata
+
+
+class MemmapVectorStorage:
+    """
+    Columnar on-disk storage used by BasicVectorDB when storage_format="memmap".
+
+    Vectors are stored L2-normalized as contiguous float32 matrices in .npy segment files that are opened
+    with np.load(mmap_mode="r"), so loading is near-instant and every process that opens the same KB shares
+    one page-cached copy. Metadata lives in a SQLite sidecar keyed on the global row number of each vector,
+    so only the rows that are actually returned from a search ever get deserialized.
+
+    Writes are log-structured: every add_vectors call appends a new segment file, and removing a document
+    only marks its row ranges as deleted (a tombstone). The cost of both operations therefore depends on the
+    size of the document rather than the size of the KB. compact() merges all segments into one and drops
+    the deleted rows; it runs automatically once there are too many segments or too many deleted rows.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_segments: int = 32,
+        max_deleted_fraction: float = 0.5,
+    ) -> None:
+        self.directory = directory
+        self.metadata_path = os.path.join(directory, "metadata.db")
+        self.max_segments = max_segments
+        self.max_deleted_fraction = max_deleted_fraction
+        self.load()
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Open the metadata sidecar, committing on success and always closing the connection."""
+        conn = sqlite3.connect(self.metadata_path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _create_tables(self, conn: sqlite3.Connection) -> None:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS metadata (row_id INTEGER PRIMARY KEY, doc_id TEXT, data TEXT)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS segments (segment_id INTEGER PRIMARY KEY, file_name TEXT, start_row INTEGER, num_rows INTEGER)"
+        )
+        # doc_id -> row range index; removing a document sets deleted=1 on its ranges
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS row_ranges (doc_id TEXT, start_row INTEGER, end_row INTEGER, deleted INTEGER DEFAULT 0)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_row_ranges_doc_id ON row_ranges (doc_id)")
+
+    def load(self) -> None:
+        self.segments: list[tuple[int, np.ndarray]] = []
+        self.num_rows = 0
+        self.live_mask: Optional[np.ndarray] = None
+        if not os.path.exists(self.metadata_path):
+            return
+        with self._connect() as conn:
+            self._create_tables(conn)
+            for file_name, start_row in conn.execute(
+                "SELECT file_name, start_row FROM segments ORDER BY start_row"
+            ):
+                vectors = np.load(os.path.join(self.directory, file_name), mmap_mode="r")
+                self.segments.append((start_row, vectors))
+                self.num_rows = start_row + vectors.shape[0]
+            tombstones = conn.execute(
+                "SELECT start_row, end_row FROM row_ranges WHERE deleted = 1"
+            ).fetchall()
+        for start_row, end_row in tombstones:
+            self._mark_deleted(start_row, end_row)
+
+    def _mark_deleted(self, start_row: int, end_row: int) -> None:
+        if self.live_mask is None:
+            self.live_mask = np.ones(self.num_rows, dtype=bool)
+        self.live_mask[start_row:end_row] = False
+
+    def __len__(self) -> int:
+        """Number of live (non-deleted) rows."""
+        if self.live_mask is None:
+            return self.num_rows
+        return int(self.live_mask.sum())
+
+    @property
+    def dimension(self) -> Optional[int]:
+        return self.segments[0][1].shape[1] if self.segments else None
+
+    @property
+    def generation(self) -> Optional[str]:
+        """
+        Identifies the current row numbering. It only changes when compaction renumbers the rows (or the
+        storage is deleted and recreated), so anything keyed on row numbers (e.g. an ANN index) stays valid
+        while the generation is the same.
+        """
+        if not self.segments:
+            return None
+        return os.path.splitext(os.path.basename(self.segments[0][1].filename))[0]
+
+    def live_row_ids(self) -> np.ndarray:
+        if self.live_mask is None:
+            return np.arange(self.num_rows)
+        return np.flatnonzero(self.live_mask)
+
+    def get_vectors(self) -> np.ndarray:
+        """Return all stored rows (including deleted ones) as a single matrix."""
+        if not self.segments:
+            return np.zeros((0, 0), dtype=np.float32)
+        if len(self.segments) == 1:
+            return self.segments[0][1]
+        return np.concatenate([vectors for _, vectors in self.segments], axis=0)
+
+    @staticmethod
+    def _segment_file_name(segment_id: int) -> str:
+        # Segment ids start over once the storage is deleted, so the random suffix keeps the generation of a
+        # recreated store from matching the one before it
+        return f"segment_{segment_id:06d}_{uuid.uuid4().hex[:12]}.npy"
+
+    def _write_segment(self, file_name: str, vectors: np.ndarray) -> np.ndarray:
+        # Write to a temporary file and swap it in so readers never see a partially written segment
+        path = os.path.join(self.directory, file_name)
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, vectors)
+        os.replace(path + ".tmp", path)
+        return np.load(path, mmap_mode="r")
+
+    def add(self, vectors: np.ndarray, metadata: Sequence[ChunkMetadata]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        start_row = self.num_rows
+        with self._connect() as conn:
+            self._create_tables(conn)
+            segment_id = conn.execute("SELECT COALESCE(MAX(segment_id), -1) + 1 FROM segments").fetchone()[0]
+            file_name = self._segment_file_name(segment_id)
+            segment = self._write_segment(file_name, vectors)
+            conn.execute(
+                "INSERT INTO segments (segment_id, file_name, start_row, num_rows) VALUES (?, ?, ?, ?)",
+                (segment_id, file_name, start_row, len(vectors)),
+            )
+            conn.executemany(
+                "INSERT INTO metadata (row_id, doc_id, data) VALUES (?, ?, ?)",
+                [
+                    (start_row + i, item.get("doc_id"), json.dumps(item))
+                    for i, item in enumerate(metadata)
+                ],
+            )
+            # Collapse consecutive rows of the same document into a single range
+            ranges = []
+            for i, item in enumerate(metadata):
+                doc_id = item.get("doc_id")
+                if ranges and ranges[-1][0] == doc_id:
+                    ranges[-1][2] = start_row + i + 1
+                else:
+                    ranges.append([doc_id, start_row + i, start_row + i + 1])
+            conn.executemany(
+                "INSERT INTO row_ranges (doc_id, start_row, end_row) VALUES (?, ?, ?)", ranges
+            )
+        self.segments.append((start_row, segment))
+        self.num_rows += len(vectors)
+        if self.live_mask is not None:
+            self.live_mask = np.concatenate([self.live_mask, np.ones(len(vectors), dtype=bool)])
+        if len(self.segments) > self.max_segments:
+            self.compact()
+
+    def get_metadata(self, row_ids: Sequence[int]) -> list[ChunkMetadata]:
+        """Fetch the metadata for the given rows, in the order they were requested."""
+        row_ids = [int(row_id) for row_id in row_ids]
+        if not row_ids:
+            return []
+        rows = {}
+        with self._connect() as conn:
+            # Stay under SQLite's default limit on the number of bound parameters
+            for i in range(0, len(row_ids), 900):
+                batch = row_ids[i:i + 900]
+                placeholders = ", ".join(["?"] * len(batch))
+                cursor = conn.execute(
+                    f"SELECT row_id, data FROM metadata WHERE row_id IN ({placeholders})", batch
+                )
+                rows.update({row_id: json.loads(data) for row_id, data in cursor})
+        return [rows[row_id] for row_id in row_ids]
+
+    def get_metadata_field(self, field: str) -> list:
+        """The value of one metadata field for every stored row (None where it's missing)."""
+        values = [None] * self.num_rows
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "SELECT row_id, json_extract(data, ?) FROM metadata",
+                ("$." + json.dumps(field),),
+            )
+            for row_id, value in cursor:
+                values[row_id] = value
+        return values
+
+    def remove_document(self, doc_id: str) -> None:
+        if not self.segments:
+            return
+        with self._connect() as conn:
+            ranges = conn.execute(
+                "SELECT start_row, end_row FROM row_ranges WHERE doc_id = ? AND deleted = 0", (doc_id,)
+            ).fetchall()
+            if not ranges:
+                return
+            conn.execute("UPDATE row_ranges SET deleted = 1 WHERE doc_id = ?", (doc_id,))
+        for start_row, end_row in ranges:
+            self._mark_deleted(start_row, end_row)
+        if self.num_rows - len(self) > self.max_deleted_fraction * self.num_rows:
+            self.compact()
+
+    def compact(self) -> None:
+        """Merge all segments into a single one and physically drop deleted rows."""
+        if not self.segments or (len(self.segments) == 1 and self.live_mask is None):
+            return
+        live_mask = self.live_mask if self.live_mask is not None else np.ones(self.num_rows, dtype=bool)
+        new_row_ids = np.cumsum(live_mask) - 1
+        num_live = int(live_mask.sum())
+        if num_live == 0:
+            # Every row has been deleted, so start over from an empty store
+            self.delete()
+            return
+
+        with self._connect() as conn:
+            segment_id = conn.execute("SELECT COALESCE(MAX(segment_id), -1) + 1 FROM segments").fetchone()[0]
+            old_files = [row[0] for row in conn.execute("SELECT file_name FROM segments")]
+            file_name = self._segment_file_name(segment_id)
+
+            # Stream the live rows of each segment into the new file so the KB never has to fit in RAM
+            path = os.path.join(self.directory, file_name)
+            merged = np.lib.format.open_memmap(
+                path + ".tmp", mode="w+", dtype=np.float32, shape=(num_live, self.dimension)
+            )
+            offset = 0
+            for start_row, vectors in self.segments:
+                segment_live = live_mask[start_row:start_row + vectors.shape[0]]
+                count = int(segment_live.sum())
+                merged[offset:offset + count] = vectors[segment_live]
+                offset += count
+            merged.flush()
+            del merged
+            os.replace(path + ".tmp", path)
+
+            conn.execute("DELETE FROM segments")
+            conn.execute(
+                "INSERT INTO segments (segment_id, file_name, start_row, num_rows) VALUES (?, ?, 0, ?)",
+                (segment_id, file_name, num_live),
+            )
+
+            live_ranges = conn.execute(
+                "SELECT doc_id, start_row, end_row FROM row_ranges WHERE deleted = 0"
+            ).fetchall()
+            conn.execute("DELETE FROM row_ranges")
+            conn.executemany(
+                "INSERT INTO row_ranges (doc_id, start_row, end_row) VALUES (?, ?, ?)",
+                [
+                    (doc_id, int(new_row_ids[start_row]), int(new_row_ids[end_row - 1]) + 1)
+                    for doc_id, start_row, end_row in live_ranges
+                ],
+            )
+
+            # Drop the metadata of deleted rows and renumber the rest to match the merged segment
+            conn.executemany(
+                "DELETE FROM metadata WHERE row_id = ?",
+                [(int(row_id),) for row_id in np.flatnonzero(~live_mask)],
+            )
+            conn.execute(
+                "CREATE TABLE metadata_compacted AS "
+                "SELECT ROW_NUMBER() OVER (ORDER BY row_id) - 1 AS row_id, doc_id, data FROM metadata"
+            )
+            conn.execute("DROP TABLE metadata")
+            self._create_tables(conn)
+            conn.execute(
+                "INSERT INTO metadata (row_id, doc_id, data) SELECT row_id, doc_id, data FROM metadata_compacted"
+            )
+            conn.execute("DROP TABLE metadata_compacted")
+
+        for old_file in old_files:
+            if old_file != file_name and os.path.exists(os.path.join(self.directory, old_file)):
+                os.remove(os.path.join(self.directory, old_file))
+        self.load()
+
+    def delete(self) -> None:
+        self.segments = []
+        self.num_rows = 0
+        self.live_mask = None
+        if os.path.exists(self.directory):
+            shutil.rmtree(self.directory)
+
+
+class MemmapMetadataView(collections.abc.Sequence):
+    """Read-only list-like view over the metadata of the live rows in a MemmapVectorStorage."""
+
+    def __init__(self, storage: MemmapVectorStorage) -> None:
+        self._storage = storage
+
+    def __len__(self) -> int:
+        return len(self._storage)
+
+    def __getitem__(self, index):
+        row_ids = self._storage.live_row_ids()
+        if isinstance(index, slice):
+            return self._storage.get_metadata(row_ids[index])
+        return self._storage.get_metadata([row_ids[index]])[0]
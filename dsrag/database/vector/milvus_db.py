@@ -123,27 +123,36 @@ class MilvusDB(VectorDB):
         )
 
     def search(self, query_vector, top_k: int=10, metadata_filter: Optional[dict] = None) -> list[VectorSearchResult]:
-        query_results = self.client.search(
+        return self.search_many([query_vector], top_k, metadata_filter)[0]
+
+    def search_many(self, query_vectors, top_k: int=10, metadata_filter: Optional[dict] = None) -> list[list[VectorSearchResult]]:
+        if len(query_vectors) == 0:
+            return []
+        # Milvus accepts several query vectors per request and returns one list of hits per query
+        batch_results = self.client.search(
             collection_name=self.kb_id,
-            data=[query_vector],
+            data=list(query_vectors),
             filter=_convert_metadata_to_expr(metadata_filter),
             limit=top_k,
             output_fields=["*"]
-        )[0]
-        results: list[VectorSearchResult] = []
-        for res in query_results:
-            results.append(
-                VectorSearchResult(
-                    doc_id=res['entity']['doc_id'],
-                    metadata=res['entity']['metadata'],
-                    similarity=res['distance'],
-                    vector=res['entity']['vector'],
+        )
+        all_results: list[list[VectorSearchResult]] = []
+        for query_results in batch_results:
+            results: list[VectorSearchResult] = []
+            for res in query_results:
+                results.append(
+                    VectorSearchResult(
+                        doc_id=res['entity']['doc_id'],
+                        metadata=res['entity']['metadata'],
+                        similarity=res['distance'],
+                        vector=res['entity']['vector'],
+                    )
                 )
-            )
 
-        results = sorted(results, key=lambda x: x['similarity'], reverse=True)
+            results = sorted(results, key=lambda x: x['similarity'], reverse=True)
+            all_results.append(results)
 
-        return results
+        return all_results
 
     def remove_document(self, doc_id):
         self.client.delete(
@@ -4,10 +4,10 @@ import numpy as np
 
 from dsrag.database.vector.db import VectorDB
 from dsrag.database.vector.types import VectorSearchResult, MetadataFilter, ChunkMetadata, Vector
+from dsrag.database.postgres_pool import PostgresConnectionPool
 from dsrag.utils.imports import LazyLoader
 
 # Lazy load PostgreSQL dependencies
-psycopg2 = LazyLoader("psycopg2", "psycopg2-binary")
 pgvector = LazyLoader("pgvector")
 
 # We'll import register_vector when needed to avoid immediate import
@@ -64,7 +64,18 @@ def format_metadata_filter(metadata_filter: MetadataFilter) -> dict:
 
 
 class PostgresVectorDB(VectorDB):
-    def __init__(self, kb_id: str, username: str, password: str, database: str, host: str="localhost", port: int = 5432, vector_dimension: int = 768):
+    def __init__(
+        self,
+        kb_id: str,
+        username: str,
+        password: str,
+        database: str,
+        host: str = "localhost",
+        port: int = 5432,
+        vector_dimension: int = 768,
+        min_connections: int = 1,
+        max_connections: int = 10,
+    ):
         self.kb_id = kb_id
         self.username = username
         self.password = password
@@ -72,126 +83,107 @@ class PostgresVectorDB(VectorDB):
         self.host = host
         self.port = port
         self.vector_dimension = vector_dimension
-
-        # Create the extension if it doesn't exist
-        conn = psycopg2.connect(
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self._extension_created = False
+
+        # Connections are shared by all the methods (and threads) of this object instead of opening one per call
+        self.pool = PostgresConnectionPool(
+            min_connections=min_connections,
+            max_connections=max_connections,
+            on_connect=self._setup_connection,
             dbname=database,
             user=username,
             password=password,
             host=host,
-            port=port
+            port=port,
         )
-        cur = conn.cursor()
-        cur.execute('CREATE EXTENSION IF NOT EXISTS vector')
-        conn.commit()
-        
-        # Import register_vector only when needed
-        from pgvector.psycopg2 import register_vector
-        register_vector(conn)
 
-        cur.execute(f"SELECT EXISTS (SELECT 1 FROM pg_tables WHERE schemaname = 'public' AND tablename = '{kb_id}_vectors')")
-        exists = cur.fetchone()[0]
-        print ("exists", exists)
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT EXISTS (SELECT 1 FROM pg_tables WHERE schemaname = 'public' AND tablename = %s)",
+                (f"{kb_id}_vectors",),
+            )
+            exists = cur.fetchone()[0]
 
-        # Create the table for this kb id if it doesn't exist
-        if not exists:
-            cur.execute(f"CREATE TABLE {kb_id}_vectors (id TEXT PRIMARY KEY, metadata JSONB, embedding vector({vector_dimension}))")
-            conn.commit()
+            # Create the table for this kb id if it doesn't exist
+            if not exists:
+                cur.execute(f"CREATE TABLE {kb_id}_vectors (id TEXT PRIMARY KEY, metadata JSONB, embedding vector({vector_dimension}))")
+
+                # Create the index
+                cur.execute(f'CREATE INDEX {kb_id}_embedding_index ON {kb_id}_vectors USING hnsw(embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)')
 
-            # Create the index
-            cur.execute(f'CREATE INDEX {kb_id}_embedding_index ON {kb_id}_vectors USING hnsw(embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)')
+    def _setup_connection(self, conn) -> None:
+        # Create the extension if it doesn't exist (once per object), then register the vector type on
+        # every new connection
+        if not self._extension_created:
+            cur = conn.cursor()
+            cur.execute('CREATE EXTENSION IF NOT EXISTS vector')
             conn.commit()
+            self._extension_created = True
 
-        conn.close()
+        # Import register_vector only when needed
+        from pgvector.psycopg2 import register_vector
+        register_vector(conn)
 
     def get_num_vectors(self):
-        conn = psycopg2.connect(
-            dbname=self.database,
-            user=self.username,
-            password=self.password,
-            host=self.host,
-            port=self.port
-        )
-        cur = conn.cursor()
-        cur.execute(f"SELECT COUNT(*) FROM {self.kb_id}_vectors")
-        count = cur.fetchone()[0]
-        conn.close()
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f"SELECT COUNT(*) FROM {self.kb_id}_vectors")
+            count = cur.fetchone()[0]
         return count
 
     def add_vectors(self, vectors: Sequence[Vector], metadata: Sequence[ChunkMetadata]):
-
-        conn = psycopg2.connect(
-            dbname=self.database,
-            user=self.username,
-            password=self.password,
-            host=self.host,
-            port=self.port
-        )
-        cur = conn.cursor()
-
         vectors = np.array(vectors)
         # Create the ids from the doc_id and chunk_index
         ids = [f"{content['doc_id']}_{content['chunk_index']}" for content in metadata]
         data_to_insert = [(id, json.dumps(content), embedding) for id, content, embedding in zip(ids, metadata, vectors)]
-        cur.executemany(f'INSERT INTO {self.kb_id}_vectors (id, metadata, embedding) VALUES (%s, %s, %s)', data_to_insert)
-        conn.commit()
-        conn.close()
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.executemany(f'INSERT INTO {self.kb_id}_vectors (id, metadata, embedding) VALUES (%s, %s, %s)', data_to_insert)
 
     def remove_document(self, doc_id):
-        
-        conn = psycopg2.connect(
-            dbname=self.database,
-            user=self.username,
-            password=self.password,
-            host=self.host,
-            port=self.port
-        )
-        cur = conn.cursor()
-
-        # Delete all vectors with the given doc_id
-        cur.execute(f"DELETE FROM {self.kb_id}_vectors WHERE metadata @> %s", (json.dumps({"doc_id": doc_id}),))
-        conn.commit()
-        conn.close()
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            # Delete all vectors with the given doc_id
+            cur.execute(f"DELETE FROM {self.kb_id}_vectors WHERE metadata @> %s", (json.dumps({"doc_id": doc_id}),))
 
     def search(self, query_vector: list, top_k: int=10, metadata_filter: Optional[MetadataFilter] = None):
-        
-        conn = psycopg2.connect(
-            dbname=self.database,
-            user=self.username,
-            password=self.password,
-            host=self.host,
-            port=self.port
-        )
-        cur = conn.cursor()
-
         query_vector = np.array(query_vector)
 
-        if metadata_filter:
-            filter_expression = format_metadata_filter(metadata_filter)
-
-        if metadata_filter:
-            filter_value = metadata_filter['value']
-            query = f"""
-                SELECT metadata, embedding, 1 - (embedding <=> %s) AS cosine_similarity
-                FROM {self.kb_id}_vectors
-                WHERE {filter_expression}
-                ORDER BY cosine_similarity DESC LIMIT %s
-            """
-            if isinstance(filter_value, list):
-                params = (query_vector, *filter_value, top_k)
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            if metadata_filter:
+                filter_expression = format_metadata_filter(metadata_filter)
+                filter_value = metadata_filter['value']
+                query = f"""
+                    SELECT metadata, embedding, 1 - (embedding <=> %s) AS cosine_similarity
+                    FROM {self.kb_id}_vectors
+                    WHERE {filter_expression}
+                    ORDER BY cosine_similarity DESC LIMIT %s
+                """
+                if isinstance(filter_value, list):
+                    params = (query_vector, *filter_value, top_k)
+                else:
+                    params = (query_vector, filter_value, top_k)
+
+                cur.execute(query, params)
             else:
-                params = (query_vector, filter_value, top_k)
-
-            cur.execute(query, params)
-        else:
-            query = f"""
-                SELECT metadata, embedding, 1 - (embedding <=> %s) AS cosine_similarity
-                FROM {self.kb_id}_vectors
-                ORDER BY cosine_similarity DESC LIMIT %s
-            """
-            cur.execute(query, (query_vector, top_k))
-
-        results = cur.fetchall()
+                # Unfiltered searches are the common case, so they run as a prepared statement
+                self.pool.execute_prepared(
+                    cur,
+                    "search",
+                    f"""
+                    SELECT metadata, embedding, 1 - (embedding <=> $1) AS cosine_similarity
+                    FROM {self.kb_id}_vectors
+                    ORDER BY cosine_similarity DESC LIMIT $2
+                    """,
+                    (query_vector, top_k),
+                )
+
+            results = cur.fetchall()
+
         formatted_results: list[VectorSearchResult] = []
         for row in results:
             metadata, embedding, cosine_similarity = row
@@ -205,26 +197,28 @@ class PostgresVectorDB(VectorDB):
                 )
             )
 
-        conn.close()
-
         return formatted_results
-    
+
+    def search_many(
+        self,
+        query_vectors: Sequence[Vector],
+        top_k: int = 10,
+        metadata_filter: Optional[MetadataFilter] = None,
+    ) -> list[list[VectorSearchResult]]:
+        # All the searches share one pooled connection
+        with self.pool.connection():
+            return [
+                self.search(query_vector, top_k, metadata_filter)
+                for query_vector in query_vectors
+            ]
 
     def delete(self):
         # Delete the table
-        conn = psycopg2.connect(
-            dbname=self.database,
-            user=self.username,
-            password=self.password,
-            host=self.host,
-            port=self.port
-        )
-
-        cur = conn.cursor()
-        cur.execute(f"DROP TABLE {self.kb_id}_vectors")
-        conn.commit()
-        conn.close()
-
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f"DROP TABLE {self.kb_id}_vectors")
+        # The prepared statements refer to the dropped table, so the pooled connections can't be reused
+        self.pool.close()
 
     def to_dict(self):
         return {
@@ -235,6 +229,7 @@ class PostgresVectorDB(VectorDB):
             "database": self.database,
             "host": self.host,
             "port": self.port,
-            "vector_dimension": self.vector_dimension
+            "vector_dimension": self.vector_dimension,
+            "min_connections": self.min_connections,
+            "max_connections": self.max_connections,
         }
-
@@ -176,7 +176,6 @@ class QdrantVectorDB(VectorDB):
         if isinstance(query_vector, np.ndarray):
             query_vector = query_vector.tolist()
 
-        results: list[VectorSearchResult] = []
         response = self.client.query_points(
             self.kb_id,
             query=query_vector,
@@ -185,7 +184,36 @@ class QdrantVectorDB(VectorDB):
             with_payload=True,
             with_vectors=True,
         ).points
-        for point in response:
+        return self._convert_points(response)
+
+    def search_many(
+        self,
+        query_vectors: Sequence[Vector],
+        top_k: int = 10,
+        metadata_filter: Optional[dict] = None,
+    ) -> list[list[VectorSearchResult]]:
+        """
+        Searches for several query vectors in a single batch request.
+        """
+        if len(query_vectors) == 0:
+            return []
+        requests = [
+            qdrant_client.models.QueryRequest(
+                query=query_vector.tolist() if isinstance(query_vector, np.ndarray) else query_vector,
+                limit=top_k,
+                filter=metadata_filter,
+                with_payload=True,
+                with_vector=True,
+            )
+            for query_vector in query_vectors
+        ]
+        responses = self.client.query_batch_points(self.kb_id, requests=requests)
+        return [self._convert_points(response.points) for response in responses]
+
+    @staticmethod
+    def _convert_points(points) -> list[VectorSearchResult]:
+        results: list[VectorSearchResult] = []
+        for point in points:
             results.append(
                 VectorSearchResult(
                     doc_id=cast(str, point.payload.get("doc_id")),
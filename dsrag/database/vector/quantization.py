@@ -0,0 +1,160 @@
+import os
+from typing import Iterable, Optional
+
+import numpy as np
+
+
+QUANTIZATION_METHODS = ["int8", "binary"]
+
+# Number of set bits in every possible byte, used to compute Hamming distances between packed sign vectors
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# Rows are scored in blocks so the temporary arrays stay small no matter how large the KB is
+_BLOCK_SIZE = 2048
+
+
+def hamming_distances(query_codes: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """Hamming distances between packed bit vectors, as a (num_queries, num_codes) array."""
+    if hasattr(np, "bitwise_count") and codes.shape[1] % 8 == 0:
+        # numpy >= 2.0 has a native popcount; comparing 64 bits at a time is much faster than a lookup table
+        query_codes = np.ascontiguousarray(query_codes).view(np.uint64)
+        codes = np.ascontiguousarray(codes).view(np.uint64)
+        return np.bitwise_count(query_codes[:, None, :] ^ codes[None, :, :]).sum(axis=2, dtype=np.int32)
+    return _POPCOUNT_TABLE[query_codes[:, None, :] ^ codes[None, :, :]].sum(axis=2, dtype=np.int32)
+
+
+class QuantizedVectors:
+    """
+    Compact in-memory copy of normalized vectors, used by BasicVectorDB to shortlist search candidates.
+
+    - "int8": each dimension is scaled by its largest absolute value and rounded to an int8 (4x smaller
+      than float32). Queries stay in float32, so scores are a close approximation of the cosine similarity.
+    - "binary": only the sign of each dimension is kept, packed 8 per byte (32x smaller than float32).
+      Rows are ranked by the Hamming distance between their sign bits and the query's.
+    - "float32": the vectors are kept as is, which is only useful together with truncate_dimension.
+
+    With truncate_dimension, only the first truncate_dimension dimensions of each vector are kept (and
+    re-normalized) before they are quantized. Embedding models trained with Matryoshka representation
+    learning (such as OpenAI's text-embedding-3 models) put most of the information in those leading
+    dimensions, so the prefix is a good approximation of the full vector.
+
+    The shortlist is meant to be rescored with the full-precision vectors.
+    """
+
+    def __init__(
+        self,
+        method: str,
+        dimension: int,
+        codes: Optional[np.ndarray] = None,
+        scale: Optional[np.ndarray] = None,
+        trained_rows: int = 0,
+        truncate_dimension: Optional[int] = None,
+    ) -> None:
+        if method not in QUANTIZATION_METHODS + ["float32"]:
+            raise ValueError(f"Unsupported quantization: {method}")
+        self.method = method
+        self.dimension = dimension
+        self.truncate_dimension = truncate_dimension
+        self.code_dimension = min(truncate_dimension or dimension, dimension)
+        self.scale = scale
+        self.trained_rows = trained_rows
+        if codes is None:
+            if method == "binary":
+                codes = np.zeros((0, (self.code_dimension + 7) // 8), dtype=np.uint8)
+            else:
+                codes = np.zeros((0, self.code_dimension), dtype=np.dtype(method))
+        self.codes = codes
+
+    def __len__(self) -> int:
+        return self.codes.shape[0]
+
+    def _truncate(self, vectors: np.ndarray) -> np.ndarray:
+        """Keep the leading code_dimension dimensions of each vector and re-normalize them."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.code_dimension == vectors.shape[1]:
+            return vectors
+        vectors = vectors[:, :self.code_dimension]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def train(self, vector_blocks: Iterable[np.ndarray]) -> None:
+        """
+        Fit the per-dimension int8 scale to the largest absolute value of each dimension. The vectors are
+        passed as a sequence of blocks so they never have to be loaded all at once. Vectors that are added
+        later and fall outside the fitted range are clipped.
+        """
+        if self.method != "int8":
+            return
+        max_values = np.zeros(self.code_dimension, dtype=np.float32)
+        self.trained_rows = 0
+        for vectors in vector_blocks:
+            if len(vectors) > 0:
+                max_values = np.maximum(max_values, np.abs(self._truncate(vectors)).max(axis=0))
+                self.trained_rows += len(vectors)
+        max_values[max_values == 0] = 127.0
+        self.scale = max_values / 127
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = self._truncate(vectors)
+        if self.method == "float32":
+            return vectors
+        if self.method == "binary":
+            return np.packbits(vectors > 0, axis=1)
+        if self.scale is None:
+            self.train([vectors])
+        return np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+
+    def add(self, vectors: np.ndarray) -> None:
+        self.codes = np.concatenate([self.codes, self.encode(vectors)])
+
+    def scores(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Approximate similarity of each query to every stored row (or only to the given rows), as a
+        (num_queries, num_rows) array.
+        """
+        codes = self.codes if rows is None else self.codes[rows]
+        scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+        queries = self._truncate(queries)
+        if self.method == "binary":
+            query_codes = np.packbits(queries > 0, axis=1)
+            for start in range(0, len(codes), _BLOCK_SIZE):
+                block = codes[start:start + _BLOCK_SIZE]
+                distances = hamming_distances(query_codes, block)
+                # Map the Hamming distance onto the [-1, 1] range of a cosine similarity
+                scores[:, start:start + len(block)] = 1 - 2 * distances / self.code_dimension
+        elif self.method == "float32":
+            for start in range(0, len(codes), _BLOCK_SIZE):
+                block = codes[start:start + _BLOCK_SIZE]
+                scores[:, start:start + len(block)] = queries @ block.T
+        else:
+            scaled_queries = np.asarray(queries * self.scale, dtype=np.float32)
+            for start in range(0, len(codes), _BLOCK_SIZE):
+                block = codes[start:start + _BLOCK_SIZE]
+                scores[:, start:start + len(block)] = scaled_queries @ block.astype(np.float32).T
+        return scores
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        arrays = {"codes": self.codes, "trained_rows": np.array(self.trained_rows)}
+        if self.scale is not None:
+            arrays["scale"] = self.scale
+        # Write to a temporary file and swap it in so readers never see a partially written file
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(
+        cls, path: str, method: str, dimension: int, truncate_dimension: Optional[int] = None
+    ) -> "QuantizedVectors":
+        with np.load(path) as data:
+            scale = data["scale"] if "scale" in data else None
+            return cls(
+                method,
+                dimension,
+                codes=data["codes"],
+                scale=scale,
+                trained_rows=int(data["trained_rows"]),
+                truncate_dimension=truncate_dimension,
+            )
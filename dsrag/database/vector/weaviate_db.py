@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from typing import Sequence, cast
 from dsrag.database.vector.types import ChunkMetadata, Vector, VectorSearchResult
 from dsrag.database.vector.db import VectorDB
@@ -192,6 +193,18 @@ class WeaviateVectorDB(VectorDB):
             )
         return results
 
+    def search_many(self, query_vectors: Sequence[Vector], top_k: int=10, metadata_filter: Optional[dict] = None) -> list[list[VectorSearchResult]]:
+        """
+        Searches for several query vectors at once. near_vector takes a single query vector, so the
+        queries are sent concurrently over the shared client connection.
+        """
+        if len(query_vectors) == 0:
+            return []
+        with ThreadPoolExecutor(max_workers=min(len(query_vectors), 8)) as executor:
+            return list(
+                executor.map(lambda query_vector: self.search(query_vector, top_k, metadata_filter), query_vectors)
+            )
+
     def to_dict(self):
         return {
             **super().to_dict(),
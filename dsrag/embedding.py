@@ -1,8 +1,18 @@
+import hashlib
+import json
 import os
+import threading
 from abc import ABC, abstractmethod
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Union
+import numpy as np
 from dsrag.database.vector.types import Vector
-from dsrag.utils.imports import openai, cohere, voyageai, ollama
+from dsrag.embedding_cache import EmbeddingCache
+from dsrag.utils.imports import LazyLoader, openai, cohere, voyageai, ollama
+
+# scikit-learn is a core dependency, but it's slow to import, so it's only loaded by HashingEmbedding
+sklearn_text = LazyLoader("sklearn.feature_extraction.text", "scikit-learn")
+sklearn_utils = LazyLoader("sklearn.utils", "scikit-learn")
 
 
 dimensionality = {
@@ -23,6 +33,16 @@ dimensionality = {
 class Embedding(ABC):
     subclasses = {}
 
+    # Limits used to batch the chunks of a document for get_embeddings during ingestion: texts per call,
+    # estimated tokens per call (None for no limit), and calls made concurrently. Subclasses set them to
+    # their provider's limits; the single default call at a time suits clients that aren't thread-safe.
+    max_batch_size = 50
+    max_batch_tokens: Optional[int] = None
+    max_concurrent_batches = 1
+
+    # Keys of to_dict() that only change how the embeddings are computed (batching, threads), not their values
+    execution_settings: tuple[str, ...] = ()
+
     def __init__(self, dimension: Optional[int] = None):
         self.dimension = dimension
 
@@ -50,6 +70,11 @@ class Embedding(ABC):
 
 
 class OpenAIEmbedding(Embedding):
+    # OpenAI allows up to 2048 inputs and 300k tokens per request
+    max_batch_size = 512
+    max_batch_tokens = 250_000
+    max_concurrent_batches = 4
+
     def __init__(self, model: str = "text-embedding-3-small", dimension: int = 768):
         """
         Only v3 models are supported.
@@ -76,6 +101,10 @@ class OpenAIEmbedding(Embedding):
 
 
 class CohereEmbedding(Embedding):
+    # Cohere allows up to 96 texts per request
+    max_batch_size = 96
+    max_concurrent_batches = 4
+
     def __init__(self, model: str = "embed-english-v3.0", dimension: Optional[int] = None):
         super().__init__()
 
@@ -116,6 +145,11 @@ class CohereEmbedding(Embedding):
 
 
 class VoyageAIEmbedding(Embedding):
+    # Voyage allows up to 128 texts and 120k tokens per request for its larger models
+    max_batch_size = 128
+    max_batch_tokens = 120_000
+    max_concurrent_batches = 4
+
     def __init__(self, model: str = "voyage-large-2", dimension: Optional[int] = None):
         super().__init__()
         self.model = model
@@ -147,17 +181,35 @@ class VoyageAIEmbedding(Embedding):
 
 
 class OllamaEmbedding(Embedding):
+    """
+    Embeddings from a local Ollama server, requested with its batch embed endpoint: batch_size texts per
+    request, with up to max_workers requests in flight. The model is pulled when the embedding model is
+    created, unless the server already has it.
+    """
+
+    execution_settings = ("batch_size", "max_workers")
 
     def __init__(
         self,
         model: str = "llama3",
         dimension: Optional[int] = None,
         client: "ollama.Client" = None,
+        batch_size: int = 64,
+        max_workers: int = 2,
     ):
         super().__init__(dimension)
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
         self.model = model
         self.client = client or ollama.Client()
-        ollama.pull(model)
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        # Ingestion batches the same way
+        self.max_batch_size = batch_size
+        self.max_concurrent_batches = max_workers
+        self._pull_model_if_missing()
 
         if dimension is None:
             try:
@@ -169,18 +221,201 @@ class OllamaEmbedding(Embedding):
         else:
             self.dimension = dimension
 
-    def get_embeddings(self, text: list[str], input_type: Optional[str]):
-        if isinstance(text, list):
-            responses = []
-            for text in text:
-                response = self.client.embeddings(model=self.model, prompt=text)
-                responses.append(response["embedding"])
-            return responses
+    def _pull_model_if_missing(self) -> None:
+        try:
+            self.client.show(self.model)
+        except ollama.ResponseError as e:
+            if e.status_code != 404:
+                raise
+            self.client.pull(self.model)
+
+    def _embed_batch(self, texts: list[str]) -> list[Vector]:
+        response = self.client.embed(model=self.model, input=texts)
+        return list(response["embeddings"])
+
+    def get_embeddings(self, text: list[str], input_type: Optional[str] = None):
+        texts = [text] if isinstance(text, str) else list(text)
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) <= 1 or self.max_workers == 1:
+            results = [self._embed_batch(batch) for batch in batches]
         else:
-            response = self.client.embeddings(model=self.model, prompt=text)
-            return response["embedding"]
+            # map returns the results in the order of the batches
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+                results = list(executor.map(self._embed_batch, batches))
+        embeddings = [embedding for batch_embeddings in results for embedding in batch_embeddings]
+        return embeddings[0] if isinstance(text, str) else embeddings
 
     def to_dict(self):
         base_dict = super().to_dict()
-        base_dict.update({"model": self.model})
-        return base_dict
\ No newline at end of file
+        base_dict.update({"model": self.model, "batch_size": self.batch_size, "max_workers": self.max_workers})
+        return base_dict
+
+
+class HashingEmbedding(Embedding):
+    """
+    Embeddings computed locally on the CPU, with no model files or network access: the word n-grams of each
+    text are hashed into n_features buckets (with sublinear term frequencies), and the result is projected
+    onto dimension dimensions with a sparse random projection that is also derived by hashing, then
+    normalized.
+
+    The embeddings only capture lexical overlap, not meaning, so this is meant for air-gapped and test
+    deployments and for benchmarks without network calls. They're deterministic: the same text and
+    settings always give the same embedding, in any process. Texts are processed in batches of batch_size,
+    on up to num_threads threads (tokenization holds the GIL, so only the vectorized projection runs in
+    parallel).
+    """
+
+    max_batch_size = 1024
+    execution_settings = ("batch_size", "num_threads")
+
+    def __init__(
+        self,
+        dimension: int = 384,
+        n_features: int = 2**20,
+        ngram_range: tuple[int, int] = (1, 2),
+        num_hashes: int = 4,
+        batch_size: int = 256,
+        num_threads: int = 1,
+    ):
+        super().__init__(dimension)
+        if dimension < 1:
+            raise ValueError("dimension must be at least 1")
+        if num_hashes < 1:
+            raise ValueError("num_hashes must be at least 1")
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        if num_threads < 1:
+            raise ValueError("num_threads must be at least 1")
+        self.n_features = n_features
+        # Lists when loaded from JSON
+        self.ngram_range = tuple(ngram_range)
+        self.num_hashes = num_hashes
+        self.batch_size = batch_size
+        self.num_threads = num_threads
+        self.vectorizer = sklearn_text.HashingVectorizer(
+            n_features=n_features, ngram_range=self.ngram_range, alternate_sign=False, norm=None
+        )
+
+    def _project(self, features) -> np.ndarray:
+        # Each hashed feature is added to num_hashes dimensions, with a sign, chosen by hashing its index.
+        # This is a multiplication by a sparse random projection matrix, without building the matrix.
+        counts = features.tocoo()
+        weights = np.log1p(counts.data).astype(np.float32) / np.sqrt(self.num_hashes)
+        columns = counts.col.astype(np.int32)
+        rows = counts.row.astype(np.int64) * self.dimension
+        embeddings = np.zeros(features.shape[0] * self.dimension, dtype=np.float64)
+        for seed in range(self.num_hashes):
+            hashes = sklearn_utils.murmurhash3_32(columns, seed=seed, positive=True).astype(np.int64)
+            signs = np.where(hashes & 1, 1.0, -1.0).astype(np.float32)
+            embeddings += np.bincount(
+                rows + (hashes >> 1) % self.dimension, weights=signs * weights, minlength=len(embeddings)
+            )
+        embeddings = embeddings.reshape(features.shape[0], self.dimension).astype(np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.where(norms == 0, 1.0, norms)
+
+    def _embed_batch(self, texts: list[str]) -> np.ndarray:
+        return self._project(self.vectorizer.transform(texts))
+
+    def get_embeddings(self, text: list[str], input_type: Optional[str] = None) -> list[Vector]:
+        texts = [text] if isinstance(text, str) else list(text)
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) <= 1 or self.num_threads == 1:
+            results = [self._embed_batch(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.num_threads, len(batches))) as executor:
+                results = list(executor.map(self._embed_batch, batches))
+        embeddings = np.concatenate(results).tolist() if results else []
+        return embeddings[0] if isinstance(text, str) else embeddings
+
+    def to_dict(self):
+        base_dict = super().to_dict()
+        base_dict.update({
+            "n_features": self.n_features,
+            "ngram_range": list(self.ngram_range),
+            "num_hashes": self.num_hashes,
+            "batch_size": self.batch_size,
+            "num_threads": self.num_threads,
+        })
+        return base_dict
+
+
+class CachedEmbedding(Embedding):
+    """
+    Wraps another Embedding with a persistent cache (see EmbeddingCache), so unchanged or duplicate chunks
+    aren't embedded again when documents are re-ingested.
+
+    Entries are keyed on a hash of the wrapped model's configuration (its to_dict(), without the
+    execution_settings), the input_type and the hash of the text, so changing a setting that affects the
+    embeddings starts a new set of entries. The cache file can be shared by several KBs. Embeddings are
+    stored and returned as float32 values, whether or not they were cached. get_cache_stats() returns the hit
+    and miss counts, which are also reported in the ingestion logs.
+    """
+
+    def __init__(
+        self,
+        inner: Union[Embedding, dict],
+        cache_path: str = "~/dsRAG/embedding_cache.db",
+        max_bytes: int = 1024 * 1024 * 1024,
+        dimension: Optional[int] = None,
+    ):
+        if isinstance(inner, dict):
+            # Loaded from to_dict()
+            inner = Embedding.from_dict(dict(inner))
+        # Only accepted so to_dict() round-trips; the dimension is always the wrapped model's
+        if dimension is not None and dimension != inner.dimension:
+            raise ValueError(f"dimension {dimension} doesn't match the wrapped model's dimension {inner.dimension}")
+        super().__init__(inner.dimension)
+        self.inner = inner
+        # Batched like the wrapped model
+        self.max_batch_size = inner.max_batch_size
+        self.max_batch_tokens = inner.max_batch_tokens
+        self.max_concurrent_batches = inner.max_concurrent_batches
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.cache = EmbeddingCache(cache_path, max_bytes)
+        model_config = {
+            key: value for key, value in inner.to_dict().items() if key not in inner.execution_settings
+        }
+        self.model_key = hashlib.sha256(
+            json.dumps(model_config, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_embeddings(self, text: list[str], input_type: Optional[str] = None) -> list[Vector]:
+        texts = [text] if isinstance(text, str) else list(text)
+        cache_input_type = input_type or ""
+        embeddings = self.cache.get_many(self.model_key, cache_input_type, texts)
+        # Texts that appear more than once in the batch are only embedded once
+        missing = list(dict.fromkeys(t for t, embedding in zip(texts, embeddings) if embedding is None))
+        with self._lock:
+            self.hits += len(texts) - sum(embedding is None for embedding in embeddings)
+            self.misses += sum(embedding is None for embedding in embeddings)
+        if missing:
+            # Rounded to float32 like the cached ones, so the values don't depend on whether the cache was hit
+            new_embeddings = [
+                np.asarray(embedding, dtype=np.float32).tolist()
+                for embedding in self.inner.get_embeddings(missing, input_type=input_type)
+            ]
+            self.cache.put_many(self.model_key, cache_input_type, missing, new_embeddings)
+            new_embeddings = dict(zip(missing, new_embeddings))
+            embeddings = [
+                new_embeddings[t] if embedding is None else embedding for t, embedding in zip(texts, embeddings)
+            ]
+        return embeddings[0] if isinstance(text, str) else embeddings
+
+    def get_cache_stats(self) -> dict[str, int]:
+        """Hit and miss counts since this object was created, and the size of the cache file's embeddings."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "num_bytes": self.cache.get_size()}
+
+    def to_dict(self):
+        base_dict = super().to_dict()
+        base_dict.update({
+            "inner": self.inner.to_dict(),
+            "cache_path": self.cache_path,
+            "max_bytes": self.max_bytes,
+        })
+        return base_dict
@@ -0,0 +1,199 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache, stored as float32 blobs in a SQLite file.
+
+    Entries are keyed on a model key (which identifies the embedding model and its settings), the
+    input_type and the SHA-256 of the text, so the same file can be shared by several models and KBs.
+    Once the stored embeddings take up more than max_bytes, the least recently used ones are evicted.
+    """
+
+    def __init__(self, path: str = "~/dsRAG/embedding_cache.db", max_bytes: int = 1024 * 1024 * 1024) -> None:
+        if max_bytes < 1:
+            raise ValueError("max_bytes must be at least 1")
+        self.path = os.path.expanduser(path)
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        # One connection shared by all threads; the lock serializes its use
+        self._conn = sqlite3.connect(self.path, timeout=60.0, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (model_key TEXT NOT NULL, input_type TEXT NOT NULL, "
+                "text_hash BLOB NOT NULL, embedding BLOB NOT NULL, last_used REAL NOT NULL, "
+                "PRIMARY KEY (model_key, input_type, text_hash))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            # Total size of the stored embeddings, kept up to date on every write so eviction doesn't scan
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY CHECK (id = 0), num_bytes INTEGER NOT NULL)"
+            )
+            self._conn.execute(
+                "INSERT OR IGNORE INTO cache_size (id, num_bytes) "
+                "SELECT 0, COALESCE(SUM(LENGTH(embedding)), 0) FROM embeddings"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def hash_text(text: str) -> bytes:
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def get_many(self, model_key: str, input_type: str, texts: list[str]) -> list[Optional[list[float]]]:
+        """The cached embedding of each text, or None where it isn't cached."""
+        hashes = [self.hash_text(text) for text in texts]
+        found = {}
+        with self._lock:
+            unique_hashes = list(dict.fromkeys(hashes))
+            # Stay under SQLite's limit on the number of parameters per statement
+            for i in range(0, len(unique_hashes), 500):
+                batch = unique_hashes[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, embedding FROM embeddings WHERE model_key = ? AND input_type = ? "
+                    f"AND text_hash IN ({', '.join(['?'] * len(batch))})",
+                    [model_key, input_type, *batch],
+                ).fetchall()
+                found.update(rows)
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model_key = ? AND input_type = ? AND text_hash = ?",
+                    [(time.time(), model_key, input_type, text_hash) for text_hash in found],
+                )
+                self._conn.commit()
+        return [
+            np.frombuffer(found[text_hash], dtype=np.float32).tolist() if text_hash in found else None
+            for text_hash in hashes
+        ]
+
+    def put_many(self, model_key: str, input_type: str, texts: list[str], embeddings: list) -> None:
+        now = time.time()
+        with self._lock:
+            num_bytes = 0
+            for text, embedding in zip(texts, embeddings):
+                blob = np.asarray(embedding, dtype=np.float32).tobytes()
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO embeddings (model_key, input_type, text_hash, embedding, last_used) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (model_key, input_type, self.hash_text(text), blob, now),
+                )
+                if cursor.rowcount == 1:
+                    num_bytes += len(blob)
+            self._conn.execute("UPDATE cache_size SET num_bytes = num_bytes + ? WHERE id = 0", (num_bytes,))
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        # Drop the least recently used entries until the cache is back under 90% of max_bytes, so eviction
+        # doesn't run on every write once the cache is full
+        num_bytes = self._conn.execute("SELECT num_bytes FROM cache_size WHERE id = 0").fetchone()[0]
+        if num_bytes <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        while num_bytes > target:
+            rows = self._conn.execute(
+                "SELECT rowid, LENGTH(embedding) FROM embeddings ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                break
+            evicted = []
+            for rowid, size in rows:
+                if num_bytes <= target:
+                    break
+                evicted.append((rowid,))
+                num_bytes -= size
+            self._conn.executemany("DELETE FROM embeddings WHERE rowid = ?", evicted)
+        self._conn.execute("UPDATE cache_size SET num_bytes = ? WHERE id = 0", (max(num_bytes, 0),))
+
+    def get_size(self) -> int:
+        """Total size of the stored embeddings, in bytes."""
+        with self._lock:
+            return self._conn.execute("SELECT num_bytes FROM cache_size WHERE id = 0").fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.execute("UPDATE cache_size SET num_bytes = 0 WHERE id = 0")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded in-memory cache of query embeddings, used by KnowledgeBase so repeated queries skip the
+    embedding call.
+
+    Holds up to max_entries embeddings, evicting the least recently used ones, and entries expire after ttl
+    seconds if ttl is set. It's thread-safe; get_stats() returns the hit, miss and eviction counts.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None) -> None:
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        if ttl is not None and ttl <= 0:
+            raise ValueError("ttl must be positive")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # query -> (embedding, expires_at)
+        self._cache: OrderedDict[str, tuple[list, Optional[float]]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_embeddings(self, queries: list[str], embed: Callable[[list[str]], list]) -> list:
+        """
+        The embeddings of the queries, calling embed (with a list of queries) only for the ones that aren't
+        cached. Queries repeated within the list are embedded once.
+        """
+        embeddings = {}
+        now = time.monotonic()
+        with self._lock:
+            for query in queries:
+                entry = self._cache.get(query)
+                if entry is not None and (entry[1] is None or entry[1] > now):
+                    self._cache.move_to_end(query)
+                    embeddings[query] = entry[0]
+                    self.hits += 1
+                else:
+                    self.misses += 1
+        missing = list(dict.fromkeys(query for query in queries if query not in embeddings))
+        if missing:
+            # Embedded outside the lock, so other queries aren't blocked on the round trip
+            new_embeddings = embed(missing)
+            expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+            with self._lock:
+                for query, embedding in zip(missing, new_embeddings):
+                    embeddings[query] = embedding
+                    self._cache[query] = (embedding, expires_at)
+                    self._cache.move_to_end(query)
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+                    self.evictions += 1
+        return [embeddings[query] for query in queries]
+
+    def get_stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "num_entries": len(self._cache),
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
@@ -24,7 +24,8 @@ from dsrag.rse import (
 from dsrag.database.vector import Vector, VectorDB, BasicVectorDB
 from dsrag.database.vector.types import MetadataFilter
 from dsrag.database.chunk import ChunkDB, BasicChunkDB
-from dsrag.embedding import Embedding, OpenAIEmbedding
+from dsrag.embedding import CachedEmbedding, Embedding, OpenAIEmbedding
+from dsrag.embedding_cache import QueryEmbeddingCache
 from dsrag.reranker import Reranker, CohereReranker
 from dsrag.llm import LLM, OpenAIChatAPI
 from dsrag.dsparse.file_parsing.file_system import FileSystem, LocalFileSystem
@@ -48,7 +49,9 @@ class KnowledgeBase:
         file_system: Optional[FileSystem] = None,
         exists_ok: bool = True,
         save_metadata_to_disk: bool = True,
-        metadata_storage: Optional[MetadataStorage] = None
+        metadata_storage: Optional[MetadataStorage] = None,
+        query_embedding_cache_size: int = 1024,
+        query_embedding_cache_ttl: Optional[float] = None,
     ):
         """Initialize a KnowledgeBase instance.
 
@@ -75,12 +78,21 @@ class KnowledgeBase:
             save_metadata_to_disk (bool, optional): Whether to persist metadata. Defaults to True.
             metadata_storage (Optional[MetadataStorage], optional): Storage for KB metadata. 
                 Defaults to LocalMetadataStorage.
+            query_embedding_cache_size (int, optional): Number of query embeddings kept in memory, so
+                repeated queries aren't embedded again. 0 disables the cache. Defaults to 1024.
+            query_embedding_cache_ttl (Optional[float], optional): Seconds after which a cached query
+                embedding expires. Defaults to None (no expiry).
 
         Raises:
             ValueError: If KB exists and exists_ok is False.
         """
         self.kb_id = kb_id
         self.storage_directory = os.path.expanduser(storage_directory)
+        self.query_embedding_cache = (
+            QueryEmbeddingCache(query_embedding_cache_size, query_embedding_cache_ttl)
+            if query_embedding_cache_size > 0
+            else None
+        )
         self.metadata_storage = metadata_storage if metadata_storage else LocalMetadataStorage(self.storage_directory)
 
         if save_metadata_to_disk:
@@ -420,7 +432,7 @@ class KnowledgeBase:
                 raise ValueError("Either text or file_path must be provided")
 
             # verify that the document does not already exist in the KB - the doc_id should be unique
-            if doc_id in self.chunk_db.get_all_doc_ids():
+            if self.chunk_db.has_document(doc_id):
                 ingestion_logger.warning(
                     "Document already exists in knowledge base, skipping", 
                     extra=base_extra
@@ -472,17 +484,29 @@ class KnowledgeBase:
             
             # --- Embedding Step ---
             step_start_time = time.perf_counter()
+            cache_stats = (
+                self.embedding_model.get_cache_stats() if isinstance(self.embedding_model, CachedEmbedding) else None
+            )
             chunk_embeddings = get_embeddings(
                 embedding_model=self.embedding_model,
                 chunks_to_embed=chunks_to_embed,
             )
             step_duration = time.perf_counter() - step_start_time
+            embedding_extra = {}
+            if cache_stats is not None:
+                # Counted across the whole embedding model, so concurrent ingestions are included
+                new_cache_stats = self.embedding_model.get_cache_stats()
+                embedding_extra = {
+                    "cache_hits": new_cache_stats["hits"] - cache_stats["hits"],
+                    "cache_misses": new_cache_stats["misses"] - cache_stats["misses"],
+                }
             ingestion_logger.debug("Embedding complete", extra={
                 **base_extra, 
                 "step": "embedding", 
                 "duration_s": round(step_duration, 4),
                 "num_embeddings": len(chunk_embeddings), 
-                "model": self.embedding_model.__class__.__name__
+                "model": self.embedding_model.__class__.__name__,
+                **embedding_extra,
             })
             
             # --- DB Storage Step ---
@@ -596,6 +620,14 @@ class KnowledgeBase:
             The default implementations (BasicVectorDB and BasicChunkDB) are not thread-safe.
         """
         successful_uploads = []
+
+        # Check all the documents against the chunk DB at once, rather than one lookup per document
+        existing_doc_ids = self.chunk_db.get_existing_doc_ids(
+            [doc["doc_id"] for doc in documents if "doc_id" in doc]
+        )
+        if existing_doc_ids:
+            print(f"Skipping {len(existing_doc_ids)} documents that already exist in the knowledge base")
+            documents = [doc for doc in documents if doc.get("doc_id") not in existing_doc_ids]
         
         def process_document(doc: Dict) -> Optional[str]:
             try:
@@ -676,6 +708,30 @@ class KnowledgeBase:
         
         return successful_uploads
 
+    def stats(self) -> dict:
+        """Get statistics about the knowledge base.
+
+        The chunk database keeps its counters up to date as documents are added and removed, so this doesn't
+        scan the KB.
+
+        Returns:
+            dict: A dictionary with:
+                - num_documents (int): Number of documents
+                - num_chunks (int): Number of chunks
+                - num_characters (int): Total length of the chunk text
+                - num_vectors (Optional[int]): Number of vectors, or None if the vector DB can't count them
+                  cheaply
+                - supp_id_counts (dict[str, int]): Number of documents with each supp_id
+        """
+        chunk_db_stats = self.chunk_db.get_stats()
+        return {
+            "num_documents": chunk_db_stats["num_documents"],
+            "num_chunks": chunk_db_stats["num_chunks"],
+            "num_characters": chunk_db_stats["num_characters"],
+            "num_vectors": self.vector_db.get_num_vectors(),
+            "supp_id_counts": chunk_db_stats["supp_id_counts"],
+        }
+
     def delete_document(self, doc_id: str):
         """Delete a document from the knowledge base.
 
@@ -722,8 +778,13 @@ class KnowledgeBase:
     def _get_embeddings(self, text: list[str], input_type: str = "") -> list[Vector]:
         """Generate embeddings for text.
 
-        Internal method to interface with embedding model.
+        Internal method to interface with embedding model. Query embeddings go through the query embedding
+        cache.
         """
+        if input_type == "query" and self.query_embedding_cache is not None:
+            return self.query_embedding_cache.get_embeddings(
+                text, lambda queries: self.embedding_model.get_embeddings(queries, input_type)
+            )
         return self.embedding_model.get_embeddings(text, input_type)
 
     def _cosine_similarity(self, v1, v2):
@@ -740,68 +801,108 @@ class KnowledgeBase:
         """
         query_vector = self._get_embeddings([query], input_type="query")[0]
         search_results = self.vector_db.search(query_vector, top_k, metadata_filter)
+        return self._rerank(query, search_results)
+
+    def _rerank(self, query: str, search_results: list) -> list:
         if len(search_results) == 0:
             return []
-        search_results = self.reranker.rerank_search_results(query, search_results)
-        return search_results
+        return self.reranker.rerank_search_results(query, search_results)
 
     def _get_all_ranked_results(self, search_queries: list[str], metadata_filter: Optional[MetadataFilter] = None):
         """Execute multiple search queries.
 
-        Internal method for parallel query execution.
+        Internal method for batched query execution: all queries are embedded in one call and searched
+        in one vector DB batch, then reranked in parallel.
         """
+        if len(search_queries) == 0:
+            return []
+        query_vectors = self._get_embeddings(search_queries, input_type="query")
+        all_search_results = self.vector_db.search_many(query_vectors, 200, metadata_filter)
         with concurrent.futures.ThreadPoolExecutor() as executor:
-            futures = [executor.submit(self._search, query, 200, metadata_filter) for query in search_queries]
+            futures = [
+                executor.submit(self._rerank, query, search_results)
+                for query, search_results in zip(search_queries, all_search_results)
+            ]
             all_ranked_results = []
             for future in futures:
                 ranked_results = future.result()
                 all_ranked_results.append(ranked_results)
         return all_ranked_results
     
-    def _get_segment_page_numbers(self, doc_id: str, chunk_start: int, chunk_end: int) -> tuple:
+    # Chunk fields needed to build a segment, fetched in one ChunkDB.get_chunks call
+    SEGMENT_CHUNK_FIELDS = [
+        "chunk_text",
+        "is_visual",
+        "chunk_page_start",
+        "chunk_page_end",
+        "document_title",
+        "document_summary",
+    ]
+
+    def _get_segment_chunks(self, doc_id: str, chunk_start: int, chunk_end: int) -> dict[int, dict]:
+        """Get all chunk fields needed to build a segment.
+
+        Internal method that fetches the whole segment with a single chunk DB call.
+        """
+        return self.chunk_db.get_chunks(doc_id, chunk_start, chunk_end, fields=self.SEGMENT_CHUNK_FIELDS)
+
+    def _get_segment_page_numbers(
+        self, doc_id: str, chunk_start: int, chunk_end: int, chunks: Optional[dict[int, dict]] = None
+    ) -> tuple:
         """Get page numbers for a segment.
 
-        Internal method for page number lookup.
+        Internal method for page number lookup. Chunks already fetched with _get_segment_chunks can be
+        passed in to avoid another database call.
         """
-        start_page_number, _ = self.chunk_db.get_chunk_page_numbers(doc_id, chunk_start)
-        _, end_page_number = self.chunk_db.get_chunk_page_numbers(doc_id, chunk_end - 1)
+        if chunks is None:
+            chunks = self._get_segment_chunks(doc_id, chunk_start, chunk_end)
+        start_page_number = chunks.get(chunk_start, {}).get("chunk_page_start")
+        end_page_number = chunks.get(chunk_end - 1, {}).get("chunk_page_end")
         return start_page_number, end_page_number
     
-    def _get_segment_content_from_database(self, doc_id: str, chunk_start: int, chunk_end: int, return_mode: str):
+    def _get_segment_content_from_database(
+        self,
+        doc_id: str,
+        chunk_start: int,
+        chunk_end: int,
+        return_mode: str,
+        chunks: Optional[dict[int, dict]] = None,
+    ):
         """Retrieve segment content from database.
 
-        Internal method for content retrieval.
+        Internal method for content retrieval. Chunks already fetched with _get_segment_chunks can be
+        passed in to avoid another database call.
         """
         assert return_mode in ["text", "page_images", "dynamic"]
+        if chunks is None:
+            chunks = self._get_segment_chunks(doc_id, chunk_start, chunk_end)
 
         if return_mode == "dynamic":
-            # loop through the chunks in the segment to see if any of them are visual
-            segment_is_visual = False
-            for chunk_index in range(chunk_start, chunk_end):
-                is_visual = self._get_is_visual(doc_id, chunk_index)
-                if is_visual:
-                    segment_is_visual = True
-                    break
-
-            # set the return mode based on whether the segment contains visual content or not
+            # set the return mode based on whether any of the chunks in the segment contain visual content
+            segment_is_visual = any(chunk.get("is_visual") for chunk in chunks.values())
             if segment_is_visual:
                 return_mode = "page_images"
             else:
                 return_mode = "text"
 
         if return_mode == "text":
-            segment_text = f"{self._get_segment_header(doc_id=doc_id, chunk_index=chunk_start)}\n\n"  # initialize the segment with the segment header
+            first_chunk = chunks.get(chunk_start, {})
+            segment_header = get_segment_header(
+                document_title=first_chunk.get("document_title") or "",
+                document_summary=first_chunk.get("document_summary") or "",
+            )
+            segment_text = f"{segment_header}\n\n"  # initialize the segment with the segment header
             for chunk_index in range(chunk_start, chunk_end):
-                chunk_text = self._get_chunk_text(doc_id, chunk_index) or ""
+                chunk_text = chunks.get(chunk_index, {}).get("chunk_text") or ""
                 segment_text += chunk_text
             return segment_text.strip()
         else:
             # get the page numbers that the segment starts and ends on
-            start_page_number, end_page_number = self._get_segment_page_numbers(doc_id, chunk_start, chunk_end)
+            start_page_number, end_page_number = self._get_segment_page_numbers(doc_id, chunk_start, chunk_end, chunks)
             page_image_paths = self.file_system.get_files(kb_id=self.kb_id, doc_id=doc_id, page_start=start_page_number, page_end=end_page_number)
             # If there are no page images, fallback to using text mode
             if page_image_paths == []:
-                page_image_paths = self._get_segment_content_from_database(doc_id, chunk_start, chunk_end, return_mode="text")
+                page_image_paths = self._get_segment_content_from_database(doc_id, chunk_start, chunk_end, return_mode="text", chunks=chunks)
             return page_image_paths
 
     def query(
@@ -1034,18 +1135,27 @@ class KnowledgeBase:
                 score = scores[segment_index]
                 relevant_segment_info[-1]["score"] = score
 
-            # retrieve the content for each of the segments
-            for segment_info in relevant_segment_info:
+            # retrieve the chunks of all the segments at once, then build the content of each segment
+            all_segment_chunks = self.chunk_db.get_segments(
+                [
+                    (segment_info["doc_id"], segment_info["chunk_start"], segment_info["chunk_end"])
+                    for segment_info in relevant_segment_info
+                ],
+                fields=self.SEGMENT_CHUNK_FIELDS,
+            )
+            for segment_info, chunks in zip(relevant_segment_info, all_segment_chunks):
                 segment_info["content"] = self._get_segment_content_from_database(
                     segment_info["doc_id"],
                     segment_info["chunk_start"],
                     segment_info["chunk_end"],
                     return_mode=return_mode,
+                    chunks=chunks,
                 )
                 start_page_number, end_page_number = self._get_segment_page_numbers(
                     segment_info["doc_id"],
                     segment_info["chunk_start"],
-                    segment_info["chunk_end"]
+                    segment_info["chunk_end"],
+                    chunks=chunks,
                 )
                 segment_info["segment_page_start"] = start_page_number
                 segment_info["segment_page_end"] = end_page_number
@@ -0,0 +1,159 @@
+"""
+Benchmark chunk text compression in BasicChunkDB and SQLiteDB: size on disk, write time and the latency of
+reading segments (what a query does), without compression, with zstd, and with zstd and a trained
+dictionary.
+
+By default the corpus is synthetic: documents assembled from a vocabulary with recurring phrases, so it
+compresses roughly like real prose. Pass --text-dir with a directory of .txt or .md files for numbers that
+reflect your own data.
+
+Usage:
+    python eval/compression_benchmark.py --num-documents 500
+    python eval/compression_benchmark.py --text-dir ~/documents --chunk-size 800
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from dsrag.database.chunk import BasicChunkDB, SQLiteDB
+
+
+CONFIGS = {
+    "none": {},
+    "zstd": {"compression": "zstd"},
+    "zstd_dictionary": {"compression": "zstd", "compression_dictionary": True},
+}
+
+CHUNK_DBS = {
+    "basic": BasicChunkDB,
+    "sqlite": SQLiteDB,
+}
+
+
+def make_synthetic_documents(num_documents: int, chunks_per_document: int, seed: int = 0) -> list[list[str]]:
+    rng = np.random.default_rng(seed)
+    vocabulary = [
+        "".join(rng.choice(list("abcdefghijklmnopqrstuvwxyz"), size=rng.integers(2, 10)))
+        for _ in range(5000)
+    ]
+    # Word frequencies follow a Zipf-like distribution, like natural language
+    weights = 1 / np.arange(1, len(vocabulary) + 1)
+    weights /= weights.sum()
+    # Boilerplate that recurs across documents (headers, disclaimers, defined terms), which is what a
+    # trained dictionary picks up
+    phrases = [" ".join(rng.choice(vocabulary, size=12, p=weights)) + "." for _ in range(200)]
+    documents = []
+    for _ in range(num_documents):
+        chunks = []
+        for _ in range(chunks_per_document):
+            sentences = []
+            while sum(len(sentence) for sentence in sentences) < 800:
+                if rng.random() < 0.3:
+                    sentences.append(phrases[rng.integers(len(phrases))])
+                else:
+                    sentences.append(" ".join(rng.choice(vocabulary, size=rng.integers(8, 20), p=weights)) + ".")
+            chunks.append(" ".join(sentences))
+        documents.append(chunks)
+    return documents
+
+
+def load_documents(text_dir: str, chunk_size: int) -> list[list[str]]:
+    documents = []
+    for root, _, file_names in os.walk(os.path.expanduser(text_dir)):
+        for file_name in sorted(file_names):
+            if file_name.endswith((".txt", ".md")):
+                with open(os.path.join(root, file_name), encoding="utf-8", errors="ignore") as f:
+                    text = f.read()
+                chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+                if chunks:
+                    documents.append(chunks)
+    return documents
+
+
+def directory_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, file_name))
+        for root, _, file_names in os.walk(path)
+        for file_name in file_names
+    )
+
+
+def run_config(db_name, config_name, config, documents, num_queries, segment_length, storage_directory):
+    kb_id = f"benchmark_{config_name}"
+    db = CHUNK_DBS[db_name](kb_id, storage_directory, **config)
+    start = time.perf_counter()
+    for i in range(0, len(documents), 100):
+        db.add_documents([
+            {"doc_id": str(j), "chunks": {k: {"chunk_text": text} for k, text in enumerate(documents[j])}}
+            for j in range(i, min(i + 100, len(documents)))
+        ])
+    write_time = time.perf_counter() - start
+    size = directory_size(os.path.join(storage_directory, "chunk_storage"))
+
+    # Reload so reads go to the persisted data
+    db = CHUNK_DBS[db_name].from_dict(db.to_dict())
+    rng = np.random.default_rng(1)
+    latencies = []
+    for _ in range(num_queries):
+        doc_index = int(rng.integers(len(documents)))
+        chunk_start = int(rng.integers(max(1, len(documents[doc_index]) - segment_length + 1)))
+        segments = [(str(doc_index), chunk_start, chunk_start + segment_length)]
+        start = time.perf_counter()
+        db.get_segments(segments, fields=["chunk_text"])
+        latencies.append(time.perf_counter() - start)
+    db.delete()
+    shutil.rmtree(os.path.join(storage_directory, "chunk_storage"), ignore_errors=True)
+    return size, write_time, np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--text-dir", help="Directory of .txt or .md files to use as the corpus")
+    parser.add_argument("--chunk-size", type=int, default=800, help="Characters per chunk with --text-dir")
+    parser.add_argument("--num-documents", type=int, default=200)
+    parser.add_argument("--chunks-per-document", type=int, default=50)
+    parser.add_argument("--num-queries", type=int, default=500)
+    parser.add_argument("--segment-length", type=int, default=5)
+    parser.add_argument("--chunk-dbs", nargs="+", default=list(CHUNK_DBS), choices=list(CHUNK_DBS))
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGS), choices=list(CONFIGS))
+    args = parser.parse_args()
+
+    if args.text_dir:
+        documents = load_documents(args.text_dir, args.chunk_size)
+    else:
+        documents = make_synthetic_documents(args.num_documents, args.chunks_per_document)
+    num_chunks = sum(len(chunks) for chunks in documents)
+    num_characters = sum(len(text) for chunks in documents for text in chunks)
+
+    storage_directory = tempfile.mkdtemp()
+    try:
+        print(f"{len(documents)} documents, {num_chunks} chunks, {num_characters / 1e6:.1f}M characters")
+        print(f"{'chunk db':<10}{'config':<18}{'size MB':>10}{'ratio':>8}{'write s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for db_name in args.chunk_dbs:
+            baseline_size = None
+            for config_name in args.configs:
+                size, write_time, latencies = run_config(
+                    db_name, config_name, CONFIGS[config_name], documents, args.num_queries,
+                    args.segment_length, storage_directory,
+                )
+                if baseline_size is None:
+                    baseline_size = size
+                print(
+                    f"{db_name:<10}{config_name:<18}{size / 1e6:>10.2f}{baseline_size / size:>8.2f}"
+                    f"{write_time:>10.2f}{np.percentile(latencies, 50) * 1000:>10.3f}"
+                    f"{np.percentile(latencies, 95) * 1000:>10.3f}"
+                )
+    finally:
+        shutil.rmtree(storage_directory)
+
+
+if __name__ == "__main__":
+    main()
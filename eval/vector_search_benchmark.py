@@ -0,0 +1,116 @@
+"""
+Benchmark the search options of BasicVectorDB: recall@k against exact search, and query latency.
+
+By default the corpus is synthetic: random vectors clustered around topics, with a variance that decays
+along the dimensions. This roughly mimics embeddings from models trained with Matryoshka representation
+learning (most of the information is in the leading dimensions). Pass --vectors with a .npy file of real embeddings, e.g.
+from OpenAIEmbedding("text-embedding-3-small"), for numbers that reflect your own data.
+
+Usage:
+    python eval/vector_search_benchmark.py --num-vectors 100000 --dimension 1536
+    python eval/vector_search_benchmark.py --vectors embeddings.npy --num-queries 200
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from dsrag.database.vector import BasicVectorDB
+
+
+CONFIGS = {
+    "exact": {},
+    "int8": {"quantization": "int8"},
+    "binary": {"quantization": "binary", "rescore_oversample": 10},
+    "truncate_256": {"truncate_dimension": 256},
+    "truncate_256_int8": {"truncate_dimension": 256, "quantization": "int8"},
+    "ivf_256": {"ivf_nlist": 256, "ivf_nprobe": 16},
+    "ivf_256_truncate_256": {"ivf_nlist": 256, "ivf_nprobe": 16, "truncate_dimension": 256},
+}
+
+
+def make_synthetic_vectors(num_vectors: int, dimension: int, num_topics: int = 1000, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    decay = np.exp(-np.arange(dimension) / (dimension / 8))
+    # Chunks cluster around topics, like real document embeddings do
+    topics = rng.normal(size=(num_topics, dimension))
+    vectors = topics[rng.integers(num_topics, size=num_vectors)] + 0.7 * rng.normal(size=(num_vectors, dimension))
+    return (vectors * decay).astype(np.float32)
+
+
+def run_config(name, config, vectors, queries, top_k, storage_directory, storage_format):
+    kb_id = f"benchmark_{name}"
+    db = BasicVectorDB(kb_id, storage_directory, storage_format=storage_format, **config)
+    metadata = [{"doc_id": str(i // 100), "chunk_index": i % 100, "chunk_text": ""} for i in range(len(vectors))]
+    start = time.perf_counter()
+    for i in range(0, len(vectors), 10000):
+        db.add_vectors(vectors[i:i + 10000], metadata[i:i + 10000])
+    build_time = time.perf_counter() - start
+
+    # Reload so the timings include reading persisted data, then warm up
+    db = BasicVectorDB.from_dict(db.to_dict())
+    db.search(queries[0], top_k)
+
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        query_results = db.search(query, top_k)
+        latencies.append(time.perf_counter() - start)
+        results.append([r["metadata"]["doc_id"] + "_" + str(r["metadata"]["chunk_index"]) for r in query_results])
+    db.delete()
+    return results, np.array(latencies), build_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", help="Path to a .npy file with one embedding per row")
+    parser.add_argument("--num-vectors", type=int, default=50000)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--num-queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=200)
+    parser.add_argument("--storage-format", default="memmap", choices=["pickle", "memmap"])
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGS), choices=list(CONFIGS))
+    args = parser.parse_args()
+
+    if args.vectors:
+        vectors = np.load(args.vectors).astype(np.float32)
+    else:
+        vectors = make_synthetic_vectors(args.num_vectors, args.dimension)
+    # Queries are held-out perturbations of stored vectors, like a question close to a passage
+    rng = np.random.default_rng(1)
+    query_rows = rng.choice(len(vectors), size=args.num_queries, replace=False)
+    queries = vectors[query_rows] + 0.5 * vectors.std(axis=0) * rng.normal(size=(args.num_queries, vectors.shape[1]))
+
+    storage_directory = tempfile.mkdtemp()
+    try:
+        exact_results = None
+        print(f"{len(vectors)} vectors, {vectors.shape[1]} dimensions, top_k={args.top_k}")
+        print(f"{'config':<20}{'recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}{'build s':>10}")
+        for name in ["exact"] + [name for name in args.configs if name != "exact"]:
+            results, latencies, build_time = run_config(
+                name, CONFIGS[name], vectors, queries, args.top_k, storage_directory, args.storage_format
+            )
+            if exact_results is None:
+                exact_results = results
+            recall = np.mean([
+                len(set(result) & set(expected)) / len(expected)
+                for result, expected in zip(results, exact_results)
+            ])
+            print(
+                f"{name:<20}{recall:>10.3f}{np.percentile(latencies, 50) * 1000:>10.2f}"
+                f"{np.percentile(latencies, 95) * 1000:>10.2f}{build_time:>10.2f}"
+            )
+    finally:
+        shutil.rmtree(storage_directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,38 @@
+import gc
 import os
 import sys
 import unittest
 import shutil
+import pickle
+import sqlite3
+import threading
 import psycopg2
 import time
 import pytest
+from unittest import mock
+
+try:
+    # The DynamoDB tests run against moto's in-memory DynamoDB (pip install dsrag[test])
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 
+from dsrag.database.chunk import basic_db
 from dsrag.database.chunk.basic_db import BasicChunkDB
+from dsrag.database.chunk.cached_db import CachedChunkDB
 from dsrag.database.chunk.sqlite_db import SQLiteDB
 from dsrag.database.chunk.db import ChunkDB
 from dsrag.database.chunk.postgres_db import PostgresChunkDB
 from dsrag.database.chunk import DynamoDB
+from dsrag.database.chunk.dynamo_db import STATS_RECORD_KEY
+
+
+def make_chunk_text(seed: int) -> str:
+    # Text with the kind of repetition across chunks that a compression dictionary picks up
+    words = ["revenue", "quarter", "fiscal", "growth", "margin", "segment", "operating", "income", "net", "sales"]
+    return " ".join(words[(seed * 7 + i * i) % len(words)] for i in range(150))
 
 
 class TestChunkDB(unittest.TestCase):
@@ -85,6 +105,55 @@ class TestChunkDB(unittest.TestCase):
         page_numbers = db.get_chunk_page_numbers(doc_id, 1)
         self.assertEqual(page_numbers, (None, None))
 
+    def test__add_documents(self):
+        db = BasicChunkDB(self.kb_id, self.storage_directory)
+        documents = [
+            {
+                "doc_id": f"doc{i}",
+                "chunks": {j: {"chunk_text": f"Content of chunk {j} of document {i}"} for j in range(3)},
+                "supp_id": "supp1",
+            }
+            for i in range(4)
+        ]
+        db.add_documents(documents)
+        self.assertEqual(sorted(db.get_all_doc_ids()), ["doc0", "doc1", "doc2", "doc3"])
+        self.assertEqual(db.get_chunk_text("doc2", 1), "Content of chunk 1 of document 2")
+
+    def test__get_chunks(self):
+        db = BasicChunkDB(self.kb_id, self.storage_directory)
+        doc_id = "doc1"
+        chunks = {
+            i: {
+                "chunk_text": f"Content of chunk {i}",
+                "document_title": "Title of document 1",
+                "document_summary": "Summary of document 1",
+                "chunk_page_start": i + 1,
+                "chunk_page_end": i + 2,
+                "is_visual": i == 2,
+            }
+            for i in range(5)
+        }
+        db.add_document(doc_id, chunks)
+        db.add_document("doc2", {0: {"chunk_text": "Content of another document"}})
+
+        retrieved_chunks = db.get_chunks(doc_id, 1, 4, fields=["chunk_text", "chunk_page_start", "is_visual"])
+        self.assertEqual(sorted(retrieved_chunks), [1, 2, 3])
+        self.assertEqual(retrieved_chunks[1]["chunk_text"], "Content of chunk 1")
+        self.assertEqual(retrieved_chunks[3]["chunk_page_start"], 4)
+        self.assertTrue(retrieved_chunks[2]["is_visual"])
+        self.assertFalse(retrieved_chunks[1]["is_visual"])
+        self.assertEqual(set(retrieved_chunks[1]), {"chunk_text", "chunk_page_start", "is_visual"})
+
+        # All fields are returned by default, and chunks past the end of the document are left out
+        retrieved_chunks = db.get_chunks(doc_id, 3, 10)
+        self.assertEqual(sorted(retrieved_chunks), [3, 4])
+        self.assertEqual(retrieved_chunks[4]["document_title"], "Title of document 1")
+        self.assertFalse(retrieved_chunks[4]["section_title"])
+        self.assertEqual(db.get_chunks("missing_doc", 0, 5), {})
+
+        with self.assertRaises(ValueError):
+            db.get_chunks(doc_id, 0, 5, fields=["chunk_text; DROP TABLE documents"])
+
     def test__get_document_title(self):
         db = BasicChunkDB(self.kb_id, self.storage_directory)
         doc_id = "doc1"
@@ -129,6 +198,93 @@ class TestChunkDB(unittest.TestCase):
         db.remove_document(doc_id)
         self.assertNotIn(doc_id, db.data)
 
+    def test__get_stats(self):
+        db = BasicChunkDB(self.kb_id, self.storage_directory)
+        db.add_document("doc1", {0: {"chunk_text": "abc"}, 1: {"chunk_text": "de"}}, supp_id="a")
+        db.add_document("doc2", {0: {"chunk_text": "f"}}, supp_id="a")
+        db.add_document("doc3", {0: {"chunk_text": "gh"}})
+        # Replacing a document doesn't count it twice
+        db.add_document("doc3", {0: {"chunk_text": "ghi"}}, supp_id="b")
+        db.remove_document("doc2")
+        expected = {"num_documents": 2, "num_chunks": 3, "num_characters": 8, "supp_id_counts": {"a": 1, "b": 1}}
+        self.assertEqual(db.get_stats(), expected)
+        self.assertEqual(db.get_total_num_characters(), 8)
+        # The counters are rebuilt from the persisted index
+        self.assertEqual(BasicChunkDB(self.kb_id, self.storage_directory).get_stats(), expected)
+
+    def test__index_log(self):
+        db = BasicChunkDB(self.kb_id, self.storage_directory)
+        with mock.patch("dsrag.database.chunk.basic_db._atomic_pickle", wraps=basic_db._atomic_pickle) as atomic_pickle:
+            for i in range(50):
+                db.add_document(f"doc{i}", {0: {"chunk_text": f"Content {i}"}})
+            db.remove_document("doc0")
+        # Only the document files are written; the index changes are appended to the log
+        self.assertFalse(any(call.args[0] == db.data.index_path for call in atomic_pickle.call_args_list))
+        self.assertEqual(len(BasicChunkDB(self.kb_id, self.storage_directory).get_all_doc_ids()), 49)
+
+        # A record cut short by a crash is ignored, and later writes still load
+        with open(db.data.index_log_path, "ab") as f:
+            f.write(pickle.dumps([("doc100", {"supp_id": "", "num_chunks": 1, "num_characters": 1})])[:-5])
+        db = BasicChunkDB(self.kb_id, self.storage_directory)
+        db.add_document("doc101", {0: {"chunk_text": "Content 101"}})
+        doc_ids = BasicChunkDB(self.kb_id, self.storage_directory).get_all_doc_ids()
+        self.assertNotIn("doc100", doc_ids)
+        self.assertIn("doc101", doc_ids)
+        self.assertEqual(len(doc_ids), 50)
+
+    def test__add_after_delete(self):
+        db = BasicChunkDB(self.kb_id, self.storage_directory)
+        db.add_document("doc1", {0: {"chunk_text": "Content of chunk 1"}})
+        db.delete()
+        db.add_document("doc2", {0: {"chunk_text": "Content of chunk 2"}})
+        self.assertEqual(BasicChunkDB(self.kb_id, self.storage_directory).get_all_doc_ids(), ["doc2"])
+
+    def test__compression(self):
+        # A document stored before compression was enabled
+        BasicChunkDB(self.kb_id, self.storage_directory).add_document("plain", {0: {"chunk_text": "Plain text"}})
+        db = BasicChunkDB(self.kb_id, self.storage_directory, compression="zstd", compression_dictionary=True)
+        db.codec.num_training_samples = 100
+        db.add_document("early", {0: {"chunk_text": "Compressed without a dictionary"}})
+        for i in range(10):
+            db.add_document(f"doc{i}", {j: {"chunk_text": make_chunk_text(i * 10 + j)} for j in range(10)})
+        self.assertTrue(db.codec.has_dictionary)
+        self.assertIsInstance(db.data["doc9"][0]["chunk_text"], bytes)
+
+        db = BasicChunkDB.from_dict(db.to_dict())
+        self.assertTrue(db.codec.has_dictionary)
+        self.assertEqual(db.get_chunk_text("plain", 0), "Plain text")
+        self.assertEqual(db.get_chunk_text("early", 0), "Compressed without a dictionary")
+        self.assertEqual(db.get_chunk_text("doc9", 3), make_chunk_text(93))
+        self.assertEqual(db.get_chunks("doc0", 0, 2)[1]["chunk_text"], make_chunk_text(1))
+        self.assertTrue(db.get_document("doc0", include_content=True)["content"].startswith(make_chunk_text(0)))
+        # The statistics count the uncompressed text
+        self.assertEqual(
+            db.get_total_num_characters(),
+            len("Plain text") + len("Compressed without a dictionary") + sum(len(make_chunk_text(i)) for i in range(100)),
+        )
+
+    def test__compression_after_delete(self):
+        db = BasicChunkDB(self.kb_id, self.storage_directory, compression="zstd", compression_dictionary=True)
+        db.codec.num_training_samples = 100
+        for i in range(10):
+            db.add_document(f"doc{i}", {j: {"chunk_text": make_chunk_text(i * 10 + j)} for j in range(10)})
+        self.assertTrue(db.codec.has_dictionary)
+        db.delete()
+        db.add_document("late", {0: {"chunk_text": make_chunk_text(100)}})
+        db = BasicChunkDB.from_dict(db.to_dict())
+        self.assertEqual(db.get_chunk_text("late", 0), make_chunk_text(100))
+
+    def test__invalid_compression(self):
+        with self.assertRaises(ValueError):
+            BasicChunkDB(self.kb_id, self.storage_directory, compression="gzip")
+
+    def test__has_document(self):
+        db = BasicChunkDB(self.kb_id, self.storage_directory)
+        db.add_document("doc1", {0: {"chunk_text": "Content of chunk 1"}})
+        self.assertTrue(db.has_document("doc1"))
+        self.assertFalse(db.has_document("doc2"))
+        self.assertEqual(db.get_existing_doc_ids(["doc1", "doc2"]), {"doc1"})
+
     def test__persistence(self):
         db = BasicChunkDB(self.kb_id, self.storage_directory)
         doc_id = "doc1"
@@ -145,6 +301,70 @@ class TestChunkDB(unittest.TestCase):
         db2 = BasicChunkDB(self.kb_id, self.storage_directory)
         self.assertIn(doc_id, db2.data)
 
+    def test__lazy_loading(self):
+        db = BasicChunkDB(self.kb_id, self.storage_directory, max_cached_documents=2)
+        for i in range(5):
+            db.add_document(f"doc{i}", {0: {"chunk_text": f"Content of document {i}"}}, supp_id=f"supp{i % 2}")
+        self.assertLessEqual(len(db.data._cache), 2)
+
+        db2 = BasicChunkDB(self.kb_id, self.storage_directory, max_cached_documents=2)
+        # Nothing is read from disk until a document is accessed
+        self.assertEqual(len(db2.data._cache), 0)
+        self.assertEqual(db2.get_document_count(), 5)
+        self.assertEqual(db2.get_total_num_characters(), 5 * len("Content of document 0"))
+        self.assertEqual(sorted(db2.get_all_doc_ids("supp1")), ["doc1", "doc3"])
+        self.assertEqual(len(db2.data._cache), 0)
+
+        for i in range(5):
+            self.assertEqual(db2.get_chunk_text(f"doc{i}", 0), f"Content of document {i}")
+        self.assertEqual(list(db2.data._cache), ["doc3", "doc4"])
+
+        db2.remove_document("doc4")
+        self.assertEqual(BasicChunkDB(self.kb_id, self.storage_directory).get_document_count(), 4)
+
+    def test__legacy_storage_migration(self):
+        # Older versions pickled the whole KB to a single file
+        chunk_storage = os.path.join(os.path.expanduser(self.storage_directory), "chunk_storage")
+        os.makedirs(chunk_storage, exist_ok=True)
+        legacy_path = os.path.join(chunk_storage, f"{self.kb_id}.pkl")
+        with open(legacy_path, "wb") as f:
+            pickle.dump({"doc1": {0: {"chunk_text": "Content of chunk 1"}}}, f)
+
+        db = BasicChunkDB(self.kb_id, self.storage_directory)
+        self.assertEqual(db.get_chunk_text("doc1", 0), "Content of chunk 1")
+        self.assertFalse(os.path.exists(legacy_path))
+        self.assertEqual(BasicChunkDB(self.kb_id, self.storage_directory).get_all_doc_ids(), ["doc1"])
+
+    def test__document_fields_stored_once(self):
+        db = BasicChunkDB(self.kb_id, self.storage_directory)
+        chunks = {
+            0: {"chunk_text": "Content of chunk 1", "document_title": "Title", "document_summary": "Summary"},
+            1: {"chunk_text": "Content of chunk 2", "document_title": "Title", "document_summary": "Summary"},
+        }
+        db.add_document("doc1", chunks, metadata={"author": "Jane"})
+        with open(db.data._document_path("doc1"), "rb") as f:
+            stored = pickle.load(f)
+        self.assertEqual(stored["document"]["document_title"], "Title")
+        self.assertNotIn("document_title", stored["chunks"][1])
+
+        db = BasicChunkDB(self.kb_id, self.storage_directory)
+        self.assertEqual(db.get_document_title("doc1", 1), "Title")
+        self.assertEqual(db.get_chunks("doc1", 0, 2, ["document_summary"])[1], {"document_summary": "Summary"})
+        document = db.get_document("doc1")
+        self.assertEqual(document["title"], "Title")
+        self.assertEqual(document["metadata"], {"author": "Jane"})
+
+    def test__per_document_files_without_document_fields(self):
+        # Per-document files written before the document-level fields were split out only have the chunks
+        db = BasicChunkDB(self.kb_id, self.storage_directory)
+        db.add_document("doc1", {0: {"chunk_text": "Content of chunk 1"}})
+        with open(db.data._document_path("doc1"), "wb") as f:
+            pickle.dump({0: {"chunk_text": "Content of chunk 1", "document_title": "Title"}}, f)
+
+        db = BasicChunkDB(self.kb_id, self.storage_directory)
+        self.assertEqual(db.get_chunk_text("doc1", 0), "Content of chunk 1")
+        self.assertEqual(db.get_document_title("doc1", 0), "Title")
+
     def test__save_and_load_from_dict(self):
         db = BasicChunkDB(self.kb_id, self.storage_directory)
         config = db.to_dict()
@@ -164,11 +384,126 @@ class TestChunkDB(unittest.TestCase):
         self.assertFalse(os.path.exists(db.storage_path))
 
 
+class TestCachedChunkDB(unittest.TestCase):
+    def setUp(self):
+        self.storage_directory = "~/test__cached_chunk_db_dsRAG"
+        self.kb_id = "test_kb"
+        resolved_test_storage_directory = os.path.expanduser(self.storage_directory)
+        if os.path.exists(resolved_test_storage_directory):
+            shutil.rmtree(resolved_test_storage_directory)
+        self.inner = BasicChunkDB(self.kb_id, self.storage_directory)
+        self.inner.add_document(
+            "doc1",
+            {
+                i: {"chunk_text": f"Content of chunk {i}", "document_title": "Title", "chunk_page_start": i}
+                for i in range(5)
+            },
+        )
+        return super().setUp()
+
+    @classmethod
+    def tearDownClass(cls):
+        resolved_test_storage_directory = os.path.expanduser("~/test__cached_chunk_db_dsRAG")
+        if os.path.exists(resolved_test_storage_directory):
+            shutil.rmtree(resolved_test_storage_directory)
+        return super().tearDownClass()
+
+    def test__read_through(self):
+        db = CachedChunkDB(self.inner)
+        with mock.patch.object(self.inner, "get_chunks", wraps=self.inner.get_chunks) as get_chunks:
+            self.assertEqual(db.get_chunks("doc1", 0, 3, ["chunk_text"])[2], {"chunk_text": "Content of chunk 2"})
+            # All the fields of the chunks were cached by the first call
+            self.assertEqual(db.get_chunk_text("doc1", 1), "Content of chunk 1")
+            self.assertEqual(db.get_document_title("doc1", 0), "Title")
+            self.assertEqual(db.get_chunk_page_numbers("doc1", 2), (2, None))
+            # Only the chunks that aren't cached are fetched
+            self.assertEqual(list(db.get_chunks("doc1", 1, 5)), [1, 2, 3, 4])
+            self.assertEqual(get_chunks.call_count, 2)
+            self.assertEqual(get_chunks.call_args.args[1:3], (3, 5))
+            # Chunks that don't exist are cached too
+            self.assertEqual(db.get_chunks("doc1", 5, 7), {})
+            self.assertEqual(db.get_chunks("doc1", 5, 7), {})
+            self.assertEqual(get_chunks.call_count, 3)
+        stats = db.get_cache_stats()
+        self.assertEqual(stats["misses"], 7)
+        self.assertEqual(stats["num_entries"], 7)
+
+    def test__returns_copies(self):
+        db = CachedChunkDB(self.inner)
+        self.inner.add_document("doc2", {0: {"chunk_text": "Content"}}, metadata={"author": "A"})
+        for _ in range(2):
+            document = db.get_document("doc2")
+            document["title"] = "Changed"
+            document["metadata"]["author"] = "B"
+            db.get_chunks("doc1", 0, 1)[0]["chunk_text"] = "Changed"
+        self.assertEqual(db.get_document("doc2")["metadata"], {"author": "A"})
+        self.assertNotEqual(db.get_document("doc2")["title"], "Changed")
+        self.assertEqual(db.get_chunk_text("doc1", 0), "Content of chunk 0")
+
+    def test__get_segments(self):
+        db = CachedChunkDB(self.inner)
+        db.get_chunks("doc1", 0, 2)
+        with mock.patch.object(self.inner, "get_segments", wraps=self.inner.get_segments) as get_segments:
+            segments = db.get_segments([("doc1", 0, 2), ("doc1", 3, 5)], fields=["chunk_text"])
+            self.assertEqual(list(segments[0]), [0, 1])
+            self.assertEqual(segments[1][4], {"chunk_text": "Content of chunk 4"})
+            # Only the segment that wasn't cached is fetched
+            get_segments.assert_called_once()
+            self.assertEqual(get_segments.call_args.args[0], [("doc1", 3, 5)])
+
+    def test__invalidation(self):
+        db = CachedChunkDB(self.inner)
+        self.assertEqual(db.get_chunk_text("doc1", 0), "Content of chunk 0")
+        self.assertEqual(db.get_document("doc1")["title"], "Title")
+        db.add_document("doc1", {0: {"chunk_text": "New content", "document_title": "New title"}})
+        self.assertEqual(db.get_chunk_text("doc1", 0), "New content")
+        self.assertEqual(db.get_document("doc1")["title"], "New title")
+        db.remove_document("doc1")
+        self.assertIsNone(db.get_chunk_text("doc1", 0))
+        self.assertIsNone(db.get_document("doc1"))
+        self.assertFalse(db.has_document("doc1"))
+
+    def test__eviction(self):
+        db = CachedChunkDB(self.inner, max_bytes=2000)
+        db.get_chunks("doc1", 0, 5)
+        stats = db.get_cache_stats()
+        self.assertLessEqual(stats["num_bytes"], 2000)
+        self.assertGreater(stats["evictions"], 0)
+        # The most recently used chunks are kept
+        with mock.patch.object(self.inner, "get_chunks", wraps=self.inner.get_chunks) as get_chunks:
+            db.get_chunk_text("doc1", 4)
+            get_chunks.assert_not_called()
+
+    def test__ttl(self):
+        db = CachedChunkDB(self.inner, ttl=0.05)
+        db.get_chunk_text("doc1", 0)
+        time.sleep(0.1)
+        with mock.patch.object(self.inner, "get_chunks", wraps=self.inner.get_chunks) as get_chunks:
+            db.get_chunk_text("doc1", 0)
+            get_chunks.assert_called_once()
+
+    def test__save_and_load_from_dict(self):
+        db = CachedChunkDB(self.inner, max_bytes=1000000, ttl=60)
+        db2 = ChunkDB.from_dict(db.to_dict())
+        self.assertIsInstance(db2, CachedChunkDB)
+        self.assertIsInstance(db2.inner, BasicChunkDB)
+        self.assertEqual((db2.max_bytes, db2.ttl), (1000000, 60))
+        self.assertEqual(db2.get_chunk_text("doc1", 3), "Content of chunk 3")
+
+    def test__invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            CachedChunkDB(self.inner, max_bytes=0)
+        with self.assertRaises(ValueError):
+            CachedChunkDB(self.inner, ttl=0)
+
+
 class TestSQLiteDB(unittest.TestCase):
 
     def setUp(self):
         self.storage_directory = "~/test__sqlite_db_dsRAG"
         self.kb_id = "test_kb"
+        # Close the connections of databases from previous tests, which delete the WAL files when they're closed
+        gc.collect()
         resolved_test_storage_directory = os.path.expanduser(self.storage_directory)
         if os.path.exists(resolved_test_storage_directory):
             shutil.rmtree(resolved_test_storage_directory)
@@ -235,6 +570,55 @@ class TestSQLiteDB(unittest.TestCase):
         page_numbers = db.get_chunk_page_numbers(doc_id, 1)
         self.assertEqual(page_numbers, (None, None))
 
+    def test__add_documents(self):
+        db = SQLiteDB(self.kb_id, self.storage_directory)
+        documents = [
+            {
+                "doc_id": f"doc{i}",
+                "chunks": {j: {"chunk_text": f"Content of chunk {j} of document {i}"} for j in range(3)},
+                "supp_id": "supp1",
+            }
+            for i in range(4)
+        ]
+        db.add_documents(documents)
+        self.assertEqual(sorted(db.get_all_doc_ids()), ["doc0", "doc1", "doc2", "doc3"])
+        self.assertEqual(db.get_chunk_text("doc2", 1), "Content of chunk 1 of document 2")
+
+    def test__get_chunks(self):
+        db = SQLiteDB(self.kb_id, self.storage_directory)
+        doc_id = "doc1"
+        chunks = {
+            i: {
+                "chunk_text": f"Content of chunk {i}",
+                "document_title": "Title of document 1",
+                "document_summary": "Summary of document 1",
+                "chunk_page_start": i + 1,
+                "chunk_page_end": i + 2,
+                "is_visual": i == 2,
+            }
+            for i in range(5)
+        }
+        db.add_document(doc_id, chunks)
+        db.add_document("doc2", {0: {"chunk_text": "Content of another document"}})
+
+        retrieved_chunks = db.get_chunks(doc_id, 1, 4, fields=["chunk_text", "chunk_page_start", "is_visual"])
+        self.assertEqual(sorted(retrieved_chunks), [1, 2, 3])
+        self.assertEqual(retrieved_chunks[1]["chunk_text"], "Content of chunk 1")
+        self.assertEqual(retrieved_chunks[3]["chunk_page_start"], 4)
+        self.assertTrue(retrieved_chunks[2]["is_visual"])
+        self.assertFalse(retrieved_chunks[1]["is_visual"])
+        self.assertEqual(set(retrieved_chunks[1]), {"chunk_text", "chunk_page_start", "is_visual"})
+
+        # All fields are returned by default, and chunks past the end of the document are left out
+        retrieved_chunks = db.get_chunks(doc_id, 3, 10)
+        self.assertEqual(sorted(retrieved_chunks), [3, 4])
+        self.assertEqual(retrieved_chunks[4]["document_title"], "Title of document 1")
+        self.assertFalse(retrieved_chunks[4]["section_title"])
+        self.assertEqual(db.get_chunks("missing_doc", 0, 5), {})
+
+        with self.assertRaises(ValueError):
+            db.get_chunks(doc_id, 0, 5, fields=["chunk_text; DROP TABLE documents"])
+
     def test__get_document_title(self):
         db = SQLiteDB(self.kb_id, self.storage_directory)
         doc_id = "doc1"
@@ -309,6 +693,153 @@ class TestSQLiteDB(unittest.TestCase):
         # Make sure the document does not exist, it should just be None
         self.assertIsNone(results)
 
+    def test__get_stats(self):
+        db = SQLiteDB(self.kb_id, self.storage_directory)
+        db.add_documents([
+            {"doc_id": "doc1", "chunks": {0: {"chunk_text": "abc"}, 1: {"chunk_text": "de"}}, "supp_id": "a"},
+            {"doc_id": "doc2", "chunks": {0: {"chunk_text": "f"}}, "supp_id": "a"},
+        ])
+        db.add_document("doc3", {0: {"chunk_text": "gh"}})
+        # Replacing a document doesn't count it twice
+        db.add_document("doc3", {0: {"chunk_text": "ghi"}}, supp_id="b")
+        db.remove_document("doc2")
+        db.remove_document("missing")
+        expected = {"num_documents": 2, "num_chunks": 3, "num_characters": 8, "supp_id_counts": {"a": 1, "b": 1}}
+        self.assertEqual(db.get_stats(), expected)
+        self.assertEqual(db.get_document_count(), 2)
+        self.assertEqual(db.get_total_num_characters(), 8)
+        self.assertEqual(SQLiteDB(self.kb_id, self.storage_directory).get_stats(), expected)
+
+    def test__thread_connections_closed_when_threads_exit(self):
+        db = SQLiteDB(self.kb_id, self.storage_directory)
+        db.add_document("doc1", {0: {"chunk_text": "Content of chunk 1"}})
+        num_fds = len(os.listdir("/proc/self/fd")) if os.path.exists("/proc/self/fd") else None
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(db.has_document("doc1"))) for _ in range(100)]
+        for thread in threads:
+            thread.start()
+            thread.join()
+        gc.collect()
+        self.assertEqual(results, [True] * 100)
+        # Only the main thread's connection is left
+        self.assertEqual(len(db._connections), 1)
+        if num_fds is not None:
+            self.assertLessEqual(len(os.listdir("/proc/self/fd")), num_fds + 2)
+
+    def test__compression(self):
+        SQLiteDB(self.kb_id, self.storage_directory).add_document("plain", {0: {"chunk_text": "Plain text"}})
+        db = SQLiteDB(self.kb_id, self.storage_directory, compression="zstd", compression_dictionary=True)
+        db.codec.num_training_samples = 100
+        db.add_document("early", {0: {"chunk_text": "Compressed without a dictionary"}})
+        db.add_documents([
+            {"doc_id": f"doc{i}", "chunks": {j: {"chunk_text": make_chunk_text(i * 10 + j)} for j in range(10)}}
+            for i in range(10)
+        ])
+        db.add_document("late", {0: {"chunk_text": make_chunk_text(100)}})
+        self.assertTrue(db.codec.has_dictionary)
+
+        db = SQLiteDB.from_dict(db.to_dict())
+        self.assertEqual(db.get_chunk_text("plain", 0), "Plain text")
+        self.assertEqual(db.get_chunk_text("early", 0), "Compressed without a dictionary")
+        self.assertEqual(db.get_chunk_text("late", 0), make_chunk_text(100))
+        self.assertEqual(db.get_segments([("doc9", 2, 4)])[0][3]["chunk_text"], make_chunk_text(93))
+        self.assertTrue(db.get_document("doc0", include_content=True)["content"].startswith(make_chunk_text(0)))
+        with db.get_connection() as conn:
+            stored = conn.execute("SELECT chunk_text, chunk_length FROM documents WHERE doc_id='late'").fetchone()
+        self.assertIsInstance(stored[0], bytes)
+        self.assertEqual(stored[1], len(make_chunk_text(100)))
+
+    def test__has_document(self):
+        db = SQLiteDB(self.kb_id, self.storage_directory)
+        db.add_documents([
+            {"doc_id": f"doc{i}", "chunks": {0: {"chunk_text": f"Content of doc {i}"}}}
+            for i in range(600)
+        ])
+        self.assertTrue(db.has_document("doc1"))
+        self.assertFalse(db.has_document("missing"))
+        # More doc_ids than fit in one query
+        doc_ids = [f"doc{i}" for i in range(0, 1200, 2)]
+        self.assertEqual(db.get_existing_doc_ids(doc_ids), {f"doc{i}" for i in range(0, 600, 2)})
+        self.assertEqual(db.get_existing_doc_ids([]), set())
+
+    def test__schema_migration(self):
+        # Create a database the way older versions did: no indexes, and duplicate chunks were allowed
+        db_path = os.path.join(os.path.expanduser(self.storage_directory), "chunk_storage")
+        os.makedirs(db_path, exist_ok=True)
+        conn = sqlite3.connect(os.path.join(db_path, f"{self.kb_id}.db"))
+        conn.execute(
+            "CREATE TABLE documents (doc_id TEXT, document_title TEXT, chunk_text TEXT, chunk_index INT, supp_id TEXT)"
+        )
+        conn.executemany(
+            "INSERT INTO documents (doc_id, document_title, chunk_text, chunk_index, supp_id) VALUES (?, ?, ?, ?, ?)",
+            [
+                ("doc1", "Title 1", "Old content", 0, "supp1"),
+                ("doc1", "Title 1", "New content", 0, "supp1"),
+                ("doc1", "Title 1", "Content of chunk 2", 1, "supp1"),
+            ],
+        )
+        conn.commit()
+        conn.close()
+
+        db = SQLiteDB(self.kb_id, self.storage_directory)
+        self.assertEqual(db.get_chunk_text("doc1", 0), "New content")
+        self.assertEqual(db.get_chunk_text("doc1", 1), "Content of chunk 2")
+        # Document-level fields are moved out of the chunks
+        self.assertEqual(db.get_document_title("doc1", 1), "Title 1")
+        self.assertEqual(db.get_all_doc_ids("supp1"), ["doc1"])
+        self.assertEqual(db.get_document("doc1")["chunk_count"], 2)
+        # The counters are filled in for existing documents
+        self.assertEqual(
+            db.get_stats(),
+            {"num_documents": 1, "num_chunks": 2, "num_characters": 29, "supp_id_counts": {"supp1": 1}},
+        )
+        with db.get_connection() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(document_title) FROM documents").fetchone()[0], 0)
+            self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+            query_plan = conn.execute(
+                "EXPLAIN QUERY PLAN SELECT chunk_text FROM documents WHERE doc_id=? AND chunk_index=?", ("doc1", 0)
+            ).fetchall()
+            self.assertIn("documents_doc_id_chunk_index", str(query_plan))
+            query_plan = conn.execute(
+                "EXPLAIN QUERY PLAN SELECT DISTINCT doc_id FROM documents WHERE supp_id=?", ("",)
+            ).fetchall()
+            self.assertIn("documents_supp_id", str(query_plan))
+
+    def test__quotes_in_doc_id(self):
+        db = SQLiteDB(self.kb_id, self.storage_directory)
+        doc_id = "O'Reilly's doc"
+        db.add_document(doc_id, {0: {"chunk_text": "Content of chunk 1"}}, supp_id="it's")
+        self.assertEqual(db.get_chunk_text(doc_id, 0), "Content of chunk 1")
+        self.assertEqual(db.get_document(doc_id)["id"], doc_id)
+        self.assertEqual(db.get_all_doc_ids("it's"), [doc_id])
+
+    def test__concurrent_threads(self):
+        db = SQLiteDB(self.kb_id, self.storage_directory)
+        db.add_document("doc1", {i: {"chunk_text": f"Content of chunk {i}"} for i in range(10)})
+        errors = []
+
+        def read():
+            try:
+                for i in range(10):
+                    self.assertEqual(db.get_chunk_text("doc1", i), f"Content of chunk {i}")
+            except Exception as e:
+                errors.append(e)
+
+        def write(thread_index):
+            try:
+                db.add_document(f"doc_{thread_index}", {0: {"chunk_text": "Content"}})
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=read) for _ in range(4)]
+        threads += [threading.Thread(target=write, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(db.get_document_count(), 5)
+
     def test__save_and_load_from_dict(self):
         db = SQLiteDB(self.kb_id, self.storage_directory)
         config = db.to_dict()
@@ -327,22 +858,31 @@ class TestSQLiteDB(unittest.TestCase):
         # Make sure the storage directory does not exist
         self.assertFalse(os.path.exists(os.path.join(db.db_path, f"{self.kb_id}.db")))
 
+@unittest.skipIf(mock_aws is None, "moto is not installed")
 class TestDynamoDB(unittest.TestCase):
 
     @classmethod
     def setUpClass(self):
+        # Fake credentials, so nothing can reach a real AWS account
+        self.environ = mock.patch.dict(os.environ, {
+            "AWS_REGION": "us-east-1",
+            "AWS_DYNAMO_ACCESS_KEY": "testing",
+            "AWS_DYNAMO_SECRET_KEY": "testing",
+        })
+        self.environ.start()
+        self.aws = mock_aws()
+        self.aws.start()
         self.table_name = "test_dynamo_db_chunks"
         self.kb_id = "test_dynamo_db"
         self.db = DynamoDB(
             self.kb_id
         )
-        #return super().setUp()
 
     @classmethod
     def tearDownClass(self):
-        resp = self.db.delete()
-        print ("resp", resp)
-        #return super().tearDownClass()
+        self.db.delete()
+        self.aws.stop()
+        self.environ.stop()
 
     def test__add_and_get_chunk_text(self):
         doc_id = "doc1"
@@ -464,6 +1004,100 @@ class TestDynamoDB(unittest.TestCase):
         # Make sure the document does not exist, it should just be None
         self.assertIsNone(results)
 
+    def test__add_documents_and_get_segments(self):
+        self.db.add_documents([
+            {"doc_id": f"segments_doc{i}", "chunks": {j: {"chunk_text": f"Doc {i} chunk {j}"} for j in range(30)}}
+            for i in range(3)
+        ])
+        segments = self.db.get_segments(
+            [("segments_doc0", 0, 3), ("segments_doc2", 28, 35), ("missing", 0, 2)], fields=["chunk_text"]
+        )
+        self.assertEqual(segments[0][2], {"chunk_text": "Doc 0 chunk 2"})
+        self.assertEqual(list(segments[1]), [28, 29])
+        self.assertEqual(segments[2], {})
+        for i in range(3):
+            self.db.remove_document(f"segments_doc{i}")
+
+    def test__get_stats(self):
+        before = self.db.get_stats()
+        self.db.add_document("stats_doc", {0: {"chunk_text": "abc"}, 1: {"chunk_text": "de"}}, supp_id="stats_supp")
+        after = self.db.get_stats()
+        self.assertEqual(after["num_documents"], before["num_documents"] + 1)
+        self.assertEqual(after["num_chunks"], before["num_chunks"] + 2)
+        self.assertEqual(after["num_characters"], before["num_characters"] + 5)
+        self.assertEqual(after["supp_id_counts"]["stats_supp"], 1)
+        self.db.remove_document("stats_doc")
+        self.assertEqual(self.db.get_stats(), before)
+
+    def test__stats_record_doc_id(self):
+        # The stats item is below the document record, where no document's items can be
+        stats_record = self.db._get_table().get_item(Key=STATS_RECORD_KEY)["Item"]
+        self.assertEqual(stats_record["chunk_index"], -2)
+        self.assertTrue(stats_record["initialized"])
+
+        # A document can have the same doc_id as the stats item without either one affecting the other
+        before = self.db.get_stats()
+        self.db.add_document("dsrag/stats", {0: {"chunk_text": "abc"}})
+        self.assertIn("dsrag/stats", self.db.get_all_doc_ids())
+        self.assertEqual(self.db.get_document("dsrag/stats")["chunk_count"], 1)
+        self.assertEqual(self.db.get_stats()["num_documents"], before["num_documents"] + 1)
+        self.db.remove_document("dsrag/stats")
+        self.assertFalse(self.db.has_document("dsrag/stats"))
+        self.assertEqual(self.db.get_stats(), before)
+
+    def test__remove_large_document(self):
+        # Removing a document that takes more than one page of query results removes every chunk
+        chunks = {i: {"chunk_text": f"Chunk {i}"} for i in range(250)}
+        before = self.db.get_stats()
+        self.db.add_document("large_doc", chunks)
+        self.assertEqual(self.db.get_stats()["num_chunks"], before["num_chunks"] + 250)
+        table = self.db._get_table()
+        query = table.query
+        # Pages of 100 items, rather than DynamoDB's 1 MB
+        with mock.patch.object(table, "query", side_effect=lambda **kwargs: query(Limit=100, **kwargs)) as paged_query:
+            self.db.remove_document("large_doc")
+        self.assertEqual(paged_query.call_count, 3)
+        self.assertFalse(self.db.has_document("large_doc"))
+        self.assertEqual(self.db.get_chunks("large_doc", 0, 250), {})
+        self.assertEqual(self.db.get_stats(), before)
+
+    def test__concurrent_reads_and_writes(self):
+        # Batch writes and segment queries run on the worker threads, each with its own boto3 resource
+        resources = {}
+        create_dynamo_client = self.db.create_dynamo_client
+
+        def record_resource():
+            resource = create_dynamo_client()
+            resources.setdefault(threading.get_ident(), set()).add(id(resource))
+            return resource
+
+        with mock.patch.object(self.db, "create_dynamo_client", side_effect=record_resource):
+            self.db.add_documents([
+                {"doc_id": f"concurrent_doc{i}", "chunks": {j: {"chunk_text": f"Doc {i} chunk {j}"} for j in range(40)}}
+                for i in range(10)
+            ])
+            segments = self.db.get_segments(
+                [(f"concurrent_doc{i}", i, i + 3) for i in range(10)], fields=["chunk_text"]
+            )
+        self.assertEqual(
+            segments,
+            [{j: {"chunk_text": f"Doc {i} chunk {j}"} for j in range(i, i + 3)} for i in range(10)],
+        )
+        self.assertIsNotNone(self.db._executor)
+        # More than one thread did the work, and each thread reused a single resource
+        self.assertGreater(len(resources), 1)
+        self.assertTrue(all(len(ids) == 1 for ids in resources.values()))
+        self.assertEqual(len(set.union(*resources.values())), len(resources))
+        for i in range(10):
+            self.db.remove_document(f"concurrent_doc{i}")
+
+    def test__has_document(self):
+        # The table is shared by the tests, so these doc_ids aren't used by any other test
+        self.db.add_document("has_doc1", {0: {"chunk_text": "Content of chunk 1"}})
+        self.assertTrue(self.db.has_document("has_doc1"))
+        self.assertFalse(self.db.has_document("has_doc2"))
+        self.assertEqual(self.db.get_existing_doc_ids(["has_doc1", "has_doc2"]), {"has_doc1"})
+
     def test__save_and_load_from_dict(self):
         db = DynamoDB(
             self.kb_id,
@@ -563,6 +1197,21 @@ class TestPostgresChunkDB(unittest.TestCase):
         # There should only be one document with the supp_id 'Supp ID 1'
         self.assertEqual(len(docs), 1)
 
+    def test__008_readd_document(self):
+        before = self.db.get_stats()
+        chunks = {0: {"chunk_text": "First"}, 1: {"chunk_text": "Second"}}
+        self.db.add_document("readd_doc", chunks)
+        self.db.add_document("readd_doc", {0: {"chunk_text": "Replaced"}, 1: {"chunk_text": "Second"}})
+        # The chunks are replaced rather than duplicated
+        self.assertEqual(
+            self.db.get_chunks("readd_doc", 0, 5, ["chunk_text"]),
+            {0: {"chunk_text": "Replaced"}, 1: {"chunk_text": "Second"}},
+        )
+        after = self.db.get_stats()
+        self.assertEqual(after["num_documents"], before["num_documents"] + 1)
+        self.assertEqual(after["num_chunks"], before["num_chunks"] + 2)
+        self.db.remove_document("readd_doc")
+
     def test__009_remove_document(self):
         self.db.remove_document(self.doc_id)
         results = self.db.get_document(self.doc_id)
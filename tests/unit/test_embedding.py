@@ -1,6 +1,14 @@
 import sys
 import os
+import json
+import shutil
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
 
@@ -8,8 +16,32 @@ from dsrag.embedding import (
     OpenAIEmbedding,
     CohereEmbedding,
     OllamaEmbedding,
+    CachedEmbedding,
+    HashingEmbedding,
     Embedding,
 )
+from dsrag.embedding_cache import EmbeddingCache, QueryEmbeddingCache
+from dsrag.add_document import get_embedding_batches, get_embeddings
+
+
+class CountingEmbedding(Embedding):
+    """Deterministic fake embedding model that records the texts it's asked to embed."""
+
+    def __init__(self, model: str = "counting", dimension: int = 4):
+        super().__init__(dimension)
+        self.model = model
+        self.calls = []
+
+    def get_embeddings(self, text, input_type=None):
+        texts = [text] if isinstance(text, str) else text
+        self.calls.append(list(texts))
+        embeddings = [[float(len(t)), float(sum(map(ord, t)) % 97), 1.0 if input_type == "query" else 0.0, 0.5] for t in texts]
+        return embeddings[0] if isinstance(text, str) else embeddings
+
+    def to_dict(self):
+        base_dict = super().to_dict()
+        base_dict.update({"model": self.model})
+        return base_dict
 
 
 class TestEmbedding(unittest.TestCase):
@@ -118,5 +150,270 @@ class TestEmbedding(unittest.TestCase):
         self.assertEqual(embedding_instance.dimension, 1024)
 
 
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for the Ollama server's show, pull and embed endpoints."""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((self.path, body))
+        if self.path == "/api/show" and body["model"] not in self.server.models:
+            self._respond(404, {"error": f"model '{body['model']}' not found"})
+        elif self.path == "/api/show":
+            self._respond(200, {"modelfile": "", "model_info": {}})
+        elif self.path == "/api/pull":
+            self.server.models.add(body["model"])
+            self._respond(200, {"status": "success"})
+        elif self.path == "/api/embed":
+            embeddings = [[float(len(text)), 1.0, 0.0] for text in body["input"]]
+            self._respond(200, {"model": body["model"], "embeddings": embeddings})
+        else:
+            self._respond(404, {"error": "not found"})
+
+    def _respond(self, status, data):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestOllamaEmbeddingBatching(unittest.TestCase):
+    def setUp(self):
+        import ollama
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllamaHandler)
+        self.server.requests = []
+        self.server.models = {"all-minilm"}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = ollama.Client(host=f"http://127.0.0.1:{self.server.server_address[1]}")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test__batched_embeddings(self):
+        embedding = OllamaEmbedding("all-minilm", client=self.client, batch_size=4, max_workers=2)
+        self.assertEqual([path for path, _ in self.server.requests], ["/api/show"])
+        texts = [f"text {i}" * (i + 1) for i in range(10)]
+        embeddings = embedding.get_embeddings(texts)
+        self.assertEqual([e[0] for e in embeddings], [float(len(text)) for text in texts])
+        embed_requests = [body for path, body in self.server.requests if path == "/api/embed"]
+        self.assertEqual(sorted(len(body["input"]) for body in embed_requests), [2, 4, 4])
+        self.assertEqual(embedding.get_embeddings("hello"), [5.0, 1.0, 0.0])
+
+    def test__pulls_missing_model(self):
+        embedding = OllamaEmbedding("nomic-embed-text", client=self.client)
+        self.assertEqual([path for path, _ in self.server.requests], ["/api/show", "/api/pull"])
+        self.assertEqual(embedding.to_dict()["batch_size"], 64)
+
+
+class TestHashingEmbedding(unittest.TestCase):
+    def test__get_embeddings(self):
+        embedding = HashingEmbedding(dimension=64)
+        embeddings = embedding.get_embeddings([
+            "Quarterly revenue grew by ten percent",
+            "Revenue grew ten percent this quarter",
+            "The cat sat on the mat",
+            "",
+        ])
+        self.assertEqual([len(e) for e in embeddings], [64] * 4)
+        vectors = np.array(embeddings[:3])
+        np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, rtol=1e-5)
+        self.assertGreater(vectors[0] @ vectors[1], vectors[0] @ vectors[2])
+        # Texts without any words embed to the zero vector
+        self.assertEqual(embeddings[3], [0.0] * 64)
+        self.assertEqual(len(embedding.get_embeddings("single text")), 64)
+
+    def test__deterministic_across_batches_and_threads(self):
+        texts = [f"document {i} about topic {i % 7}" for i in range(50)]
+        expected = HashingEmbedding(dimension=32).get_embeddings(texts)
+        batched = HashingEmbedding(dimension=32, batch_size=8, num_threads=3).get_embeddings(texts)
+        np.testing.assert_allclose(batched, expected, rtol=1e-6)
+
+    def test__from_dict(self):
+        embedding = HashingEmbedding(dimension=32, ngram_range=(1, 3), num_hashes=2)
+        config = json.loads(json.dumps(embedding.to_dict()))
+        loaded = Embedding.from_dict(config)
+        self.assertIsInstance(loaded, HashingEmbedding)
+        self.assertEqual(loaded.ngram_range, (1, 3))
+        np.testing.assert_allclose(loaded.get_embeddings(["some text"]), embedding.get_embeddings(["some text"]))
+
+    def test__invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            HashingEmbedding(num_threads=0)
+
+
+class TestCachedEmbedding(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.directory, "embedding_cache.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test__cache_hits(self):
+        inner = CountingEmbedding()
+        embedding = CachedEmbedding(inner, cache_path=self.cache_path)
+        first = embedding.get_embeddings(["a", "bb", "a"], input_type="document")
+        self.assertEqual(inner.calls, [["a", "bb"]])
+        self.assertEqual(first, inner.get_embeddings(["a", "bb", "a"], input_type="document"))
+        inner.calls = []
+
+        second = embedding.get_embeddings(["bb", "ccc"], input_type="document")
+        self.assertEqual(inner.calls, [["ccc"]])
+        self.assertEqual(second[0], first[1])
+        # Queries are cached separately from documents
+        embedding.get_embeddings("bb", input_type="query")
+        self.assertEqual(inner.calls, [["ccc"], ["bb"]])
+        self.assertEqual(embedding.get_cache_stats()["hits"], 1)
+        self.assertEqual(embedding.get_cache_stats()["misses"], 5)
+
+    def test__persistence_and_model_key(self):
+        CachedEmbedding(CountingEmbedding(), cache_path=self.cache_path).get_embeddings(["a"], input_type="document")
+        inner = CountingEmbedding()
+        CachedEmbedding(inner, cache_path=self.cache_path).get_embeddings(["a"], input_type="document")
+        self.assertEqual(inner.calls, [])
+        # Another model doesn't share the entries
+        other = CountingEmbedding(model="other")
+        CachedEmbedding(other, cache_path=self.cache_path).get_embeddings(["a"], input_type="document")
+        self.assertEqual(other.calls, [["a"]])
+
+    def test__model_key_covers_all_settings(self):
+        # Same class, model and dimension, but the settings change the embeddings
+        first = CachedEmbedding(HashingEmbedding(dimension=32), cache_path=self.cache_path)
+        second = CachedEmbedding(HashingEmbedding(dimension=32, ngram_range=(1, 3)), cache_path=self.cache_path)
+        self.assertNotEqual(first.model_key, second.model_key)
+        self.assertEqual(
+            first.model_key, CachedEmbedding(HashingEmbedding(dimension=32), cache_path=self.cache_path).model_key
+        )
+        # Settings that only change how the embeddings are computed share the entries
+        self.assertEqual(
+            first.model_key,
+            CachedEmbedding(HashingEmbedding(dimension=32, batch_size=8, num_threads=4), cache_path=self.cache_path).model_key,
+        )
+        first.get_embeddings(["some text"], input_type="document")
+        np.testing.assert_allclose(
+            second.get_embeddings(["some text"], input_type="document"),
+            HashingEmbedding(dimension=32, ngram_range=(1, 3)).get_embeddings(["some text"]),
+            rtol=1e-6,
+        )
+
+    def test__hits_and_misses_return_the_same_values(self):
+        inner = CountingEmbedding()
+        embedding = CachedEmbedding(inner, cache_path=self.cache_path)
+        # Values that aren't exactly representable as float32
+        with mock.patch.object(inner, "get_embeddings", return_value=[[1 / 3, 0.1, 0.2, 0.7]]):
+            miss = embedding.get_embeddings(["some text"], input_type="document")
+            hit = embedding.get_embeddings(["some text"], input_type="document")
+        self.assertEqual(embedding.get_cache_stats()["hits"], 1)
+        self.assertEqual(hit, miss)
+        np.testing.assert_allclose(hit, [[1 / 3, 0.1, 0.2, 0.7]], rtol=1e-6)
+
+    def test__eviction(self):
+        cache = EmbeddingCache(self.cache_path, max_bytes=16 * 10)
+        for i in range(20):
+            cache.put_many("model", "document", [f"text {i}"], [[float(i)] * 4])
+        self.assertLessEqual(cache.get_size(), 16 * 10)
+        # The oldest entries are evicted first
+        self.assertIsNone(cache.get_many("model", "document", ["text 0"])[0])
+        self.assertEqual(cache.get_many("model", "document", ["text 19"])[0], [19.0] * 4)
+
+    def test__from_dict(self):
+        embedding = CachedEmbedding(CountingEmbedding(dimension=8), cache_path=self.cache_path)
+        loaded = Embedding.from_dict(embedding.to_dict())
+        self.assertIsInstance(loaded, CachedEmbedding)
+        self.assertIsInstance(loaded.inner, CountingEmbedding)
+        self.assertEqual(loaded.dimension, 8)
+        self.assertEqual(loaded.cache_path, self.cache_path)
+
+    def test__invalid_dimension(self):
+        with self.assertRaises(ValueError):
+            CachedEmbedding(CountingEmbedding(dimension=8), cache_path=self.cache_path, dimension=16)
+
+
+class TestQueryEmbeddingCache(unittest.TestCase):
+    def test__repeated_queries_are_cached(self):
+        inner = CountingEmbedding()
+        cache = QueryEmbeddingCache(max_entries=10)
+        embed = lambda queries: inner.get_embeddings(queries, input_type="query")
+        first = cache.get_embeddings(["q1", "q2", "q1"], embed)
+        self.assertEqual(inner.calls, [["q1", "q2"]])
+        self.assertEqual(first[0], first[2])
+        second = cache.get_embeddings(["q2", "q3"], embed)
+        self.assertEqual(inner.calls, [["q1", "q2"], ["q3"]])
+        self.assertEqual(second[0], first[1])
+        self.assertEqual(cache.get_stats(), {"hits": 1, "misses": 4, "evictions": 0, "num_entries": 3})
+
+    def test__eviction_and_ttl(self):
+        inner = CountingEmbedding()
+        embed = lambda queries: inner.get_embeddings(queries, input_type="query")
+        cache = QueryEmbeddingCache(max_entries=2)
+        cache.get_embeddings(["q1"], embed)
+        cache.get_embeddings(["q2"], embed)
+        cache.get_embeddings(["q1"], embed)
+        # q2 is the least recently used
+        cache.get_embeddings(["q3"], embed)
+        self.assertEqual(cache.get_stats()["evictions"], 1)
+        inner.calls = []
+        cache.get_embeddings(["q1", "q2"], embed)
+        self.assertEqual(inner.calls, [["q2"]])
+
+        cache = QueryEmbeddingCache(ttl=0.01)
+        cache.get_embeddings(["q1"], embed)
+        time.sleep(0.02)
+        inner.calls = []
+        cache.get_embeddings(["q1"], embed)
+        self.assertEqual(inner.calls, [["q1"]])
+
+    def test__invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            QueryEmbeddingCache(max_entries=0)
+        with self.assertRaises(ValueError):
+            QueryEmbeddingCache(ttl=0)
+
+
+class TestBatchedEmbedding(unittest.TestCase):
+    def test__get_embedding_batches(self):
+        texts = ["a" * 30] * 5
+        # Each text is estimated at 11 tokens
+        self.assertEqual(get_embedding_batches(texts, max_batch_size=2), [(0, 2), (2, 4), (4, 5)])
+        self.assertEqual(get_embedding_batches(texts, max_batch_size=10, max_batch_tokens=25), [(0, 2), (2, 4), (4, 5)])
+        # A text over the token limit on its own still gets a batch
+        self.assertEqual(get_embedding_batches(["a" * 300, "b"], max_batch_size=10, max_batch_tokens=25), [(0, 1), (1, 2)])
+        self.assertEqual(get_embedding_batches([], max_batch_size=10), [])
+
+    def test__concurrent_batches_keep_order(self):
+        class SlowEmbedding(CountingEmbedding):
+            max_batch_size = 3
+            max_concurrent_batches = 4
+
+            def __init__(self):
+                super().__init__()
+                self.in_flight = 0
+                self.max_in_flight = 0
+                self.lock = threading.Lock()
+
+            def get_embeddings(self, text, input_type=None):
+                with self.lock:
+                    self.in_flight += 1
+                    self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                # Later batches finish first
+                time.sleep(0.05 if text[0] == "t0" else 0.01)
+                with self.lock:
+                    self.in_flight -= 1
+                return super().get_embeddings(text, input_type)
+
+        texts = [f"t{i}" for i in range(20)]
+        embedding_model = SlowEmbedding()
+        embeddings = get_embeddings(embedding_model, texts)
+        self.assertEqual(embeddings, CountingEmbedding().get_embeddings(texts, input_type="document"))
+        self.assertEqual(len(embedding_model.calls), 7)
+        self.assertGreater(embedding_model.max_in_flight, 1)
+        self.assertLessEqual(embedding_model.max_in_flight, 4)
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
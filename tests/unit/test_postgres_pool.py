@@ -0,0 +1,156 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from dsrag.database.postgres_pool import PostgresConnectionPool
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, statement, params=None):
+        self.connection.statements.append((statement, params))
+
+
+class FakeConnection:
+    """Records what the pool does with a connection, in place of a psycopg2 connection."""
+
+    def __init__(self):
+        self.closed = 0
+        self.commits = 0
+        self.rollbacks = 0
+        self.statements = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+class TestPostgresConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.connections = []
+
+        def connect():
+            conn = FakeConnection()
+            self.connections.append(conn)
+            return conn
+
+        self.connect = connect
+
+    def test__reuses_connections(self):
+        pool = PostgresConnectionPool(connect=self.connect)
+        for _ in range(5):
+            with pool.connection() as conn:
+                conn.cursor().execute("SELECT 1")
+        self.assertEqual(len(self.connections), 1)
+        self.assertEqual(self.connections[0].commits, 5)
+
+    def test__nested_checkouts_share_a_connection(self):
+        pool = PostgresConnectionPool(connect=self.connect)
+        with pool.connection() as outer:
+            with pool.connection() as inner:
+                self.assertIs(inner, outer)
+            # Only the outermost block commits
+            self.assertEqual(outer.commits, 0)
+        self.assertEqual(outer.commits, 1)
+
+    def test__rollback_on_error(self):
+        pool = PostgresConnectionPool(connect=self.connect)
+        with self.assertRaises(RuntimeError):
+            with pool.connection():
+                raise RuntimeError("query failed")
+        self.assertEqual(self.connections[0].rollbacks, 1)
+        self.assertEqual(self.connections[0].commits, 0)
+
+        # The connection is still usable afterwards
+        with pool.connection() as conn:
+            self.assertIs(conn, self.connections[0])
+
+    def test__closed_connections_are_replaced(self):
+        pool = PostgresConnectionPool(connect=self.connect)
+        with pool.connection() as conn:
+            pass
+        conn.close()
+        with pool.connection() as conn:
+            self.assertIs(conn, self.connections[1])
+
+    def test__max_connections(self):
+        pool = PostgresConnectionPool(min_connections=2, max_connections=2, connect=self.connect)
+        active = []
+        max_active = []
+        lock = threading.Lock()
+
+        def work():
+            with pool.connection():
+                with lock:
+                    active.append(1)
+                    max_active.append(len(active))
+                time.sleep(0.01)
+                with lock:
+                    active.pop()
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(max(max_active), 2)
+        self.assertLessEqual(len(self.connections), 2)
+
+    def test__prepared_statements(self):
+        pool = PostgresConnectionPool(connect=self.connect)
+        for _ in range(3):
+            with pool.connection() as conn:
+                pool.execute_prepared(conn.cursor(), "get_text", "SELECT text FROM t WHERE id=$1", ("a",))
+        statements = [statement for statement, _ in self.connections[0].statements]
+        self.assertEqual(statements.count("PREPARE get_text AS SELECT text FROM t WHERE id=$1"), 1)
+        self.assertEqual(statements.count("EXECUTE get_text (%s)"), 3)
+
+    def test__close(self):
+        pool = PostgresConnectionPool(connect=self.connect)
+        with pool.connection() as conn:
+            # Connections that are checked out when the pool is closed aren't reused
+            pool.close()
+        self.assertTrue(conn.closed)
+        with pool.connection() as conn:
+            pool.execute_prepared(conn.cursor(), "get_text", "SELECT 1", ())
+        self.assertEqual(len(self.connections), 2)
+        self.assertEqual(self.connections[1].statements[0][0], "PREPARE get_text AS SELECT 1")
+
+    def test__failed_setup_closes_connection(self):
+        def on_connect(conn):
+            raise RuntimeError("CREATE EXTENSION failed")
+
+        pool = PostgresConnectionPool(max_connections=1, connect=self.connect, on_connect=on_connect)
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                with pool.connection():
+                    pass
+        self.assertTrue(all(conn.closed for conn in self.connections))
+        # The failed connections don't count against max_connections
+        pool._on_connect = None
+        with pool.connection() as conn:
+            self.assertIs(conn, self.connections[2])
+
+    def test__invalid_sizes(self):
+        with self.assertRaises(ValueError):
+            PostgresConnectionPool(max_connections=0, connect=self.connect)
+        with self.assertRaises(ValueError):
+            PostgresConnectionPool(min_connections=5, max_connections=2, connect=self.connect)
+
+
+if __name__ == "__main__":
+    unittest.main()
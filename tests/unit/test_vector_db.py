@@ -26,11 +26,9 @@ class TestVectorDB(unittest.TestCase):
         return super().setUp()
 
     def tearDown(self):
-        storage_path = os.path.join(
-            self.storage_directory, "vector_storage", f"{self.kb_id}.pkl"
-        )
-        if os.path.exists(storage_path):
-            os.remove(storage_path)
+        # Also removes any persisted faiss indexes
+        BasicVectorDB(self.kb_id, self.storage_directory).delete()
+        BasicVectorDB(self.kb_id, self.storage_directory, storage_format="memmap").delete()
         return super().tearDown()
 
     def test__add_vectors_and_search(self):
@@ -59,6 +57,125 @@ class TestVectorDB(unittest.TestCase):
         self.assertEqual(results[0]["metadata"]["doc_id"], "1")
         self.assertGreaterEqual(results[0]["similarity"], 0.99)
 
+    def test__search_matches_brute_force_ranking(self):
+        db = BasicVectorDB(self.kb_id, self.storage_directory)
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(500, 16))
+        metadata: Sequence[ChunkMetadata] = [
+            {
+                "doc_id": str(i // 10),
+                "chunk_index": i % 10,
+                "chunk_header": "",
+                "chunk_text": f"Text{i}",
+            }
+            for i in range(len(vectors))
+        ]
+        db.add_vectors(list(vectors), metadata)
+
+        query_vector = rng.normal(size=16)
+        results = db.search(query_vector, top_k=20)
+
+        similarities = vectors @ query_vector / (
+            np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector)
+        )
+        expected = np.argsort(-similarities)[:20]
+        self.assertEqual(
+            [result["metadata"]["chunk_text"] for result in results],
+            [f"Text{i}" for i in expected],
+        )
+        np.testing.assert_allclose(
+            [result["similarity"] for result in results], similarities[expected], rtol=1e-5
+        )
+
+    def test__search_many_matches_search(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(500, 16))
+        metadata: Sequence[ChunkMetadata] = [
+            {
+                "doc_id": str(i // 10),
+                "chunk_index": i % 10,
+                "chunk_header": "",
+                "chunk_text": f"Text{i}",
+            }
+            for i in range(len(vectors))
+        ]
+        query_vectors = list(rng.normal(size=(5, 16)))
+        metadata_filters = [
+            None,
+            {"field": "chunk_index", "operator": "less_than", "value": 5},
+            {"field": "doc_id", "operator": "equals", "value": "3"},
+        ]
+        for use_faiss in [False, True]:
+            db = BasicVectorDB(self.kb_id, self.storage_directory, use_faiss=use_faiss)
+            db.add_vectors(list(vectors), metadata)
+            for metadata_filter in metadata_filters:
+                with self.subTest(use_faiss=use_faiss, metadata_filter=metadata_filter):
+                    batch_results = db.search_many(query_vectors, top_k=20, metadata_filter=metadata_filter)
+                    self.assertEqual(len(batch_results), len(query_vectors))
+                    for query_vector, results in zip(query_vectors, batch_results):
+                        expected = db.search(query_vector, top_k=20, metadata_filter=metadata_filter)
+                        self.assertEqual(
+                            [result["metadata"]["chunk_text"] for result in results],
+                            [result["metadata"]["chunk_text"] for result in expected],
+                        )
+                        np.testing.assert_allclose(
+                            [result["similarity"] for result in results],
+                            [result["similarity"] for result in expected],
+                            rtol=1e-5,
+                        )
+            db.delete()
+
+        self.assertEqual(db.search_many([], top_k=5), [])
+
+    def test__search_with_metadata_filter(self):
+        vectors = [
+            np.array([1, 0]),
+            np.array([1, 0.1]),
+            np.array([0, 1]),
+            np.array([1, 0.2]),
+        ]
+        metadata = [
+            {
+                "doc_id": str(i + 1),
+                "chunk_index": i,
+                "chunk_header": "Header",
+                "chunk_text": f"Text{i + 1}",
+                "year": 2020 + i,
+            }
+            for i in range(4)
+        ]
+        metadata[2].pop("year")
+        query_vector = np.array([1, 0])
+
+        for use_faiss in [False, True]:
+            with self.subTest(use_faiss=use_faiss):
+                db = BasicVectorDB(self.kb_id, self.storage_directory, use_faiss=use_faiss)
+                db.add_vectors(vectors, metadata)
+
+                def search_doc_ids(metadata_filter):
+                    results = db.search(query_vector, top_k=4, metadata_filter=metadata_filter)
+                    return [result["metadata"]["doc_id"] for result in results]
+
+                self.assertEqual(search_doc_ids({"field": "doc_id", "operator": "equals", "value": "1"}), ["1"])
+                self.assertEqual(search_doc_ids({"field": "doc_id", "operator": "in", "value": ["1", "4"]}), ["1", "4"])
+                self.assertEqual(search_doc_ids({"field": "doc_id", "operator": "not_in", "value": ["1", "4"]}), ["2", "3"])
+                self.assertEqual(search_doc_ids({"field": "year", "operator": "greater_than", "value": 2020}), ["2", "4"])
+                self.assertEqual(search_doc_ids({"field": "year", "operator": "less_than_equals", "value": 2021}), ["1", "2"])
+                # Rows without the field never match, not even negated operators
+                self.assertEqual(search_doc_ids({"field": "year", "operator": "not_equals", "value": 2020}), ["2", "4"])
+                # Mismatched types and unknown fields match nothing
+                self.assertEqual(search_doc_ids({"field": "year", "operator": "equals", "value": "2020"}), [])
+                self.assertEqual(search_doc_ids({"field": "missing", "operator": "equals", "value": "x"}), [])
+                with self.assertRaises(ValueError):
+                    search_doc_ids({"field": "doc_id", "operator": "like", "value": "1"})
+
+                # Cached columns are kept up to date as vectors are added and removed
+                db.add_vectors([np.array([1, 0])], [{**metadata[0], "doc_id": "5", "year": 2030}])
+                self.assertEqual(search_doc_ids({"field": "year", "operator": "greater_than", "value": 2023}), ["5"])
+                db.remove_document("5")
+                self.assertEqual(search_doc_ids({"field": "year", "operator": "greater_than", "value": 2023}), [])
+                db.delete()
+
     def test__remove_document(self):
         db = BasicVectorDB(self.kb_id, self.storage_directory)
         vectors = [np.array([1, 0]), np.array([0, 1])]
@@ -83,6 +200,7 @@ class TestVectorDB(unittest.TestCase):
         print(db.metadata)
         self.assertEqual(len(db.metadata), 1)
         self.assertEqual(db.metadata[0]["doc_id"], "2")
+        self.assertEqual(db.get_num_vectors(), 1)
 
     def test__empty_search(self):
         db = BasicVectorDB(self.kb_id, self.storage_directory)
@@ -189,6 +307,260 @@ class TestVectorDB(unittest.TestCase):
 
         self.assertEqual(faiss_results, non_faiss_results)
 
+    def test__faiss_index_is_persisted(self):
+        db = BasicVectorDB(self.kb_id, self.storage_directory, use_faiss=True)
+        vectors = [np.array([1, 0]), np.array([0, 1])]
+        metadata: Sequence[ChunkMetadata] = [
+            {
+                "doc_id": "1",
+                "chunk_index": 0,
+                "chunk_header": "Header1",
+                "chunk_text": "Text1",
+            },
+            {
+                "doc_id": "2",
+                "chunk_index": 0,
+                "chunk_header": "Header2",
+                "chunk_text": "Text2",
+            },
+        ]
+        db.add_vectors(vectors[:1], metadata[:1])
+        db.add_vectors(vectors[1:], metadata[1:])
+        index_path = db._get_faiss_index_path()
+        self.assertTrue(os.path.exists(index_path))
+
+        new_db = BasicVectorDB(self.kb_id, self.storage_directory, use_faiss=True)
+        results = new_db.search(np.array([0, 1]), top_k=1)
+        self.assertEqual(results[0]["metadata"]["doc_id"], "2")
+        self.assertEqual(new_db._faiss_index.ntotal, 2)
+
+        # Removing a document invalidates the index, which is rebuilt on the next search
+        new_db.remove_document("1")
+        results = new_db.search(np.array([1, 0]), top_k=2)
+        self.assertEqual([result["metadata"]["doc_id"] for result in results], ["2"])
+
+        new_db.delete()
+        self.assertFalse(os.path.exists(index_path))
+
+    def test__faiss_index_types(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(300, 16))
+        metadata: Sequence[ChunkMetadata] = [
+            {
+                "doc_id": str(i),
+                "chunk_index": 0,
+                "chunk_header": "",
+                "chunk_text": f"Text{i}",
+            }
+            for i in range(len(vectors))
+        ]
+        query_vector = vectors[7] + 0.01 * rng.normal(size=16)
+        exact_db = BasicVectorDB(self.kb_id, self.storage_directory)
+        exact_db.add_vectors(list(vectors), metadata)
+        exact_results = exact_db.search(query_vector, top_k=5)
+
+        for index_type in ["flat", "ivf", "hnsw"]:
+            with self.subTest(index_type=index_type):
+                db = BasicVectorDB(
+                    f"{self.kb_id}_{index_type}",
+                    self.storage_directory,
+                    use_faiss=True,
+                    faiss_index_type=index_type,
+                    faiss_nlist=4,
+                    faiss_nprobe=4,
+                )
+                db.add_vectors(list(vectors), metadata)
+                results = db.search(query_vector, top_k=5)
+                db.delete()
+                self.assertEqual(results[0]["metadata"]["doc_id"], "7")
+                self.assertEqual(
+                    [result["metadata"]["doc_id"] for result in results],
+                    [result["metadata"]["doc_id"] for result in exact_results],
+                )
+                np.testing.assert_allclose(
+                    [result["similarity"] for result in results],
+                    [result["similarity"] for result in exact_results],
+                    rtol=1e-5,
+                )
+
+    def test__faiss_ivf_retrained_as_kb_grows(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(2000, 16))
+        metadata: Sequence[ChunkMetadata] = [
+            {"doc_id": str(i // 5), "chunk_index": i % 5, "chunk_header": "", "chunk_text": f"Text{i}"}
+            for i in range(len(vectors))
+        ]
+        db = BasicVectorDB(
+            self.kb_id, self.storage_directory, use_faiss=True, faiss_index_type="ivf", faiss_nlist=32, faiss_nprobe=32
+        )
+        # The first document is too small to train more than one cluster on
+        db.add_vectors(list(vectors[:5]), metadata[:5])
+        db.search(vectors[0], top_k=1)
+        self.assertEqual(db._faiss_index.nlist, 1)
+
+        db.add_vectors(list(vectors[5:]), metadata[5:])
+        query_vector = vectors[1234] + 0.01 * rng.normal(size=16)
+        results = db.search(query_vector, top_k=5)
+        self.assertEqual(db._faiss_index.nlist, 32)
+        self.assertEqual(db._faiss_index.ntotal, 2000)
+        self.assertEqual(results[0]["metadata"]["chunk_text"], "Text1234")
+
+        # The retrained index is the one that's persisted
+        new_db = BasicVectorDB(
+            self.kb_id, self.storage_directory, use_faiss=True, faiss_index_type="ivf", faiss_nlist=32, faiss_nprobe=32
+        )
+        self.assertEqual(new_db.search(query_vector, top_k=5), results)
+        self.assertEqual(new_db._faiss_index.nlist, 32)
+
+    def test__quantized_search(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(2000, 64))
+        metadata: Sequence[ChunkMetadata] = [
+            {
+                "doc_id": str(i // 10),
+                "chunk_index": i % 10,
+                "chunk_header": "",
+                "chunk_text": f"Text{i}",
+            }
+            for i in range(len(vectors))
+        ]
+        query_vectors = list(vectors[:10] + 0.5 * rng.normal(size=(10, 64)))
+        exact_db = BasicVectorDB(self.kb_id, self.storage_directory)
+        exact_db.add_vectors(list(vectors), metadata)
+        exact_results = exact_db.search_many(query_vectors, top_k=20)
+        exact_db.delete()
+
+        for storage_format in ["pickle", "memmap"]:
+            for quantization, oversample in [("int8", 4), ("binary", 25)]:
+                with self.subTest(storage_format=storage_format, quantization=quantization):
+                    db = BasicVectorDB(
+                        self.kb_id,
+                        self.storage_directory,
+                        storage_format=storage_format,
+                        quantization=quantization,
+                        rescore_oversample=oversample,
+                    )
+                    db.add_vectors(list(vectors[:1000]), metadata[:1000])
+                    db.add_vectors(list(vectors[1000:]), metadata[1000:])
+
+                    # The quantized vectors are persisted and reloaded with the config from to_dict
+                    db = BasicVectorDB.from_dict(db.to_dict())
+                    self.assertEqual(db.quantization, quantization)
+                    results = db.search_many(query_vectors, top_k=20)
+                    self.assertEqual(len(db._quantized_vectors), len(vectors))
+                    self.assertFalse(db._quantized_vectors_dirty)
+
+                    recall = np.mean([
+                        len({r["metadata"]["chunk_text"] for r in result}
+                            & {r["metadata"]["chunk_text"] for r in expected}) / 20
+                        for result, expected in zip(results, exact_results)
+                    ])
+                    self.assertGreaterEqual(recall, 0.9)
+                    # Shortlisted rows are rescored with the full-precision vectors
+                    for result, expected in zip(results, exact_results):
+                        self.assertEqual(result[0]["metadata"], expected[0]["metadata"])
+                        self.assertAlmostEqual(result[0]["similarity"], expected[0]["similarity"], places=5)
+
+                    metadata_filter = {"field": "chunk_index", "operator": "equals", "value": 0}
+                    results = db.search(query_vectors[0], top_k=5, metadata_filter=metadata_filter)
+                    self.assertTrue(all(r["metadata"]["chunk_index"] == 0 for r in results))
+                    db.remove_document("0")
+                    results = db.search(query_vectors[0], top_k=5)
+                    self.assertNotIn("0", [r["metadata"]["doc_id"] for r in results])
+                    db.delete()
+
+        with self.assertRaises(ValueError):
+            BasicVectorDB(self.kb_id, self.storage_directory, quantization="pq")
+        with self.assertRaises(ValueError):
+            BasicVectorDB(self.kb_id, self.storage_directory, quantization="int8", use_faiss=True)
+
+    def test__truncated_search(self):
+        rng = np.random.default_rng(0)
+        # Like Matryoshka embeddings, most of the variance is in the leading dimensions
+        vectors = rng.normal(size=(2000, 128)) * np.exp(-np.arange(128) / 16)
+        metadata: Sequence[ChunkMetadata] = [
+            {"doc_id": str(i // 10), "chunk_index": i % 10, "chunk_header": "", "chunk_text": f"Text{i}"}
+            for i in range(len(vectors))
+        ]
+        query_vectors = list(vectors[:10] + 0.1 * rng.normal(size=(10, 128)))
+        exact_db = BasicVectorDB(self.kb_id, self.storage_directory)
+        exact_db.add_vectors(list(vectors), metadata)
+        exact_results = exact_db.search_many(query_vectors, top_k=20)
+        exact_db.delete()
+
+        for quantization in [None, "int8"]:
+            with self.subTest(quantization=quantization):
+                db = BasicVectorDB(
+                    self.kb_id, self.storage_directory, quantization=quantization, truncate_dimension=32
+                )
+                db.add_vectors(list(vectors), metadata)
+                db = BasicVectorDB.from_dict(db.to_dict())
+                self.assertEqual(db.truncate_dimension, 32)
+                results = db.search_many(query_vectors, top_k=20)
+                self.assertEqual(db._quantized_vectors.codes.shape, (2000, 32))
+
+                for result, expected in zip(results, exact_results):
+                    # Candidates from the truncated vectors are reranked with the full vectors
+                    self.assertGreaterEqual(
+                        len({r["metadata"]["chunk_text"] for r in result}
+                            & {r["metadata"]["chunk_text"] for r in expected}), 18
+                    )
+                    self.assertAlmostEqual(result[0]["similarity"], expected[0]["similarity"], places=5)
+                db.delete()
+
+    def test__ivf_search(self):
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(8, 32))
+        vectors = centers[np.arange(1024) % 8] + 0.3 * rng.normal(size=(1024, 32))
+        metadata: Sequence[ChunkMetadata] = [
+            {"doc_id": str(i // 8), "chunk_index": i % 8, "chunk_header": "", "chunk_text": f"Text{i}"}
+            for i in range(len(vectors))
+        ]
+        query_vectors = list(vectors[:5] + 0.1 * rng.normal(size=(5, 32)))
+        exact_db = BasicVectorDB(self.kb_id, self.storage_directory)
+        exact_db.add_vectors(list(vectors), metadata)
+        exact_results = exact_db.search_many(query_vectors, top_k=10)
+        exact_db.delete()
+
+        for storage_format in ["pickle", "memmap"]:
+            with self.subTest(storage_format=storage_format):
+                db = BasicVectorDB(
+                    self.kb_id, self.storage_directory, storage_format=storage_format, ivf_nlist=8, ivf_nprobe=2
+                )
+                # Too few rows to cluster yet, so the first searches are exact
+                db.add_vectors(list(vectors[:32]), metadata[:32])
+                self.assertIsNone(db._get_ivf_index())
+                db.add_vectors(list(vectors[32:512]), metadata[32:512])
+                self.assertEqual(db._ivf_index.trained_rows, 512)
+                # New rows are assigned to the existing clusters until the KB doubles in size
+                db.add_vectors(list(vectors[512:1000]), metadata[512:1000])
+                self.assertEqual(db._ivf_index.trained_rows, 512)
+                self.assertEqual(len(db._ivf_index), 1000)
+                db.add_vectors(list(vectors[1000:]), metadata[1000:])
+                self.assertEqual(db._ivf_index.trained_rows, 1024)
+
+                db = BasicVectorDB.from_dict(db.to_dict())
+                self.assertEqual((db.ivf_nlist, db.ivf_nprobe), (8, 2))
+                results = db.search_many(query_vectors, top_k=10)
+                self.assertFalse(db._ivf_index_dirty)
+                self.assertEqual(db._ivf_index.nlist, 8)
+                for result, expected in zip(results, exact_results):
+                    self.assertEqual(
+                        [r["metadata"]["chunk_text"] for r in result],
+                        [r["metadata"]["chunk_text"] for r in expected],
+                    )
+
+                # Filters and removed documents are applied to the probed rows
+                metadata_filter = {"field": "chunk_index", "operator": "equals", "value": 0}
+                results = db.search(query_vectors[1], top_k=10, metadata_filter=metadata_filter)
+                self.assertEqual(len(results), 10)
+                self.assertTrue(all(r["metadata"]["chunk_index"] == 0 for r in results))
+                db.remove_document("0")
+                results = db.search(query_vectors[0], top_k=10)
+                self.assertNotIn("0", [r["metadata"]["doc_id"] for r in results])
+                self.assertEqual(len(results), 10)
+                db.delete()
+
     def test__delete(self):
         db = BasicVectorDB(self.kb_id, self.storage_directory, use_faiss=True)
         vectors = [np.array([1, 0]), np.array([0, 1])]
@@ -245,6 +617,226 @@ class TestVectorDB(unittest.TestCase):
         self.assertEqual(len(results), 2)
 
 
+class TestBasicVectorDBMemmap(unittest.TestCase):
+    def setUp(self):
+        self.storage_directory = "~/test__vector_db_dsRAG"
+        self.kb_id = "test_memmap_db"
+        self.metadata: Sequence[ChunkMetadata] = [
+            {
+                "doc_id": "1",
+                "chunk_index": 0,
+                "chunk_header": "Header1",
+                "chunk_text": "Text1",
+            },
+            {
+                "doc_id": "2",
+                "chunk_index": 0,
+                "chunk_header": "Header2",
+                "chunk_text": "Text2",
+            },
+            {
+                "doc_id": "2",
+                "chunk_index": 1,
+                "chunk_header": "Header2",
+                "chunk_text": "Text3",
+            },
+        ]
+        self.vectors = [np.array([1, 0]), np.array([0, 1]), np.array([1, 1])]
+        return super().setUp()
+
+    def tearDown(self):
+        BasicVectorDB(self.kb_id, self.storage_directory, storage_format="memmap").delete()
+        return super().tearDown()
+
+    def test__add_vectors_and_search(self):
+        db = BasicVectorDB(self.kb_id, self.storage_directory, storage_format="memmap")
+        db.add_vectors(self.vectors, self.metadata)
+        results = db.search(np.array([1, 0]), top_k=2)
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0]["metadata"]["doc_id"], "1")
+        self.assertAlmostEqual(results[0]["similarity"], 1.0, places=5)
+        self.assertEqual(results[1]["metadata"]["chunk_text"], "Text3")
+        self.assertAlmostEqual(results[1]["similarity"], np.sqrt(0.5), places=5)
+
+    def test__vectors_are_memory_mapped_on_load(self):
+        db = BasicVectorDB(self.kb_id, self.storage_directory, storage_format="memmap")
+        db.add_vectors(self.vectors, self.metadata)
+
+        new_db = BasicVectorDB(self.kb_id, self.storage_directory, storage_format="memmap")
+        vectors = new_db.storage.segments[0][1]
+        self.assertIsInstance(vectors, np.memmap)
+        self.assertEqual(vectors.dtype, np.float32)
+        self.assertEqual(len(new_db.metadata), 3)
+        self.assertEqual(new_db.metadata[2]["chunk_text"], "Text3")
+
+    def test__remove_document(self):
+        db = BasicVectorDB(self.kb_id, self.storage_directory, storage_format="memmap")
+        db.add_vectors(self.vectors, self.metadata)
+        db.remove_document("1")
+
+        self.assertEqual(len(db.metadata), 2)
+        self.assertEqual([item["doc_id"] for item in db.metadata], ["2", "2"])
+        results = db.search(np.array([1, 0]), top_k=1)
+        self.assertEqual(results[0]["metadata"]["chunk_text"], "Text3")
+
+    def test__compression(self):
+        db = BasicVectorDB(self.kb_id, self.storage_directory, storage_format="memmap", compression="zstd")
+        db.add_vectors(self.vectors, self.metadata)
+        self.assertNotIn("chunk_text", db.metadata[0])
+
+        new_db = BasicVectorDB(self.kb_id, self.storage_directory, storage_format="memmap")
+        results = new_db.search(np.array([1, 0]), top_k=2)
+        self.assertEqual(results[0]["metadata"]["chunk_text"], "Text1")
+        self.assertEqual(results[1]["metadata"]["chunk_text"], "Text3")
+        self.assertEqual(results[1]["metadata"]["chunk_header"], "Header2")
+
+    def test__compression_dictionary_after_removing_everything(self):
+        words = ["revenue", "quarter", "fiscal", "growth", "margin", "segment", "operating", "income", "net", "sales"]
+        texts = [" ".join(words[(i * 7 + j * j) % len(words)] for j in range(150)) for i in range(100)]
+        db = BasicVectorDB(
+            self.kb_id, self.storage_directory, storage_format="memmap", compression="zstd", compression_dictionary=True
+        )
+        db.codec.num_training_samples = 100
+        db.add_vectors(
+            [np.array([1, i]) for i in range(100)],
+            [{"doc_id": "1", "chunk_index": i, "chunk_text": text} for i, text in enumerate(texts)],
+        )
+        self.assertTrue(db.codec.has_dictionary)
+
+        # Removing every row deletes the storage directory, but the dictionary is still in use
+        db.remove_document("1")
+        db.add_vectors(self.vectors, self.metadata)
+        new_db = BasicVectorDB(self.kb_id, self.storage_directory, storage_format="memmap", compression="zstd")
+        results = new_db.search(np.array([1, 0]), top_k=2)
+        self.assertEqual(results[0]["metadata"]["chunk_text"], "Text1")
+        self.assertEqual(results[1]["metadata"]["chunk_text"], "Text3")
+
+    def test__remove_document_writes_tombstone(self):
+        db = BasicVectorDB(self.kb_id, self.storage_directory, storage_format="memmap")
+        db.add_vectors(self.vectors[:1], self.metadata[:1])
+        db.add_vectors(self.vectors[1:], self.metadata[1:])
+        self.assertEqual(len(db.storage.segments), 2)
+
+        db.remove_document("1")
+        # The rows are still on disk until the storage is compacted
+        self.assertEqual(db.storage.num_rows, 3)
+        self.assertEqual(len(db.metadata), 2)
+
+        # Tombstones survive a reload
+        new_db = BasicVectorDB(self.kb_id, self.storage_directory, storage_format="memmap")
+        self.assertEqual(len(new_db.metadata), 2)
+        results = new_db.search(np.array([1, 0]), top_k=3)
+        self.assertEqual([result["metadata"]["chunk_text"] for result in results], ["Text3", "Text2"])
+
+    def test__compact(self):
+        db = BasicVectorDB(self.kb_id, self.storage_directory, storage_format="memmap")
+        for vector, item in zip(self.vectors, self.metadata):
+            db.add_vectors([vector], [item])
+        db.remove_document("1")
+        self.assertEqual(len(db.storage.segments), 3)
+
+        db.compact()
+        self.assertEqual(len(db.storage.segments), 1)
+        self.assertEqual(db.storage.num_rows, 2)
+        self.assertIsNone(db.storage.live_mask)
+        self.assertEqual([item["chunk_text"] for item in db.metadata], ["Text2", "Text3"])
+
+        # Documents added after compaction get fresh row numbers and can still be removed
+        db.add_vectors(self.vectors[:1], self.metadata[:1])
+        db.remove_document("2")
+        results = db.search(np.array([1, 0]), top_k=3)
+        self.assertEqual([result["metadata"]["doc_id"] for result in results], ["1"])
+
+    def test__search_with_metadata_filter(self):
+        db = BasicVectorDB(self.kb_id, self.storage_directory, storage_format="memmap")
+        db.add_vectors(self.vectors, self.metadata)
+        db.add_vectors([np.array([1, 0])], [{**self.metadata[0], "doc_id": "3", "is_visual": True}])
+        db.remove_document("1")
+
+        metadata_filter = {"field": "doc_id", "operator": "in", "value": ["1", "2"]}
+        results = db.search(np.array([1, 0]), top_k=3, metadata_filter=metadata_filter)
+        self.assertEqual([result["metadata"]["chunk_text"] for result in results], ["Text3", "Text2"])
+
+        metadata_filter = {"field": "is_visual", "operator": "equals", "value": True}
+        results = db.search(np.array([1, 0]), top_k=3, metadata_filter=metadata_filter)
+        self.assertEqual([result["metadata"]["doc_id"] for result in results], ["3"])
+
+    def test__search_many(self):
+        db = BasicVectorDB(self.kb_id, self.storage_directory, storage_format="memmap")
+        db.add_vectors(self.vectors, self.metadata)
+        db.remove_document("1")
+        results = db.search_many([np.array([1, 0]), np.array([0, 1])], top_k=3)
+        self.assertEqual(
+            [[result["metadata"]["chunk_text"] for result in query_results] for query_results in results],
+            [["Text3", "Text2"], ["Text2", "Text3"]],
+        )
+
+    def test__faiss_search_skips_removed_rows(self):
+        db = BasicVectorDB(
+            self.kb_id, self.storage_directory, storage_format="memmap", use_faiss=True
+        )
+        db.add_vectors(self.vectors, self.metadata)
+        db.remove_document("1")
+        results = db.search(np.array([1, 0]), top_k=3)
+        self.assertEqual([result["metadata"]["chunk_text"] for result in results], ["Text3", "Text2"])
+
+        # Compaction renumbers the rows, so the index is rebuilt for the new generation
+        db.compact()
+        db.add_vectors(self.vectors[:1], self.metadata[:1])
+        results = db.search(np.array([1, 0]), top_k=1)
+        self.assertEqual(results[0]["metadata"]["doc_id"], "1")
+        self.assertEqual(db._faiss_index.ntotal, 3)
+
+    def test__indexes_after_removing_everything(self):
+        # Removing every row deletes the storage, and the indexes built on the old rows must not be reused
+        rng = np.random.default_rng(0)
+        for options in [{"use_faiss": True}, {"quantization": "int8"}, {"ivf_nlist": 4}]:
+            with self.subTest(**options):
+                db = BasicVectorDB(self.kb_id, self.storage_directory, storage_format="memmap", **options)
+                db.add_vectors([np.array([1, 0])], [{"doc_id": "old", "chunk_index": 0, "chunk_text": "Old"}])
+                db.search(np.array([1, 0]), top_k=1)
+                db.remove_document("old")
+                db.add_vectors(
+                    [np.array([0, 1]), np.array([-1, 0])],
+                    [{"doc_id": "new", "chunk_index": i, "chunk_text": f"New{i}"} for i in range(2)],
+                )
+                results = db.search(np.array([1, 0]), top_k=1)
+                self.assertEqual(results[0]["metadata"]["chunk_text"], "New0")
+                self.assertAlmostEqual(results[0]["similarity"], 0.0, places=5)
+
+                # And against brute force on random data, after another round of removing everything
+                db.remove_document("new")
+                vectors = rng.normal(size=(300, 2))
+                db.add_vectors(
+                    list(vectors),
+                    [{"doc_id": str(i % 3), "chunk_index": i, "chunk_text": f"Text{i}"} for i in range(len(vectors))],
+                )
+                query_vector = rng.normal(size=2)
+                results = db.search(query_vector, top_k=5)
+                similarities = vectors @ query_vector / np.linalg.norm(vectors, axis=1) / np.linalg.norm(query_vector)
+                self.assertEqual(
+                    [result["metadata"]["chunk_index"] for result in results],
+                    list(np.argsort(-similarities)[:5]),
+                )
+                db.delete()
+
+    def test__save_and_load_from_dict(self):
+        db = BasicVectorDB(self.kb_id, self.storage_directory, storage_format="memmap")
+        config = db.to_dict()
+        self.assertEqual(config["storage_format"], "memmap")
+        vector_db_instance = VectorDB.from_dict(config)
+        self.assertIsInstance(vector_db_instance, BasicVectorDB)
+        self.assertEqual(vector_db_instance.storage_format, "memmap")
+
+    def test__delete(self):
+        db = BasicVectorDB(self.kb_id, self.storage_directory, storage_format="memmap")
+        db.add_vectors(self.vectors, self.metadata)
+        self.assertTrue(os.path.exists(db.vector_storage_path))
+        db.delete()
+        self.assertFalse(os.path.exists(db.vector_storage_path))
+
+
 @unittest.skipIf(os.environ.get('GITHUB_ACTIONS') == 'true', "ChromaDB is not available on GitHub Actions")
 class TestChromaDB(unittest.TestCase):
     def setUp(self):